@@ -0,0 +1,105 @@
+"""Cold start: process spawn -> ready -> first served tool call, with and without warm-up.
+
+Starts `python -m src` (one worker) against a local stub whose new connections
+cost `--handshake-ms` (standing in for DNS + TCP + TLS to Serper.dev). Like the
+load balancer, the client waits for the readiness endpoint, then immediately
+sends one `search` and one `fetch`. `/healthcheck` is the readiness signal with
+STARTUP_WARMUP=0 (the old behaviour), `/ready` with warm-up on.
+
+    python -m bench.bench_cold_start --rounds 5 --handshake-ms 150
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.harness import MCP_HEADERS, parse_mcp_response, rpc
+from bench.loadtest import REPO_ROOT, free_port
+from bench.stub_upstream import StubUpstream
+
+
+async def wait_for(client, url, process, deadline):
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.02)
+    raise RuntimeError(f"{url} not ready in time")
+
+
+async def timed_call(client, base_url, name, arguments):
+    started = time.perf_counter()
+    response = await client.post(
+        f"{base_url}/mcp?api_key=bench-key", json=rpc("tools/call", {"name": name, "arguments": arguments}), headers=MCP_HEADERS
+    )
+    message = parse_mcp_response(response)
+    if "error" in message or message["result"]["content"][0]["text"].startswith("Error"):
+        raise RuntimeError(f"{name} failed: {message}")
+    return time.perf_counter() - started
+
+
+async def one_round(stub, warmup):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "MCP_HOST": "127.0.0.1",
+        "MCP_PORT": str(port),
+        "MCP_WORKERS": "1",
+        "SERPER_BASE_URL": stub.base_url,
+        "JINA_BASE_URL": stub.base_url,
+        "SEARCH_CACHE_PATH": "",
+        "STARTUP_WARMUP": "1" if warmup else "0",
+    }
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src"], cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            await wait_for(client, f"{base_url}/healthcheck", process, started + 60)
+            listening = time.monotonic() - started
+            await wait_for(client, f"{base_url}/ready" if warmup else f"{base_url}/healthcheck", process, started + 60)
+            ready = time.monotonic() - started
+            search = await timed_call(client, base_url, "search", {"query": f"koude start {started}"})
+            fetch = await timed_call(client, base_url, "fetch", {"id": f"https://example.com/{started}"})
+            served = time.monotonic() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"listening": listening, "ready": ready, "first_search": search, "first_fetch": fetch, "first_served": served}
+
+
+async def run(args):
+    stub = StubUpstream(latency=args.latency_ms / 1000, handshake_delay=args.handshake_ms / 1000)
+    results = {}
+    async with stub:
+        for warmup in (False, True):
+            rounds = [await one_round(stub, warmup) for _ in range(args.rounds)]
+            results["warmup" if warmup else "no_warmup"] = {
+                key: round(statistics.median(r[key] for r in rounds) * 1000, 1) for key in rounds[0]
+            }
+    return {"unit": "ms (median)", "rounds": args.rounds, "handshake_ms": args.handshake_ms, **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--handshake-ms", type=float, default=150)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
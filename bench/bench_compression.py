@@ -0,0 +1,193 @@
+"""Benchmark: response bytes and added latency of gzip / brotli on /mcp.
+
+Tool calls are driven as raw ASGI requests against create_app(), so the bytes
+counted are exactly what would go on the wire. Each case runs without
+Accept-Encoding (identity) and with every encoding and COMPRESS_LEVEL preset:
+
+- search: one Serper.dev result in `full` mode, answered as SSE
+- search_many: `--queries` queries in one call
+- fetch: a markdown page of `--page-kb` KB via the r.jina.ai stub
+- search_and_fetch: k pages with a progressToken, so the SSE stream carries a
+  progress notification per page before the result
+
+For compressed streams the check decodes every body message on its own, as
+it arrives. Every message has to decode to whole SSE events; that is what
+keeps progress notifications live. The decoded tool results have to match
+the identity ones.
+
+    python -m bench.bench_compression --calls 20 --page-kb 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import zlib
+
+from bench.harness import asgi_request, asgi_scope, lifespan, point_upstreams_at, rpc
+from bench.stub_upstream import StubUpstream
+
+WORDS = (
+    "relais spoel contact spanning stroom schakelaar behuizing montage DIN-rail printplaat datasheet "
+    "levertijd voorraad prijs EAN fabrikant opvolger vervanger serie uitvoering wisselstroom gelijkstroom "
+    "isolatie temperatuur bereik levensduur mechanisch elektrisch aansluiting schroef veerklem"
+).split()
+
+
+def markdown_page(url, size, seed):
+    """Jina-style markdown with prose and a spec table; not one repeated line."""
+    rng = random.Random(seed)
+    parts = [f"Title: {url}\n\nURL Source: {url}\n\nMarkdown Content:\n# {url}\n\n"]
+    length = len(parts[0])
+    while length < size:
+        if rng.random() < 0.3:
+            rows = "".join(
+                f"| {rng.choice(WORDS)} | {rng.randint(1, 999)}{rng.choice(['V', 'A', 'mA', 'ms', '°C', 'mm'])} "
+                f"| {rng.choice(WORDS).upper()}-{rng.randint(1000, 99999)} |\n"
+                for _ in range(rng.randint(4, 12))
+            )
+            block = "| Eigenschap | Waarde | Artikel |\n|---|---|---|\n" + rows + "\n"
+        else:
+            block = " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 90))).capitalize() + ".\n\n"
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)
+
+
+class PageStub(StubUpstream):
+    async def respond(self, method, path, headers, body):
+        if path.startswith("/http"):
+            text = markdown_page(path[1:], self.page_size, seed=path)
+            return 200, {"content-type": "text/plain; charset=utf-8"}, text.encode()
+        return await super().respond(method, path, headers, body)
+
+
+def mcp_scope(accept_encoding):
+    headers = [(b"content-type", b"application/json"), (b"accept", b"application/json, text/event-stream")]
+    if accept_encoding:
+        headers.append((b"accept-encoding", accept_encoding.encode()))
+    return asgi_scope("POST", "/mcp", headers, b"api_key=bench-key")
+
+
+async def post(app, accept_encoding, payload):
+    """One request; returns (headers, body chunks, seconds to first chunk, seconds total)."""
+    _, headers, chunks, first, total = await asgi_request(app, mcp_scope(accept_encoding), json.dumps(payload).encode())
+    return headers, chunks, first, total
+
+
+def decode_chunks(headers, chunks):
+    """Decode chunk by chunk like a streaming client; returns (text, every chunk held whole events)."""
+    encoding = headers.get("content-encoding")
+    if encoding == "gzip":
+        decoder = zlib.decompressobj(31)
+        parts = [decoder.decompress(chunk) for chunk in chunks]
+    elif encoding == "br":
+        import brotli
+
+        decoder = brotli.Decompressor()
+        parts = [decoder.process(chunk) for chunk in chunks]
+    else:
+        parts = list(chunks)
+    whole = all(part.endswith((b"\n\n", b"\r\n\r\n")) for part in parts if part)
+    return b"".join(parts).decode(), whole
+
+
+def tool_results(text):
+    messages = [json.loads(line[5:]) for line in text.splitlines() if line.startswith("data:")]
+    return [m["result"]["content"][0]["text"] for m in messages if "result" in m], len(messages)
+
+
+def cases(args):
+    queries = [f"finder relais {i}" for i in range(args.queries)]
+    return {
+        "search": {"name": "search", "arguments": {"query": "finder 40.52 relais", "mode": "full"}},
+        "search_many": {"name": "search_many", "arguments": {"queries": queries, "mode": "full"}},
+        "fetch": {"name": "fetch", "arguments": {"id": "https://example.com/datasheet", "max_chars": args.page_kb * 1024}},
+        "search_and_fetch": {
+            "name": "search_and_fetch",
+            "arguments": {"query": "finder 40.52 datasheet", "k": 3, "max_chars_per_page": 50_000},
+            "_meta": {"progressToken": "p1"},
+        },
+    }
+
+
+async def run(args):
+    from src import compression
+    from src.server import create_app
+
+    app = create_app()
+    layer = app
+    while not isinstance(layer, compression.CompressionMiddleware):
+        layer = layer.app
+
+    variants = [("identity", None, None)]
+    for encoding in compression.available_encodings():
+        variants += [(f"{encoding}/{level}", encoding, level) for level in compression.LEVELS]
+
+    results, problems = {}, []
+    async with lifespan(app):
+        for case, params in cases(args).items():
+            payload = rpc("tools/call", params)
+            reference = None
+            rows = {}
+            for label, encoding, level in variants:
+                layer.level = level
+                await post(app, encoding, payload)  # warm the search cache and page store
+                sizes, firsts, totals = [], [], []
+                for _ in range(args.calls):
+                    headers, chunks, first, total = await post(app, encoding, payload)
+                    sizes.append(sum(len(chunk) for chunk in chunks))
+                    firsts.append(first)
+                    totals.append(total)
+                text, whole = decode_chunks(headers, chunks)
+                results_text, events = tool_results(text)
+                if reference is None:
+                    reference = results_text
+                elif results_text != reference:
+                    problems.append(f"{case} {label}: resultaat wijkt af van identity")
+                if headers.get("content-encoding") and not whole:
+                    problems.append(f"{case} {label}: body message zonder hele SSE events")
+                rows[label] = {
+                    "bytes": sizes[-1],
+                    "body_messages": len(chunks),
+                    "sse_events": events,
+                    "mean_ms": round(statistics.mean(totals) * 1000, 2),
+                    "first_chunk_ms": round(statistics.mean(firsts) * 1000, 2),
+                }
+            base = rows["identity"]
+            for label, row in rows.items():
+                row["ratio"] = round(base["bytes"] / row["bytes"], 2)
+                row["added_ms"] = round(row["mean_ms"] - base["mean_ms"], 2)
+            results[case] = rows
+    return results, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--page-kb", type=int, default=200)
+    args = parser.parse_args()
+
+    async def go():
+        async with PageStub(page_size=args.page_kb * 1024) as stub:
+            point_upstreams_at(stub)
+            return await run(args)
+
+    results, problems = asyncio.run(go())
+    print(json.dumps(results, indent=2))
+    checks = [(not problems, "gecomprimeerde resultaten gelijk aan identity, elke SSE body message los decodeerbaar")]
+    checks += [(False, problem) for problem in problems]
+    for case, rows in results.items():
+        fast = rows.get("gzip/fast")
+        if fast:
+            checks.append((fast["ratio"] > 1, f"{case}: {rows['identity']['bytes']} -> {fast['bytes']} bytes "
+                                              f"met gzip/fast ({fast['ratio']}x, +{fast['added_ms']} ms)"))
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
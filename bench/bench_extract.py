@@ -0,0 +1,127 @@
+"""Local HTML -> markdown extraction: quality on saved fixtures, throughput per pool.
+
+Quality: every page in bench/fixtures/html is extracted and checked against
+expected.json. `must_contain` snippets (headings, table rows, absolute links)
+have to be in the markdown, and `must_not_contain` boilerplate (menus, cookie
+banners, comments, footers) must not. Pages marked `fallback` must come out
+under FETCH_LOCAL_MIN_CHARS so fetch hands them to r.jina.ai.
+
+Throughput: the corpus plus one large synthetic product page (`--large-rows`
+spec table rows) is extracted `--rounds` times with all pages in flight at
+once. This runs inline on the event loop, in a thread pool and in a process
+pool. A 5 ms ticker records the worst event-loop stall for each.
+
+    python -m bench.bench_extract --rounds 20 --workers 2
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from src.extract import FETCH_LOCAL_MIN_CHARS, ExtractPool, extract_markdown
+
+FIXTURES = Path(__file__).parent / "fixtures" / "html"
+
+
+def load_corpus():
+    expected = json.loads((FIXTURES / "expected.json").read_text())
+    return [(name, (FIXTURES / name).read_text(encoding="utf-8"), spec) for name, spec in expected.items()]
+
+
+def large_page(rows):
+    html = (FIXTURES / "product_shop.html").read_text(encoding="utf-8")
+    extra = "".join(f"<tr><td>Kenmerk {i}</td><td>Waarde {i}, conform IEC 61131-2</td></tr>" for i in range(rows))
+    return html.replace("</table>", extra + "</table>", 1)
+
+
+def quality(corpus):
+    report = []
+    for name, html, spec in corpus:
+        page = extract_markdown(html, spec["url"])
+        markdown = page["markdown"]
+        fell_back = page["text_chars"] < FETCH_LOCAL_MIN_CHARS
+        must = spec.get("must_contain", [])
+        must_not = spec.get("must_not_contain", [])
+        missing = [s for s in must if s not in markdown]
+        leaked = [s for s in must_not if s in markdown]
+        report.append({
+            "page": name,
+            "html_bytes": len(html.encode()),
+            "markdown_bytes": len(markdown.encode()),
+            "recall": round(1 - len(missing) / len(must), 3) if must else None,
+            "boilerplate_leaked": f"{len(leaked)}/{len(must_not)}" if must_not else None,
+            "fallback": fell_back,
+            "ok": not missing and not leaked and fell_back == spec.get("fallback", False),
+            **({"missing": missing} if missing else {}),
+            **({"leaked": leaked} if leaked else {}),
+        })
+    return report
+
+
+async def throughput(kind, workers, pages, rounds):
+    pool = ExtractPool(kind, workers)
+    if kind != "inline":
+        await pool.warm()
+    worst_lag = 0.0
+    stop = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst_lag
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            started = loop.time()
+            await asyncio.sleep(0.005)
+            worst_lag = max(worst_lag, loop.time() - started - 0.005)
+
+    async def one(html, url):
+        # Inline extraction blocks the loop in one go, exactly like calling it from the fetch tool
+        if kind == "inline":
+            await asyncio.sleep(0)
+            return extract_markdown(html, url)
+        return await pool.extract(html, url)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(html, url) for _ in range(rounds) for html, url in pages))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    pool.shutdown()
+    total_bytes = sum(len(html.encode()) for html, _ in pages) * rounds
+    return {
+        "pool": kind,
+        "workers": workers if kind != "inline" else 0,
+        "pages": len(pages) * rounds,
+        "pages_per_s": round(len(pages) * rounds / elapsed, 1),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2),
+        "max_loop_stall_ms": round(worst_lag * 1000, 1),
+    }
+
+
+async def run(args):
+    corpus = load_corpus()
+    pages = [(html, spec["url"]) for _, html, spec in corpus]
+    pages.append((large_page(args.large_rows), "https://www.elektroshop.example/p/large"))
+    results = []
+    for kind in ("inline", "thread", "process"):
+        results.append(await throughput(kind, args.workers, pages, args.rounds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--large-rows", type=int, default=2000, help="spec rows in the synthetic large page")
+    args = parser.parse_args()
+
+    report = quality(load_corpus())
+    print(json.dumps({"quality": report, "throughput": asyncio.run(run(args))}, indent=2, ensure_ascii=False))
+    for row in report:
+        print(f"{'✅' if row['ok'] else '❌'} {row['page']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Requests per second through the wrapped app, driven as raw ASGI calls.
+
+No sockets and no HTTP client: each request is a scope plus receive/send
+callables handed straight to create_app(), so the figure isolates what the
+middleware stack and routing cost per request. Methods that never reach an
+upstream are used (`tools/list` on /mcp, GET /healthcheck).
+
+    python -m bench.bench_front_layer --requests 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.harness import lifespan, rpc
+
+MCP_BODY = json.dumps(rpc("tools/list")).encode()
+
+
+def mcp_scope(accept):
+    headers = [(b"host", b"mcp.local"), (b"content-type", b"application/json"), (b"content-length", str(len(MCP_BODY)).encode())]
+    if accept:
+        headers.append((b"accept", accept))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/mcp",
+        "raw_path": b"/mcp",
+        "root_path": "",
+        "query_string": b"api_key=bench-key",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("mcp.local", 80),
+        "state": {},
+    }
+
+
+def get_scope(path):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"mcp.local")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("mcp.local", 80),
+        "state": {},
+    }
+
+
+async def request(app, scope, body=b""):
+    done = asyncio.Event()
+    status = [0]
+    sent_body = [False]
+
+    async def receive():
+        if not sent_body[0]:
+            sent_body[0] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            done.set()
+
+    await app(dict(scope), receive, send)
+    done.set()
+    return status[0]
+
+
+async def measure(app, make_request, total, concurrency):
+    remaining = iter(range(total))
+    statuses = {}
+
+    async def worker():
+        for _ in remaining:
+            status = await make_request()
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests": total, "rps": round(total / elapsed, 1), "statuses": statuses}
+
+
+async def run(args):
+    from src.server import create_app
+
+    app = create_app()
+    scenarios = {
+        "mcp_tools_list": lambda: request(app, mcp_scope(b"application/json, text/event-stream"), MCP_BODY),
+        "mcp_tools_list_no_accept": lambda: request(app, mcp_scope(None), MCP_BODY),
+        "healthcheck": lambda: request(app, get_scope("/healthcheck")),
+    }
+    results = {}
+    async with lifespan(app):
+        for name, make_request in scenarios.items():
+            await measure(app, make_request, min(200, args.requests), args.concurrency)
+            results[name] = await measure(app, make_request, args.requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
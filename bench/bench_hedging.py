@@ -0,0 +1,92 @@
+"""Benchmark: fetch tail latency with and without hedged requests.
+
+The stub answers most page reads quickly but makes every `--slow-every`-th
+request take `--slow-ms`. With hedging on, a second attempt is sent once the
+first has run longer than the recent p95, so the slow outliers stop setting
+the wall-clock time.
+
+    python -m bench.bench_hedging --calls 200 --slow-every 25
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from bench.harness import call_tool, in_process_client, point_upstreams_at
+from bench.stub_upstream import StubUpstream
+
+
+class TailStub(StubUpstream):
+    def __init__(self, slow_every, slow_s, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_every = slow_every
+        self.slow_s = slow_s
+
+    async def respond(self, method, path, headers, body):
+        if self.requests % self.slow_every == 0:
+            await asyncio.sleep(self.slow_s)
+        else:
+            await asyncio.sleep(0.03)
+        return await super().respond(method, path, headers, body)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+async def run(client, calls, concurrency, tag):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await call_tool(client, "fetch", {"id": f"https://example.com/{tag}/{i}"})
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow-every", type=int, default=25)
+    parser.add_argument("--max-ratio", type=float, default=0.1)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    stub = TailStub(args.slow_every, args.slow_ms / 1000, page_size=5_000)
+    async with stub:
+        point_upstreams_at(stub)
+        from src import resilience, server
+
+        rows = []
+        for enabled in (False, True):
+            server.HEDGE_ENABLED = enabled
+            budget = resilience.hedge_budget
+            budget.ratio, budget.hedges, budget.hedge_wins = args.max_ratio, 0, 0
+            resilience.HEDGE_MIN_SAMPLES = 10
+            resilience.latency_trackers.clear()
+            async with in_process_client(server.create_app()) as client:
+                # Warm the latency estimate so hedging has a percentile to work with
+                await run(client, 30, args.concurrency, f"warm{enabled}")
+                before, budget.hedges, budget.hedge_wins = stub.requests, 0, 0
+                samples = await run(client, args.calls, args.concurrency, f"run{enabled}")
+            rows.append({
+                "hedging": enabled,
+                "calls": args.calls,
+                "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                "p99_ms": round(percentile(samples, 99) * 1000, 1),
+                "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+                "upstream_requests": stub.requests - before,
+                "hedges": budget.hedges,
+                "hedge_wins": budget.hedge_wins,
+            })
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
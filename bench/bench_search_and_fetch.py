@@ -0,0 +1,128 @@
+"""Benchmark: `search` followed by k `fetch` calls versus one `search_and_fetch`.
+
+The agent pattern from openai_batch_submit.py is a chain: one search, then a
+fetch per result, each a separate tool call with a model turn in between
+(`--turn-ms`, simulated here). search_and_fetch does the search and reads the
+top k pages concurrently in a single call.
+
+Two rounds against a local stub: in the first every page answers in
+`--page-ms`. In the second the last result of every query takes `--slow-ms`,
+longer than the overall budget (SEARCH_FETCH_BUDGET, set from `--budget`).
+search_and_fetch then has to come back on time with the other pages and a
+timeout entry, and send a progress notification per page as it arrives.
+
+    python -m bench.bench_search_and_fetch --queries 5 --k 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from bench.harness import MCP_HEADERS, call_tool, in_process_client, parse_mcp_response, point_upstreams_at, rpc
+from bench.stub_upstream import StubUpstream
+
+
+class PageLatencyStub(StubUpstream):
+    def __init__(self, search_s, page_s, slow_s, slow_rank, **kwargs):
+        super().__init__(**kwargs)
+        self.search_s = search_s
+        self.page_s = page_s
+        self.slow_s = slow_s
+        self.slow_rank = slow_rank
+
+    async def respond(self, method, path, headers, body):
+        if path.startswith("/search"):
+            await asyncio.sleep(self.search_s)
+        elif self.slow_rank and path.startswith(f"/https://example.com/{self.slow_rank - 1}/"):
+            await asyncio.sleep(self.slow_s)
+        else:
+            await asyncio.sleep(self.page_s)
+        return await super().respond(method, path, headers, body)
+
+
+async def chained(client, query, k, turn_s):
+    started = time.perf_counter()
+    results = json.loads(await call_tool(client, "search", {"query": query, "bypass_cache": True, "mode": "compact"}))
+    pages = 0
+    for item in results["organic"][:k]:
+        await asyncio.sleep(turn_s)
+        text = await call_tool(client, "fetch", {"id": item["link"]})
+        pages += not text.startswith("Error")
+    return time.perf_counter() - started, 1 + k, pages
+
+
+async def fused(client, query, k, id=1):
+    started = time.perf_counter()
+    params = {"name": "search_and_fetch", "arguments": {"query": query, "k": k, "bypass_cache": True},
+              "_meta": {"progressToken": f"p{id}"}}
+    response = await client.post("/mcp?api_key=bench-key", json=rpc("tools/call", params, id), headers=MCP_HEADERS)
+    response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    messages = [json.loads(line[5:]) for line in response.text.splitlines() if line.startswith("data:")]
+    progress = [m for m in messages if m.get("method") == "notifications/progress"]
+    result = parse_mcp_response(response) if not messages else messages[-1]
+    report = json.loads(result["result"]["content"][0]["text"])
+    return elapsed, report, progress
+
+
+async def run_round(client, args, tag):
+    turn_s = args.turn_ms / 1000
+    chain, fuse, checks = [], [], []
+    for i in range(args.queries):
+        seconds, calls, pages = await chained(client, f"relais {tag} {i}", args.k, turn_s)
+        chain.append(seconds)
+        seconds, report, progress = await fused(client, f"relais {tag} {i}b", args.k, id=i + 1)
+        fuse.append(seconds)
+        ok = [p for p in report["pages"] if "content" in p]
+        checks.append((len(report["pages"]), len(ok), len(progress), [json.loads(p["params"]["message"])["rank"] for p in progress]))
+    return {
+        "round": tag,
+        "chained": {"tool_calls": 1 + args.k, "mean_s": round(statistics.mean(chain), 3), "max_s": round(max(chain), 3)},
+        "search_and_fetch": {"tool_calls": 1, "mean_s": round(statistics.mean(fuse), 3), "max_s": round(max(fuse), 3)},
+        "speedup": round(statistics.mean(chain) / statistics.mean(fuse), 2),
+        "pages": [{"requested": n, "with_content": ok, "progress_notifications": p, "progress_order": order}
+                  for n, ok, p, order in checks[:1]],
+    }, checks
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--turn-ms", type=float, default=800, help="simulated model turn between chained tool calls")
+    parser.add_argument("--search-ms", type=float, default=200)
+    parser.add_argument("--page-ms", type=float, default=400)
+    parser.add_argument("--slow-ms", type=float, default=4000)
+    parser.add_argument("--budget", type=float, default=2.0)
+    args = parser.parse_args()
+
+    os.environ["SEARCH_FETCH_BUDGET"] = str(args.budget)
+    stub = PageLatencyStub(args.search_ms / 1000, args.page_ms / 1000, args.slow_ms / 1000, 0, page_size=20_000)
+    async with stub:
+        point_upstreams_at(stub)
+        from src import server
+
+        async with in_process_client(server.create_app()) as client:
+            fast, fast_checks = await run_round(client, args, "snel")
+            stub.slow_rank = args.k
+            slow, slow_checks = await run_round(client, args, "traag")
+
+    print(json.dumps([fast, slow], indent=2))
+    budget_s = args.budget + args.search_ms / 1000 + 0.5
+    results = [
+        (all(ok == n == p == args.k for n, ok, p, _ in fast_checks), "alle pagina's binnen, één progress notificatie per pagina"),
+        (fast["speedup"] > 1, f"search_and_fetch {fast['speedup']}x sneller dan search + {args.k} fetches"),
+        (all(ok == args.k - 1 and p == args.k - 1 for _, ok, p, _ in slow_checks),
+         "trage pagina komt terug als timeout, de rest met inhoud"),
+        (slow["search_and_fetch"]["max_s"] < budget_s, f"search_and_fetch blijft binnen het budget ({slow['search_and_fetch']['max_s']}s)"),
+    ]
+    for ok, text in results:
+        print(f"{'✅' if ok else '❌'} {text}")
+    sys.exit(0 if all(ok for ok, _ in results) else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
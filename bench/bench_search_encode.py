@@ -0,0 +1,50 @@
+"""Micro-benchmark: encode cost and size of a Serper.dev payload per output mode.
+
+Compares the old `json.dumps(indent=2)` path with `src.output.render` for each
+mode, on realistically sized Serper responses (10 and 100 organic results).
+
+    python -m bench.bench_search_encode --iterations 2000
+"""
+import argparse
+import json
+import timeit
+
+from bench.stub_upstream import serper_payload
+from src import output
+
+
+def measure(fn, iterations):
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+    return round(seconds / iterations * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    for num in (10, 100):
+        data = serper_payload("Siemens 6ES7214-1AG40-0XB0", num=num)
+        baseline = json.dumps(data, indent=2, ensure_ascii=False)
+        rows.append({
+            "organic": num,
+            "encoder": "json",
+            "mode": "baseline_indent2",
+            "us_per_call": measure(lambda: json.dumps(data, indent=2, ensure_ascii=False), args.iterations),
+            "bytes": len(baseline.encode()),
+        })
+        for mode in output.OUTPUT_MODES:
+            text = output.render(data, mode)
+            rows.append({
+                "organic": num,
+                "encoder": "orjson" if output.orjson else "json",
+                "mode": mode,
+                "us_per_call": measure(lambda: output.render(data, mode), args.iterations),
+                "bytes": len(text.encode()),
+            })
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
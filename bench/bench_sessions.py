@@ -0,0 +1,193 @@
+"""Benchmark: per-call cost of stateless /mcp versus stateful sessions.
+
+In stateless mode every request builds a new transport and server session.
+With MCP_SESSION_MODE=stateful a client that initializes once reuses its
+session for the rest of the chain. Each simulated client runs `--calls`
+calls in a row (tools/list, or a `search` that hits the cache), with
+`--clients` clients at once, driven as raw ASGI requests so only the server
+side is measured.
+
+The checks also cover the edges of the session table:
+
+- a session id from another task is answered statelessly (200, with a
+  result), and so is an expired one; GET on an unknown session gets 404
+- shrunk to `--max-sessions`, the table stays within the bound when more
+  clients initialize
+- idle sessions are evicted after MCP_SESSION_IDLE_TIMEOUT
+- a client that never initializes (the OpenAI Batch path) stays stateless
+
+    python -m bench.bench_sessions --clients 16 --calls 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from bench.harness import asgi_request, asgi_scope, lifespan, point_upstreams_at, rpc
+from bench.stub_upstream import StubUpstream
+
+BASE_HEADERS = [(b"content-type", b"application/json"), (b"accept", b"application/json, text/event-stream")]
+
+
+def mcp_scope(method="POST", session_id=None):
+    headers = list(BASE_HEADERS)
+    if session_id:
+        headers.append((b"mcp-session-id", session_id.encode()))
+    return asgi_scope(method, "/mcp", headers, b"api_key=bench-key")
+
+
+def messages(chunks):
+    text = b"".join(chunks).decode()
+    if text.startswith("{"):
+        return [json.loads(text)]
+    return [json.loads(line[5:]) for line in text.splitlines() if line.startswith("data:")]
+
+
+async def call(app, payload, session_id=None):
+    status, headers, chunks, _, _ = await asgi_request(app, mcp_scope(session_id=session_id), json.dumps(payload).encode())
+    return status, headers, messages(chunks)
+
+
+async def initialize(app):
+    params = {"protocolVersion": "2025-06-18", "capabilities": {}, "clientInfo": {"name": "bench", "version": "1"}}
+    status, headers, _ = await call(app, rpc("initialize", params))
+    session_id = headers.get("mcp-session-id")
+    if session_id:
+        await call(app, {"jsonrpc": "2.0", "method": "notifications/initialized"}, session_id)
+    return status, headers, session_id
+
+
+def payload_for(kind, id):
+    if kind == "tools_list":
+        return rpc("tools/list", id=id)
+    return rpc("tools/call", {"name": "search", "arguments": {"query": "finder 40.52 relais"}}, id)
+
+
+async def client_chain(app, kind, calls, stateful):
+    session_id = None
+    started = time.perf_counter()
+    if stateful:
+        _, _, session_id = await initialize(app)
+    latencies = []
+    ok = 0
+    for i in range(calls):
+        t = time.perf_counter()
+        status, _, replies = await call(app, payload_for(kind, i + 1), session_id)
+        latencies.append(time.perf_counter() - t)
+        ok += status == 200 and any("result" in r for r in replies)
+    return time.perf_counter() - started, latencies, ok
+
+
+async def measure(app, kind, args, stateful):
+    await asyncio.gather(*(client_chain(app, kind, 3, stateful) for _ in range(args.clients)))  # warm-up
+    started = time.perf_counter()
+    chains = await asyncio.gather(*(client_chain(app, kind, args.calls, stateful) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, chain, _ in chains for latency in chain)
+    total_calls = args.clients * args.calls
+    return {
+        "calls": total_calls,
+        "ok": sum(ok for _, _, ok in chains),
+        "calls_per_s": round(total_calls / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        "chain_mean_ms": round(statistics.mean(seconds for seconds, _, _ in chains) * 1000, 1),
+    }
+
+
+async def run(args):
+    from src import server, sessions
+
+    results, checks = {}, []
+    for mode in ("stateless", "stateful"):
+        app = server.create_app()
+        if mode == "stateful":
+            # The inner Starlette app; install() is what create_app() does for MCP_SESSION_MODE=stateful
+            inner = app
+            while not hasattr(inner, "router"):
+                inner = inner.app
+            manager = sessions.install(inner, server.mcp, max_sessions=args.clients * 2, idle_timeout=args.idle_timeout)
+        async with lifespan(app):
+            results[mode] = {kind: await measure(app, kind, args, mode == "stateful") for kind in ("tools_list", "search")}
+            if mode != "stateful":
+                continue
+
+            stats = sessions.session_stats
+            manager.max_sessions = args.max_sessions
+            opened = stats.created
+            await asyncio.gather(*(initialize(app) for _ in range(args.max_sessions * 3)))
+            checks.append((
+                len(manager._server_instances) <= args.max_sessions,
+                f"{stats.created - opened} extra sessies geopend, tabel blijft op {len(manager._server_instances)} "
+                f"(max {args.max_sessions}); {stats.evicted['full']} verdrongen, "
+                f"{stats.fallbacks['full']} stateless omdat alles bezig was",
+            ))
+
+            _, headers, session_id = await initialize(app)
+            sticky = headers.get("set-cookie", "")
+            checks.append((
+                session_id.startswith(f"{sessions.MCP_TASK_ID}.") and sessions.MCP_TASK_ID in sticky,
+                f"sessie-id met task prefix, sticky cookie `{sticky.split(';')[0]}`",
+            ))
+
+            status, _, replies = await call(app, payload_for("tools_list", 1), "0123456789ab.deadbeef")
+            other_ok = status == 200 and any("result" in r for r in replies)
+            status, _, _, _, _ = await asgi_request(app, mcp_scope("GET", "0123456789ab.deadbeef"))
+            checks.append((
+                other_ok and status == 404 and stats.fallbacks["other_task"] >= 1,
+                f"sessie van een andere task: POST stateless beantwoord, GET -> {status}",
+            ))
+
+            _, _, session_id = await initialize(app)
+            await asyncio.sleep(args.idle_timeout * 2.5)
+            status, _, replies = await call(app, payload_for("search", 1), session_id)
+            checks.append((
+                session_id not in manager._server_instances and stats.evicted["idle"] >= 1
+                and status == 200 and any("result" in r for r in replies) and stats.fallbacks["expired"] >= 1,
+                f"na {args.idle_timeout}s idle verwijderd ({stats.evicted['idle']} sessies); "
+                f"de volgende call werkt stateless",
+            ))
+
+            before = stats.created
+            status, _, replies = await call(app, payload_for("search", 1))
+            checks.append((
+                status == 200 and stats.created == before and any("result" in r for r in replies),
+                "call zonder initialize (Batch pad) blijft stateless",
+            ))
+            results["sessions"] = stats.as_dict()
+
+    for kind in ("tools_list", "search"):
+        saved = results["stateless"][kind]["mean_ms"] - results["stateful"][kind]["mean_ms"]
+        results.setdefault("saved_ms_per_call", {})[kind] = round(saved, 3)
+        checks.append((
+            results["stateful"][kind]["ok"] == results["stateful"][kind]["calls"] and saved > 0,
+            f"{kind}: {results['stateless'][kind]['mean_ms']} ms stateless -> {results['stateful'][kind]['mean_ms']} ms "
+            f"met sessie ({saved:.3f} ms per call bespaard)",
+        ))
+    return results, checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--max-sessions", type=int, default=8)
+    parser.add_argument("--idle-timeout", type=float, default=2.0, help="long enough not to expire sessions mid-chain")
+    args = parser.parse_args()
+
+    async def go():
+        async with StubUpstream() as stub:
+            point_upstreams_at(stub)
+            return await run(args)
+
+    results, checks = asyncio.run(go())
+    print(json.dumps(results, indent=2))
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
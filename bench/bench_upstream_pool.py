@@ -0,0 +1,80 @@
+"""Benchmark: fresh httpx.AsyncClient per call vs the shared upstream pool.
+
+Runs against a local stub that charges `--handshake-ms` per new connection
+(simulated DNS + TCP + TLS) and `--latency-ms` per request.
+
+    python -m bench.bench_upstream_pool --calls 200 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from bench.stub_upstream import StubUpstream
+from src import upstream
+
+
+def summarize(label, samples, wall, stub_connections):
+    samples = sorted(samples)
+    return {
+        "mode": label,
+        "calls": len(samples),
+        "wall_s": round(wall, 3),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "upstream_connections": stub_connections,
+    }
+
+
+async def one_search(client, base_url, i):
+    started = time.perf_counter()
+    response = await client.post(
+        f"{base_url}/search",
+        headers={"X-API-KEY": "bench", "Content-Type": "application/json"},
+        json={"q": f"6ES7214-1AG40-0XB0 {i % 7}", "gl": "nl", "hl": "nl", "num": 10},
+    )
+    response.raise_for_status()
+    response.json()
+    return time.perf_counter() - started
+
+
+async def run_mode(label, stub, calls, concurrency, pooled):
+    stub.connections = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(i):
+        async with semaphore:
+            if pooled:
+                return await one_search(upstream.get_client("serper"), stub.base_url, i)
+            # Het oude gedrag: een nieuwe client (en dus verbinding) per tool call
+            async with httpx.AsyncClient() as client:
+                return await one_search(client, stub.base_url, i)
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(worker(i) for i in range(calls)))
+    wall = time.perf_counter() - started
+    return summarize(label, samples, wall, stub.connections)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    stub = StubUpstream(latency=args.latency_ms / 1000, handshake_delay=args.handshake_ms / 1000)
+    async with stub:
+        results = [await run_mode("fresh_client", stub, args.calls, args.concurrency, pooled=False)]
+        async with upstream.lifespan():
+            results.append(await run_mode("pooled", stub, args.calls, args.concurrency, pooled=True))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,298 @@
+"""Local fake of the OpenAI Files, Batches and Responses endpoints for the batch scripts.
+
+Keeps everything in memory. Point the scripts at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+    python -m bench.fake_openai --port 8765
+
+`fail_after` makes every upload past that count fail with a 500. That
+simulates an interrupted submission so resume can be exercised.
+
+A batch completes after `complete_after_polls` retrieves. Its output file then
+holds one fake Responses API result per input line, each a short report
+with a `<json>` block. Every `error_every`-th request goes to the error file
+instead. The first `truncate_downloads` output-file downloads break off halfway
+to simulate a dropped connection.
+
+Background responses (`deep_research_mcp.py`) go from queued to in_progress and
+are completed once they are `response_seconds` old and have been retrieved
+`complete_after_polls` times. Every `error_every`-th response fails.
+`peak_active_responses` records how many ran at the same time.
+The first `fail_polls` retrieves answer 500. The first `lost_creates` creates
+start the response but answer 500, like a create that timed out after it
+reached OpenAI.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class FakeOpenAI:
+    def __init__(
+        self, fail_after=None, complete_after_polls=2, error_every=0, truncate_downloads=0, response_seconds=0.0,
+        fail_polls=0, lost_creates=0,
+    ):
+        self.fail_after = fail_after
+        self.fail_polls = fail_polls
+        self.lost_creates = lost_creates
+        self.response_seconds = response_seconds
+        self.complete_after_polls = complete_after_polls
+        self.error_every = error_every
+        self.truncate_downloads = truncate_downloads
+        self.files = {}
+        self.batches = {}
+        self.uploads = 0
+        self.downloads = {}
+        self.responses = {}
+        self.response_inputs = {}
+        self.peak_active_responses = 0
+        self._ids = itertools.count(1)
+        self.app = Starlette(routes=[
+            Route("/v1/files", self.create_file, methods=["POST"]),
+            Route("/v1/files/{file_id}/content", self.file_content, methods=["GET"]),
+            Route("/v1/batches", self.create_batch, methods=["POST"]),
+            Route("/v1/batches", self.list_batches, methods=["GET"]),
+            Route("/v1/batches/{batch_id}", self.get_batch, methods=["GET"]),
+            Route("/v1/responses", self.create_response, methods=["POST"]),
+            Route("/v1/responses/{response_id}", self.get_response, methods=["GET"]),
+            Route("/v1/responses/{response_id}/cancel", self.cancel_response, methods=["POST"]),
+        ])
+
+    def new_id(self, prefix):
+        return f"{prefix}-{next(self._ids):06d}"
+
+    async def create_file(self, request):
+        if self.fail_after is not None and self.uploads >= self.fail_after:
+            return JSONResponse({"error": {"message": "fake upload failure", "type": "server_error"}}, status_code=500)
+        self.uploads += 1
+        form = await request.form()
+        upload = form["file"]
+        content = await upload.read()
+        return JSONResponse(self.add_file(content, upload.filename, form.get("purpose", "batch")))
+
+    def add_file(self, content, filename, purpose):
+        file = {
+            "id": self.new_id("file"),
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.files[file["id"]] = (file, content)
+        return file
+
+    async def file_content(self, request):
+        file_id = request.path_params["file_id"]
+        entry = self.files.get(file_id)
+        if entry is None:
+            return JSONResponse({"error": {"message": "No such file"}}, status_code=404)
+        self.downloads[file_id] = self.downloads.get(file_id, 0) + 1
+        content = entry[1]
+        if entry[0]["purpose"] == "batch_output" and self.truncate_downloads > 0:
+            self.truncate_downloads -= 1
+            lines = content.splitlines(keepends=True)
+
+            async def broken():
+                for line in lines[: len(lines) // 2]:
+                    yield line
+                    await asyncio.sleep(0)
+                raise ConnectionResetError("fake connection drop")
+
+            return StreamingResponse(broken(), media_type="application/octet-stream")
+        return Response(content, media_type="application/octet-stream")
+
+    def fake_output(self, custom_id, n):
+        found = {"manufacturer": "Siemens", "ean": f"40{n:011d}", "price_eur": 100 + n, "lifecycle": "Active"}
+        report = f"Rapport voor {custom_id}.\n<json>\n{json.dumps(found)}\n</json>"
+        calls = [
+            {"id": f"mcp_{n:06d}_{i}", "type": "mcp_call", "name": name, "server_label": "serper_mcp", "arguments": "{}"}
+            for i, name in enumerate(["search", "fetch", "fetch"][: 1 + n % 3])
+        ]
+        return calls + [{
+            "id": f"msg_{n:06d}",
+            "type": "message",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": report, "annotations": []}],
+        }]
+
+    def fake_result(self, custom_id, n):
+        request_id = f"req_{n:06d}"
+        if self.error_every and n % self.error_every == 0:
+            return {
+                "id": f"batch_req_{n:06d}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 500,
+                    "request_id": request_id,
+                    "body": {"error": {"message": "fake failure", "type": "server_error"}},
+                },
+                "error": None,
+            }, False
+        body = {"id": f"resp_{n:06d}", "object": "response", "status": "completed", "output": self.fake_output(custom_id, n)}
+        return {
+            "id": f"batch_req_{n:06d}",
+            "custom_id": custom_id,
+            "response": {"status_code": 200, "request_id": request_id, "body": body},
+            "error": None,
+        }, True
+
+    def complete(self, batch):
+        output, errors = [], []
+        for n, line in enumerate(self.files[batch["input_file_id"]][1].splitlines(), start=1):
+            result, ok = self.fake_result(json.loads(line)["custom_id"], n)
+            (output if ok else errors).append(json.dumps(result) + "\n")
+        if output:
+            batch["output_file_id"] = self.add_file("".join(output).encode(), "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file("".join(errors).encode(), "errors.jsonl", "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+
+    async def create_batch(self, request):
+        body = await request.json()
+        if body["input_file_id"] not in self.files:
+            return JSONResponse({"error": {"message": "No such file"}}, status_code=400)
+        batch = {
+            "id": self.new_id("batch"),
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "metadata": body.get("metadata"),
+            "output_file_id": None,
+            "error_file_id": None,
+            "polls": 0,
+        }
+        self.batches[batch["id"]] = batch
+        return JSONResponse(batch)
+
+    async def list_batches(self, request):
+        data = sorted(self.batches.values(), key=lambda b: b["id"], reverse=True)
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+            "has_more": False,
+        })
+
+    async def get_batch(self, request):
+        batch = self.batches.get(request.path_params["batch_id"])
+        if batch is None:
+            return JSONResponse({"error": {"message": "No such batch"}}, status_code=404)
+        batch["polls"] += 1
+        if batch["status"] == "validating" and batch["polls"] >= self.complete_after_polls:
+            self.complete(batch)
+        elif batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress" and batch["polls"] >= self.complete_after_polls:
+            self.complete(batch)
+        return JSONResponse(batch)
+
+    def active_responses(self):
+        return sum(1 for r in self.responses.values() if r["status"] in ("queued", "in_progress"))
+
+    async def create_response(self, request):
+        body = await request.json()
+        n = len(self.responses) + 1
+        response = {
+            "id": self.new_id("resp"),
+            "object": "response",
+            "created_at": time.time(),
+            "model": body["model"],
+            "status": "queued" if body.get("background") else "completed",
+            "background": bool(body.get("background")),
+            "metadata": body.get("metadata") or {},
+            "output": [],
+            "error": None,
+            "incomplete_details": None,
+            "usage": None,
+            "polls": 0,
+            "n": n,
+        }
+        self.responses[response["id"]] = response
+        self.response_inputs[response["id"]] = body.get("input")
+        if not response["background"]:
+            self.finish_response(response)
+        self.peak_active_responses = max(self.peak_active_responses, self.active_responses())
+        if self.lost_creates:
+            self.lost_creates -= 1
+            return JSONResponse({"error": {"message": "fake lost create", "type": "server_error"}}, status_code=500)
+        return JSONResponse(response)
+
+    def finish_response(self, response):
+        n = response["n"]
+        if self.error_every and n % self.error_every == 0:
+            response["status"] = "failed"
+            response["error"] = {"code": "server_error", "message": "fake failure"}
+            return
+        response["status"] = "completed"
+        response["output"] = self.fake_output(response["metadata"].get("item_id", response["id"]), n)
+        response["usage"] = {
+            "input_tokens": 1000 + n,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 500,
+            "output_tokens_details": {"reasoning_tokens": 300},
+            "total_tokens": 1500 + n,
+        }
+
+    async def get_response(self, request):
+        response = self.responses.get(request.path_params["response_id"])
+        if response is None:
+            return JSONResponse({"error": {"message": "No such response"}}, status_code=404)
+        if self.fail_polls:
+            self.fail_polls -= 1
+            return JSONResponse({"error": {"message": "fake poll failure", "type": "server_error"}}, status_code=500)
+        response["polls"] += 1
+        if response["status"] == "queued":
+            response["status"] = "in_progress"
+        elif (
+            response["status"] == "in_progress"
+            and response["polls"] >= self.complete_after_polls
+            and time.time() - response["created_at"] >= self.response_seconds
+        ):
+            self.finish_response(response)
+        return JSONResponse(response)
+
+    async def cancel_response(self, request):
+        response = self.responses.get(request.path_params["response_id"])
+        if response is None:
+            return JSONResponse({"error": {"message": "No such response"}}, status_code=404)
+        if response["status"] in ("queued", "in_progress"):
+            response["status"] = "cancelled"
+        return JSONResponse(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-after", type=int, default=None, help="fail uploads after this many")
+    parser.add_argument("--complete-after-polls", type=int, default=2)
+    parser.add_argument("--error-every", type=int, default=0, help="every Nth request fails (0 = none)")
+    parser.add_argument("--truncate-downloads", type=int, default=0, help="break off the first N output downloads")
+    parser.add_argument("--response-seconds", type=float, default=0.0, help="minimum runtime of a background response")
+    parser.add_argument("--fail-polls", type=int, default=0, help="the first N response retrieves fail")
+    parser.add_argument("--lost-creates", type=int, default=0, help="the first N response creates start but answer 500")
+    args = parser.parse_args()
+    fake = FakeOpenAI(
+        args.fail_after, args.complete_after_polls, args.error_every, args.truncate_downloads, args.response_seconds,
+        args.fail_polls, args.lost_creates,
+    )
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Helpers to drive the wrapped server app in-process from bench scripts."""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+MCP_HEADERS = {"content-type": "application/json", "accept": "application/json, text/event-stream"}
+
+
+def point_upstreams_at(stub):
+    """Route Serper.dev and r.jina.ai traffic to a local stub (before importing src)."""
+    os.environ["SERPER_BASE_URL"] = stub.base_url
+    os.environ["JINA_BASE_URL"] = stub.base_url
+    # Warm-up HEAD requests would show up in the stub's request counts
+    os.environ.setdefault("STARTUP_WARMUP", "0")
+    # One JSON access log line per call would drown the bench output
+    os.environ.setdefault("ACCESS_LOG", "0")
+    # A page store on disk would carry stub pages over into the next run
+    os.environ.setdefault("FETCH_STORE_PATH", "memory")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Run the ASGI lifespan protocol around the block, like uvicorn does."""
+    inbox = asyncio.Queue()
+    started = asyncio.get_running_loop().create_future()
+    stopped = asyncio.get_running_loop().create_future()
+    await inbox.put({"type": "lifespan.startup"})
+
+    async def send(message):
+        kind = message["type"]
+        if kind.startswith("lifespan.startup"):
+            started.set_result(message)
+        elif kind.startswith("lifespan.shutdown"):
+            stopped.set_result(message)
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, inbox.get, send))
+    message = await started
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(message.get("message", "lifespan startup failed"))
+    try:
+        yield app
+    finally:
+        await inbox.put({"type": "lifespan.shutdown"})
+        await stopped
+        await task
+
+
+@asynccontextmanager
+async def in_process_client(app, base_url="http://mcp.local"):
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+            yield client
+
+
+def rpc(method, params=None, id=1):
+    return {"jsonrpc": "2.0", "id": id, "method": method, "params": params or {}}
+
+
+def parse_mcp_response(response):
+    """Return the JSON-RPC message from a JSON or SSE streamable-HTTP response."""
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        for line in response.text.splitlines():
+            if line.startswith("data:"):
+                return json.loads(line[5:].strip())
+        raise ValueError("SSE response without data")
+    return response.json()
+
+
+async def call_tool(client, name, arguments, api_key="bench-key", id=1):
+    """tools/call over /mcp; returns the first text content block."""
+    response = await client.post(
+        f"/mcp?api_key={api_key}", json=rpc("tools/call", {"name": name, "arguments": arguments}, id), headers=MCP_HEADERS
+    )
+    response.raise_for_status()
+    message = parse_mcp_response(response)
+    if "error" in message:
+        raise RuntimeError(message["error"])
+    content = message["result"].get("content") or [{}]
+    return content[0].get("text", "")
+
+
+def asgi_scope(method, path, headers=(), query_string=b""):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query_string,
+        "headers": [(b"host", b"mcp.local"), *headers], "client": ("127.0.0.1", 50000),
+        "server": ("mcp.local", 80), "state": {},
+    }
+
+
+async def asgi_request(app, scope, body=b""):
+    """Drive one request straight through the ASGI app, without an HTTP client.
+
+    Returns (status, response headers as a dict, body chunks as sent, seconds
+    to the first chunk, seconds in total). The chunks are the raw bytes the
+    server would put on the wire, before any client-side decoding.
+    """
+    done = asyncio.Event()
+    sent = [False]
+    start = {}
+    chunks = []
+    first = [None]
+    started = time.perf_counter()
+
+    async def receive():
+        if not sent[0]:
+            sent[0] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start["status"] = message["status"]
+            start["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            if first[0] is None:
+                first[0] = time.perf_counter() - started
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return start.get("status", 0), start.get("headers", {}), chunks, first[0], time.perf_counter() - started
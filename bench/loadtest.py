@@ -0,0 +1,336 @@
+"""Offline load test for the MCP server against stub Serper.dev / r.jina.ai upstreams.
+
+Starts the real server (`python -m src`, the production entrypoint) as a
+subprocess on a free local port, pointed at in-process stub upstreams with
+configurable latency, payload size and error rate. Simulated clients then run
+MCP sessions over the streamable-HTTP `/mcp` path:
+
+    initialize -> tools/list -> N x tools/call (search / fetch mix)
+
+The report is JSON: throughput, p50/p95/p99 per JSON-RPC method, error counts,
+server CPU and RSS, and the git commit, so runs can be diffed across commits.
+
+    python -m bench.loadtest --sessions 200 --concurrency 32 --output run.json
+    python -m bench.loadtest --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.harness import MCP_HEADERS, parse_mcp_response, rpc
+from bench.stub_upstream import StubUpstream
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_tree(pid):
+    """pid plus all descendants (multi-worker servers fork children)."""
+    pids = [pid]
+    try:
+        for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split():
+            pids.extend(process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def process_usage(pid):
+    """CPU seconds and RSS (MB) summed over the process tree, from /proc."""
+    cpu = 0.0
+    rss = 0.0
+    peak = 0.0
+    for p in process_tree(pid):
+        try:
+            fields = Path(f"/proc/{p}/stat").read_text().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    rss += int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak += int(line.split()[1]) / 1024
+        except (OSError, IndexError, ValueError):
+            continue
+    return {"cpu_s": cpu, "rss_mb": rss, "peak_rss_mb": peak}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.tool_errors = 0
+
+    def add(self, method, seconds, ok):
+        self.latencies.setdefault(method, []).append(seconds)
+        if not ok:
+            self.errors[method] = self.errors.get(method, 0) + 1
+
+    def summary(self):
+        result = {}
+        for method, samples in self.latencies.items():
+            ordered = sorted(samples)
+
+            def pct(p):
+                return round(ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))] * 1000, 2)
+
+            result[method] = {
+                "count": len(samples),
+                "errors": self.errors.get(method, 0),
+                "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+                "p50_ms": pct(50),
+                "p95_ms": pct(95),
+                "p99_ms": pct(99),
+            }
+        return result
+
+
+async def timed_rpc(client, url, recorder, method, params, label=None):
+    started = time.perf_counter()
+    ok = False
+    message = None
+    try:
+        response = await client.post(url, json=rpc(method, params), headers=MCP_HEADERS)
+        if response.status_code == 200:
+            message = parse_mcp_response(response)
+            ok = "error" not in message
+    except httpx.HTTPError:
+        pass
+    recorder.add(label or method, time.perf_counter() - started, ok)
+    return message
+
+
+async def run_session(client, url, args, rng, recorder):
+    await timed_rpc(
+        client,
+        url,
+        recorder,
+        "initialize",
+        {"protocolVersion": "2025-06-18", "capabilities": {}, "clientInfo": {"name": "loadtest", "version": "1"}},
+    )
+    await timed_rpc(client, url, recorder, "tools/list", {})
+    for _ in range(args.calls_per_session):
+        if rng.random() < args.fetch_ratio:
+            tool, arguments = "fetch", {"id": f"https://example.com/page/{rng.randrange(args.query_pool)}"}
+        else:
+            tool, arguments = "search", {"query": f"artikel {rng.randrange(args.query_pool)}", "mode": args.mode}
+        message = await timed_rpc(
+            client, url, recorder, "tools/call", {"name": tool, "arguments": arguments}, label=f"tools/call:{tool}"
+        )
+        if message and "result" in message:
+            content = message["result"].get("content") or [{}]
+            if content[0].get("text", "").startswith("Error"):
+                recorder.tool_errors += 1
+
+
+async def drive(base_url, args, sessions, recorder):
+    url = f"{base_url}/mcp?api_key={args.api_key}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    remaining = iter(range(sessions))
+
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+
+        async def worker(seed):
+            rng = random.Random(seed)
+            for _ in remaining:
+                await run_session(client, url, args, rng, recorder)
+
+        await asyncio.gather(*(worker(args.seed + i) for i in range(args.concurrency)))
+
+
+async def wait_until_up(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                if (await client.get(f"{base_url}/healthcheck")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not come up in time")
+
+
+def server_env(args, serper, jina, port):
+    env = dict(os.environ)
+    env.update({
+        "MCP_HOST": "127.0.0.1",
+        "MCP_PORT": str(port),
+        "MCP_WORKERS": str(args.workers),
+        "SERPER_BASE_URL": serper.base_url,
+        "JINA_BASE_URL": jina.base_url,
+        "PYTHONUNBUFFERED": "1",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+async def run(args):
+    serper = StubUpstream(
+        latency=args.serper_latency_ms / 1000,
+        latency_jitter=args.latency_jitter_ms / 1000,
+        organic_results=args.organic_results,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    jina = StubUpstream(
+        latency=args.jina_latency_ms / 1000,
+        latency_jitter=args.latency_jitter_ms / 1000,
+        page_size=args.page_size,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed + 1,
+    )
+    async with serper, jina:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, "-m", "src"],
+            cwd=REPO_ROOT,
+            env=server_env(args, serper, jina, port),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            started_at = time.perf_counter()
+            await wait_until_up(base_url, process)
+            startup_s = time.perf_counter() - started_at
+            if args.warmup:
+                await drive(base_url, args, args.warmup, Recorder())
+
+            recorder = Recorder()
+            upstream_before = serper.requests + jina.requests
+            usage_before = process_usage(process.pid)
+            started = time.perf_counter()
+            await drive(base_url, args, args.sessions, recorder)
+            wall = time.perf_counter() - started
+            usage_after = process_usage(process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    methods = recorder.summary()
+    total_requests = sum(m["count"] for m in methods.values())
+    cpu_s = usage_after["cpu_s"] - usage_before["cpu_s"]
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "server_log")},
+        "startup_s": round(startup_s, 3),
+        "wall_s": round(wall, 3),
+        "sessions": args.sessions,
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / wall, 2) if wall else None,
+        "tool_errors": recorder.tool_errors,
+        "methods": methods,
+        "server": {
+            "cpu_s": round(cpu_s, 3),
+            "cpu_percent": round(cpu_s / wall * 100, 1) if wall else None,
+            "rss_mb": round(usage_after["rss_mb"], 1),
+            "peak_rss_mb": round(usage_after["peak_rss_mb"], 1),
+        },
+        "upstream": {
+            "requests": serper.requests + jina.requests - upstream_before,
+            "stub_errors": serper.errors + jina.errors,
+        },
+    }
+
+
+def compare(before_path, after_path):
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+
+    def delta(a, b):
+        if a in (None, 0) or b is None:
+            return None
+        return round((b - a) / a * 100, 1)
+
+    rows = {
+        "throughput_rps": (before["throughput_rps"], after["throughput_rps"]),
+        "server.cpu_s": (before["server"]["cpu_s"], after["server"]["cpu_s"]),
+        "server.peak_rss_mb": (before["server"]["peak_rss_mb"], after["server"]["peak_rss_mb"]),
+    }
+    for method in sorted(set(before["methods"]) & set(after["methods"])):
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            rows[f"{method}.{key}"] = (before["methods"][method][key], after["methods"][method][key])
+    report = {
+        "before": before.get("commit"),
+        "after": after.get("commit"),
+        "metrics": {name: {"before": a, "after": b, "change_pct": delta(a, b)} for name, (a, b) in rows.items()},
+    }
+    print(json.dumps(report, indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200, help="MCP sessions to run")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous client sessions")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (MCP_WORKERS)")
+    parser.add_argument("--calls-per-session", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured sessions first")
+    parser.add_argument("--fetch-ratio", type=float, default=0.4, help="share of tool calls that are fetch")
+    parser.add_argument("--query-pool", type=int, default=10_000, help="distinct queries/URLs (lower = more cache hits)")
+    parser.add_argument("--mode", default="full", help="search output mode")
+    parser.add_argument("--serper-latency-ms", type=float, default=20)
+    parser.add_argument("--jina-latency-ms", type=float, default=80)
+    parser.add_argument("--latency-jitter-ms", type=float, default=10)
+    parser.add_argument("--organic-results", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=50_000, help="Jina page size in bytes")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--api-key", default="loadtest-key")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server env")
+    parser.add_argument("--server-log", help="write server stdout/stderr here")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two reports")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
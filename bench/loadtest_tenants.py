@@ -0,0 +1,187 @@
+"""Multi-tenant load test: one batch key next to interactive keys, with and without admission control.
+
+The stub upstream serves `--capacity` requests at a time (FIFO, `--latency-ms`
+each). It stands in for whatever a busy task runs out of first: CPU or a
+shared upstream quota. The per-tenant upstream limiter is opened up to 64,
+so one key alone can saturate it, like a 50k-row batch does in production.
+
+- batch: `--batch-calls` searches from one API key, `--batch-concurrency` at
+  a time. On a 503 it waits for Retry-After (capped at 1 s here) and retries.
+- interactive: `--interactive` other keys, each making `--interactive-calls`
+  searches one after another.
+
+Each mode runs in its own process, because admission settings are read at
+import. `off` sets ADMISSION_ENABLED=0. `on` gives the server
+`--capacity` slots, puts the batch key in a `batch` class (weight 1, cap
+`--batch-cap`), and gives the interactive keys weight 4. With the cap equal
+to the capacity the batch may use every slot nobody else wants. A lower cap
+keeps slots free, at the cost of batch throughput.
+
+    python -m bench.loadtest_tenants --batch-calls 600 --batch-concurrency 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.harness import MCP_HEADERS, in_process_client, point_upstreams_at, rpc
+from bench.stub_upstream import StubUpstream
+
+BATCH_KEY = "shop-batch-key"
+
+
+class SharedCapacityStub(StubUpstream):
+    """Serves at most `capacity` requests at once, the rest wait in arrival order."""
+
+    def __init__(self, capacity, service_s, **kwargs):
+        super().__init__(**kwargs)
+        self.slots = asyncio.Semaphore(capacity)
+        self.service_s = service_s
+
+    async def respond(self, method, path, headers, body):
+        async with self.slots:
+            await asyncio.sleep(self.service_s)
+            return await super().respond(method, path, headers, body)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+async def search(client, key, query):
+    """One search tool call; returns (status, seconds, Retry-After)."""
+    started = time.perf_counter()
+    params = {"name": "search", "arguments": {"query": query, "bypass_cache": True}}
+    response = await client.post(f"/mcp?api_key={key}", json=rpc("tools/call", params), headers=MCP_HEADERS)
+    return response.status_code, time.perf_counter() - started, response.headers.get("retry-after")
+
+
+async def batch_client(client, args, report):
+    pending = iter(range(args.batch_calls))
+
+    async def worker():
+        for i in pending:
+            while True:
+                status, seconds, retry_after = await search(client, BATCH_KEY, f"batch artikel {i}")
+                if status != 503:
+                    report["ok"] += status == 200
+                    break
+                report["shed"] += 1
+                report["shed_ms"].append(seconds * 1000)
+                await asyncio.sleep(min(1.0, float(retry_after or 1)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.batch_concurrency)))
+    report["seconds"] = time.perf_counter() - started
+
+
+async def interactive_client(client, key, args, latencies, statuses):
+    await asyncio.sleep(args.interactive_delay)  # let the batch fill the queue first
+    for i in range(args.interactive_calls):
+        status, seconds, _ = await search(client, key, f"{key} vraag {i}")
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.append(seconds * 1000)
+
+
+async def run_mode(args):
+    stub = SharedCapacityStub(args.capacity, args.latency_ms / 1000)
+    async with stub:
+        point_upstreams_at(stub)
+        from src import server
+        from src.admission import fair_queue
+
+        batch = {"ok": 0, "shed": 0, "shed_ms": []}
+        latencies, statuses = [], {}
+        async with in_process_client(server.create_app()) as client:
+            keys = [f"interactive-key-{n}" for n in range(args.interactive)]
+            await asyncio.gather(
+                batch_client(client, args, batch),
+                *(interactive_client(client, key, args, latencies, statuses) for key in keys),
+            )
+            stats = fair_queue.stats()
+    return {
+        "interactive": {
+            "calls": len(latencies),
+            "statuses": statuses,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "max_ms": round(max(latencies), 1),
+        },
+        "batch": {
+            "calls": args.batch_calls,
+            "ok": batch["ok"],
+            "seconds": round(batch["seconds"], 2),
+            "calls_per_s": round(batch["ok"] / batch["seconds"], 1),
+            "503s": batch["shed"],
+            "median_503_ms": round(statistics.median(batch["shed_ms"]), 1) if batch["shed_ms"] else None,
+        },
+        "admission": {name: {k: v for k, v in summary.items() if k not in ("tenants", "in_flight", "queued")}
+                      for name, summary in stats["classes"].items()},
+    }
+
+
+def mode_env(args, mode):
+    from src.cache import api_key_namespace
+
+    env = dict(os.environ, UPSTREAM_LIMIT_INITIAL="64", UPSTREAM_LIMIT_MAX="64", ACCESS_LOG="0")
+    if mode == "off":
+        env["ADMISSION_ENABLED"] = "0"
+    else:
+        env.update({
+            "ADMISSION_ENABLED": "1",
+            "ADMISSION_CAPACITY": str(args.capacity),
+            "ADMISSION_CLASSES": f"default=4/{args.capacity},batch=1/{args.batch_cap}",
+            "ADMISSION_TENANTS": f"{api_key_namespace(BATCH_KEY)}=batch",
+            "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+        })
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--batch-calls", type=int, default=600)
+    parser.add_argument("--batch-concurrency", type=int, default=300)
+    parser.add_argument("--batch-cap", type=int, default=8)
+    parser.add_argument("--interactive", type=int, default=3)
+    parser.add_argument("--interactive-calls", type=int, default=20)
+    parser.add_argument("--interactive-delay", type=float, default=0.3)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--mode", choices=["off", "on"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+
+    results = {}
+    for mode in ("off", "on"):
+        output = subprocess.check_output(
+            [sys.executable, "-m", "bench.loadtest_tenants", *sys.argv[1:], "--mode", mode],
+            env=mode_env(args, mode), stderr=subprocess.DEVNULL, text=True,
+        )
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+    off, on = results["off"], results["on"]
+    checks = [
+        (on["interactive"]["p95_ms"] < off["interactive"]["p95_ms"] / 2,
+         f"interactieve keys p95 {off['interactive']['p95_ms']} ms -> {on['interactive']['p95_ms']} ms met fair queueing"),
+        (on["interactive"]["statuses"].get("503", 0) == 0, "interactieve keys krijgen geen 503"),
+        (on["batch"]["ok"] == args.batch_calls,
+         f"batch: alle {args.batch_calls} calls klaar ({on['batch']['calls_per_s']}/s), "
+         f"{on['batch']['503s']}x 503 met Retry-After in ≈ {on['batch']['median_503_ms']} ms"),
+    ]
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
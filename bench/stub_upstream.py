@@ -0,0 +1,160 @@
+"""Minimal in-process stand-in for google.serper.dev and r.jina.ai.
+
+A tiny HTTP/1.1 keep-alive server on asyncio streams, so benchmarks and checks
+run offline and deterministically. Point the server at it with
+SERPER_BASE_URL / JINA_BASE_URL (or patch `src.upstream` directly).
+
+    POST /search          -> Serper-like JSON body (or an array for array payloads)
+    GET  /<url>           -> Jina-like markdown body
+
+`handshake_delay` is paid once per new TCP connection and simulates the
+DNS + TCP + TLS cost of a real WAN upstream; `latency` (+ up to
+`latency_jitter`) is paid per request. A fraction `error_rate` of requests is
+answered with `error_status` instead.
+"""
+import asyncio
+import json
+import random
+
+
+def serper_payload(query, num=10):
+    """A Serper.dev-shaped search response of realistic size."""
+    return {
+        "searchParameters": {"q": query, "gl": "nl", "hl": "nl", "num": num, "type": "search"},
+        "knowledgeGraph": {
+            "title": query,
+            "type": "Fabrikant",
+            "description": "Lorem ipsum " * 20,
+            "attributes": {"Opgericht": "1847", "Hoofdkantoor": "München"},
+        },
+        "organic": [
+            {
+                "title": f"{query} - resultaat {i}",
+                "link": f"https://example.com/{i}/{query.replace(' ', '-')}",
+                "snippet": f"Productinformatie voor {query}: prijs, EAN en levertijd. " * 3,
+                "position": i + 1,
+                "sitelinks": [{"title": "Datasheet", "link": f"https://example.com/{i}/pdf"}],
+            }
+            for i in range(num)
+        ],
+        "peopleAlsoAsk": [
+            {"question": f"Wat kost {query}?", "snippet": "Vraag en antwoord " * 10, "link": "https://example.com/faq"}
+            for _ in range(4)
+        ],
+        "relatedSearches": [{"query": f"{query} {suffix}"} for suffix in ("prijs", "datasheet", "opvolger")],
+        "credits": 1,
+    }
+
+
+def jina_payload(url, size=20_000):
+    line = f"Dit is de inhoud van {url}. Specificaties, prijzen en beschikbaarheid.\n"
+    body = f"Title: {url}\n\nURL Source: {url}\n\nMarkdown Content:\n"
+    return body + line * max(1, size // len(line))
+
+
+class StubUpstream:
+    """Serves Serper- and Jina-like responses and counts what it sees."""
+
+    def __init__(
+        self,
+        latency=0.0,
+        handshake_delay=0.0,
+        page_size=20_000,
+        organic_results=10,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=None,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.handshake_delay = handshake_delay
+        self.page_size = page_size
+        self.organic_results = organic_results
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.errors = 0
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.connections = 0
+        self.paths = []
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def respond(self, method, path, headers, body):
+        """Return (status, headers, body bytes). Override to script behaviour."""
+        if method == "POST" and path.startswith("/search"):
+            request = json.loads(body or b"{}")
+            if isinstance(request, list):
+                # Serper.dev batch form: an array of payloads in, an array of results out
+                payload = [serper_payload(item.get("q", ""), self.organic_results) for item in request]
+            else:
+                payload = serper_payload(request.get("q", ""), self.organic_results)
+            return 200, {"content-type": "application/json"}, json.dumps(payload).encode()
+        target = path.lstrip("/")
+        return 200, {"content-type": "text/plain; charset=utf-8"}, jina_payload(target, self.page_size).encode()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.handshake_delay:
+                await asyncio.sleep(self.handshake_delay)
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                self.paths.append(path)
+                delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+                if delay:
+                    await asyncio.sleep(delay)
+                if self.error_rate and self._random.random() < self.error_rate:
+                    self.errors += 1
+                    status, resp_headers, resp_body = self.error_status, {"content-type": "text/plain"}, b"stub error"
+                else:
+                    status, resp_headers, resp_body = await self.respond(method, path, headers, body)
+
+                head = [f"HTTP/1.1 {status} OK"]
+                resp_headers = {**resp_headers, "content-length": str(len(resp_body))}
+                head += [f"{k}: {v}" for k, v in resp_headers.items()]
+                if method == "HEAD":
+                    resp_body = b""
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + resp_body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
@@ -1,45 +1,128 @@
+import argparse
+import asyncio
+import json
 import os
+import random
+import statistics
+import time
+from pathlib import Path
+
 import pandas as pd
-from openai import OpenAI
+from openai import APIStatusError, AsyncOpenAI
 from dotenv import load_dotenv
 
+from openai_batch_collect import json_blok
+from openai_batch_submit import bewaar_manifest, laad_manifest
+
 # --- CONFIGURATIE ---
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 
-if not OPENAI_API_KEY:
-    raise ValueError("Geen OPENAI_API_KEY gevonden in .env bestand!")
-if not SERPAPI_API_KEY:
-    raise ValueError("Geen SERPAPI_API_KEY gevonden in .env bestand! Deze is nodig voor de remote MCP URL.")
-
 # Gebruik exact hetzelfde model als in je batch scripts
 MODEL_NAAM = "o4-mini-deep-research-2025-06-26"
 
 # Het domein van jouw MCP server
-MCP_BASE_URL = "http://serper-mcp.pontifexxpaddock.com"
+MCP_BASE_URL = "https://serper-mcp.pontifexxpaddock.com"
 # De volledige URL inclusief de sleutel voor de relay
-MCP_SERVER_URL = f"{MCP_BASE_URL}/{SERPAPI_API_KEY}/mcp"
+MCP_SERVER_URL = f"{MCP_BASE_URL}/mcp?api_key={SERPAPI_API_KEY}"
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Append-only: één JSON regel per afgeronde vraag
+RESULTATEN_BESTAND = "deep_research_results.jsonl"
+# Vragen die al verstuurd zijn maar nog lopen (id -> response id), voor hervatten.
+# Een vraag staat er al in vóór de create call; zonder response id is niet zeker of OpenAI hem kreeg.
+STATUS_BESTAND = "deep_research_state.json"
 
-def main():
-    print(f"Start Deep Research met model: {MODEL_NAAM}")
-    print(f"Remote MCP URL: {MCP_SERVER_URL}")
-    
-    # Voorbeeld instructies gebaseerd op je eerdere scripts
-    instructions = """
+# Maximaal aantal background responses dat tegelijk loopt
+CONCURRENCY = int(os.getenv("DEEP_RESEARCH_CONCURRENCY", 4))
+# Poll interval per response groeit van MIN naar MAX seconden
+POLL_MIN_INTERVAL = float(os.getenv("DEEP_RESEARCH_POLL_MIN_INTERVAL", 5))
+POLL_MAX_INTERVAL = float(os.getenv("DEEP_RESEARCH_POLL_MAX_INTERVAL", 60))
+# Na zoveel seconden wordt een response geannuleerd en als mislukt geteld
+TIMEOUT = float(os.getenv("DEEP_RESEARCH_TIMEOUT", 3600))
+
+EINDSTATUSSEN = {"completed", "failed", "cancelled", "incomplete"}
+
+INSTRUCTIONS = """
     Je bent een Senior Procurement Analyst. Je taak is om marktdata te valideren voor technische componenten.
     Gebruik de 'search' tool van de MCP server om fabrikanten, prijzen, EAN codes en lifecycle status te verifiëren.
     Citeer je bronnen duidelijk.
+    Sluit af met je bevindingen als JSON binnen <json> tags.
+    """
+
+VOORBEELD_VRAAG = "Research de huidige marktprijs en beschikbaarheid van de 'Siemens 6ES7214-1AG40-0XB0' PLC. Wat zijn de opvolgers als deze EOL is?"
+VRAAG_TEMPLATE = "Research de huidige marktprijs en beschikbaarheid van '{art_nr}' ({omschrijving}, groep {groep}). Wat zijn de opvolgers als deze EOL is?"
+
+
+def lees_vragen(pad):
+    """Vragen als [{"id": ..., "question": ...}] uit een .txt, .jsonl, .csv of Excel bestand.
+
+    .txt: één vraag per regel. .jsonl: {"id": ..., "question": ...} per regel.
+    Sheets: een kolom `Vraag`, of anders een vraag per artikel uit
+    `Artikelnummer`, `Omschrijving` en `Artikel_Groep`. Het id is het regelnummer.
     """
+    pad = Path(pad)
+    if pad.suffix == ".txt":
+        with open(pad, encoding="utf-8") as f:
+            regels = [regel.strip() for regel in f]
+        return [{"id": str(i), "question": vraag} for i, vraag in enumerate(regels) if vraag]
+    if pad.suffix == ".jsonl":
+        with open(pad, encoding="utf-8") as f:
+            items = [json.loads(regel) for regel in f if regel.strip()]
+        return [{"id": str(item.get("id", i)), "question": item["question"]} for i, item in enumerate(items)]
+
+    df = pd.read_csv(pad) if pad.suffix == ".csv" else pd.read_excel(pad)
+    if "Vraag" in df:
+        vragen = df["Vraag"].map(str)
+    else:
+        vragen = [
+            VRAAG_TEMPLATE.format(art_nr=art_nr, omschrijving=omschrijving, groep=groep)
+            for art_nr, omschrijving, groep in zip(
+                *(df[kolom].map(str) if kolom in df else [""] * len(df) for kolom in ("Artikelnummer", "Omschrijving", "Artikel_Groep"))
+            )
+        ]
+    return [{"id": str(i), "question": vraag} for i, vraag in zip(df.index, vragen)]
+
 
-    # Input (je kunt dit aanpassen naar een vraag uit je Excel)
-    user_input = "Research de huidige marktprijs en beschikbaarheid van de 'Siemens 6ES7214-1AG40-0XB0' PLC. Wat zijn de opvolgers als deze EOL is?"
+def afgerond(pad, opnieuw_mislukt=False):
+    """Ids die al in het resultaten log staan; met opnieuw_mislukt alleen de geslaagde."""
+    klaar = set()
+    if not Path(pad).is_file():
+        return klaar
+    with open(pad, "rb+") as f:
+        inhoud = f.read()
+        # Half geschreven laatste regel van een afgebroken run weghalen, anders plakt de volgende eraan
+        if inhoud and not inhoud.endswith(b"\n"):
+            inhoud = inhoud[:inhoud.rfind(b"\n") + 1]
+            f.truncate(len(inhoud))
+    for regel in inhoud.splitlines():
+        record = json.loads(regel)
+        if not opnieuw_mislukt or record["status"] == "completed":
+            klaar.add(record["id"])
+    return klaar
 
-    try:
-        print(f"Aanvraag versturen naar OpenAI ({MODEL_NAAM})...")
-        resp = client.responses.create(
+
+class Runner:
+    def __init__(self, client, log, status, concurrency, poll_min, poll_max, timeout):
+        self.client = client
+        self.log = log
+        self.status = status
+        self.semafoor = asyncio.Semaphore(concurrency)
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self.records = []
+
+    def bewaar_status(self):
+        bewaar_manifest(self.status, STATUS_BESTAND)
+
+    async def start(self, item):
+        # Eerst vastleggen dat we gaan versturen: de Responses API kan niet zoeken op metadata,
+        # dus na een crash tijdens create is dit het enige spoor van een mogelijk lopende response
+        lopend = {"response_id": None, "submitted_at": time.time()}
+        self.status["pending"][item["id"]] = lopend
+        self.bewaar_status()
+        resp = await self.client.responses.create(
             model=MODEL_NAAM,
             background=True,
             reasoning={
@@ -53,19 +136,166 @@ def main():
                     "require_approval": "never",
                 },
             ],
-            instructions=instructions,
-            input=user_input,
+            instructions=INSTRUCTIONS,
+            input=item["question"],
+            metadata={"item_id": item["id"]},
         )
+        lopend["response_id"] = resp.id
+        self.bewaar_status()
+        return lopend
+
+    async def wacht(self, response_id, submitted_at):
+        interval = self.poll_min
+        vorige = None
+        while True:
+            resp = await self.client.responses.retrieve(response_id)
+            if resp.status in EINDSTATUSSEN:
+                return resp
+            if time.time() - submitted_at > self.timeout:
+                return await self.client.responses.cancel(response_id)
+            # Bij een statuswissel (queued -> in_progress) weer snel pollen, anders steeds rustiger
+            interval = self.poll_min if resp.status != vorige else min(interval * 1.5, self.poll_max)
+            vorige = resp.status
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+
+    def schrijf(self, record):
+        self.log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.log.flush()
+        self.status["pending"].pop(record["id"], None)
+        self.bewaar_status()
+
+    async def verwerk(self, item):
+        async with self.semafoor:
+            record = {"id": item["id"], "question": item["question"]}
+            try:
+                lopend = self.status["pending"].get(item["id"]) or await self.start(item)
+                resp = await self.wacht(lopend["response_id"], lopend["submitted_at"])
+            except Exception as e:
+                record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+                lopend = self.status["pending"].get(item["id"])
+                if lopend and not lopend["response_id"] and afgewezen(e):
+                    # OpenAI wees de create call af: er loopt geen response, dus mag hij in het log
+                    self.schrijf(record)
+                    print(f"   {item['id']}: afgewezen, {record['error']}")
+                else:
+                    # De response (of de mogelijk verstuurde create) blijft in de state; een volgende run pakt hem op
+                    print(f"   {item['id']}: {record['error']}, blijft open voor een volgende run")
+                self.records.append(record)
+                return
+            if resp.status not in EINDSTATUSSEN:
+                # Annuleren is nog bezig: de volgende run haalt de eindstatus op
+                record.update({"status": resp.status, "error": "nog niet afgerond"})
+                self.records.append(record)
+                print(f"   {item['id']}: {resp.status}, blijft open voor een volgende run")
+                return
+            tekst = resp.output_text or ""
+            blok = json_blok(tekst)
+            try:
+                gevonden = json.loads(blok) if blok else None
+            except json.JSONDecodeError:
+                gevonden = None
+            fout = resp.error.message if resp.error else None
+            if resp.status == "incomplete" and resp.incomplete_details:
+                fout = f"incomplete: {resp.incomplete_details.reason}"
+            record.update({
+                "response_id": resp.id,
+                "status": resp.status,
+                "latency_s": round(time.time() - lopend["submitted_at"], 2),
+                "tool_calls": sum(1 for o in resp.output or [] if o.type == "mcp_call"),
+                "output_text": tekst,
+                "result": gevonden,
+                "error": fout,
+                "usage": resp.usage.model_dump() if resp.usage else None,
+            })
+            self.schrijf(record)
+            self.records.append(record)
+            print(f"   {item['id']}: {record['status']} na {record['latency_s']}s, {record['tool_calls']} tool calls")
+
+def samenvatting(records):
+    if not records:
+        return {"items": 0}
+    latencies = sorted(r["latency_s"] for r in records if "latency_s" in r)
+    tool_calls = [r["tool_calls"] for r in records if "tool_calls" in r]
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+    return {
+        "items": len(records),
+        "completed": sum(1 for r in records if r["status"] == "completed"),
+        "failed": sum(1 for r in records if r["status"] != "completed"),
+        "with_json": sum(1 for r in records if r.get("result") is not None),
+        "latency_p50_s": pct(0.5),
+        "latency_p95_s": pct(0.95),
+        "tool_calls_mean": round(statistics.mean(tool_calls), 2) if tool_calls else None,
+        "tool_calls_max": max(tool_calls, default=None),
+    }
+
+
+def afgewezen(fout):
+    """Of OpenAI een create call zelf weigerde (4xx): dan is er zeker geen response gestart."""
+    return isinstance(fout, APIStatusError) and 400 <= fout.status_code < 500
+
+
+def onbevestigd(status):
+    """Ids die gekild werden tussen vastleggen en de create call: misschien loopt er al een response."""
+    return sorted(item_id for item_id, lopend in status["pending"].items() if not lopend.get("response_id"))
+
+
+async def run(items, args):
+    """Verwerk `items`; geeft (records, ids die niet opnieuw verstuurd zijn)."""
+    status = laad_manifest(STATUS_BESTAND) or {"pending": {}}
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    overgeslagen = onbevestigd(status)
+    if overgeslagen and args.resubmit_unconfirmed:
+        for item_id in overgeslagen:
+            status["pending"].pop(item_id)
+        overgeslagen = []
+    elif overgeslagen:
+        # Opnieuw versturen kan een tweede (betaalde) response naast een lopende starten
+        print(f"⚠️  {len(overgeslagen)} vragen zijn misschien al verstuurd, maar zonder response ID: {', '.join(overgeslagen[:10])}")
+        print("   Zoek ze op `item_id` in de OpenAI logs, of verstuur ze opnieuw met --resubmit-unconfirmed.")
+        items = [item for item in items if item["id"] not in overgeslagen]
+    # Responses die nog lopen uit een afgebroken run eerst, anders komen er nieuwe bovenop de limiet
+    items = sorted(items, key=lambda item: item["id"] not in status["pending"])
+    with open(RESULTATEN_BESTAND, "a", encoding="utf-8") as log:
+        runner = Runner(client, log, status, args.concurrency, args.poll_min, args.poll_max, args.timeout)
+        await asyncio.gather(*(runner.verwerk(item) for item in items))
+    return runner.records, overgeslagen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deep research voor veel vragen tegelijk, met background responses.")
+    parser.add_argument("--input", help="Vragen uit .txt, .jsonl, .csv of Excel; zonder input één voorbeeldvraag")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--poll-min", type=float, default=POLL_MIN_INTERVAL)
+    parser.add_argument("--poll-max", type=float, default=POLL_MAX_INTERVAL)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("--retry-failed", action="store_true", help="Mislukte vragen uit een eerdere run opnieuw doen")
+    parser.add_argument("--resubmit-unconfirmed", action="store_true",
+                        help="Vragen die gekild werden tijdens het versturen opnieuw versturen (kan dubbel kosten)")
+    args = parser.parse_args()
+
+    if not OPENAI_API_KEY:
+        raise ValueError("Geen OPENAI_API_KEY gevonden in .env bestand!")
+    if not SERPAPI_API_KEY:
+        raise ValueError("Geen SERPAPI_API_KEY gevonden in .env bestand! Deze is nodig voor de remote MCP URL.")
+
+    items = lees_vragen(args.input) if args.input else [{"id": "voorbeeld", "question": VOORBEELD_VRAAG}]
+    klaar = afgerond(RESULTATEN_BESTAND, args.retry_failed)
+    open_items = [item for item in items if item["id"] not in klaar]
+
+    print(f"Start Deep Research met model: {MODEL_NAAM}")
+    print(f"Remote MCP URL: {MCP_SERVER_URL}")
+    print(f"{len(open_items)} van {len(items)} vragen te doen (max {args.concurrency} tegelijk), resultaten naar {RESULTATEN_BESTAND}")
+
+    records, overgeslagen = asyncio.run(run(open_items, args))
 
-        print("\n--- RESULTAAT ---")
-        if hasattr(resp, 'output_text'):
-            print(resp.output_text)
-        else:
-            print("Geen directe output_text gevonden. Response object:")
-            print(resp)
+    print("\n--- SAMENVATTING ---")
+    print(json.dumps({**samenvatting(records), "unconfirmed": len(overgeslagen)}, indent=2))
+    if overgeslagen or any(r["status"] != "completed" for r in records):
+        raise SystemExit(1)
 
-    except Exception as e:
-        print(f"Er is een fout opgetreden: {e}")
 
 if __name__ == "__main__":
     main()
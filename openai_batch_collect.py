@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from openai_batch_submit import BATCH_ID_BESTAND, INDEX_BESTAND, MANIFEST_BESTAND, bewaar_manifest, laad_manifest
+
+# --- CONFIGURATIE ---
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Append-only log: één JSON regel per Excel regel, wordt nooit herschreven
+RESULTATEN_BESTAND = "batch_results.jsonl"
+# Welke batches klaar zijn en welke output/error files volledig verwerkt zijn
+STATUS_BESTAND = "batch_collect_state.json"
+EXCEL_UITVOER = "batch_results.xlsx"
+
+POLL_CONCURRENCY = int(os.getenv("BATCH_POLL_CONCURRENCY", 8))
+DOWNLOAD_CONCURRENCY = int(os.getenv("BATCH_DOWNLOAD_CONCURRENCY", 4))
+# Wachttijd tussen twee polls van dezelfde batch groeit van MIN naar MAX seconden
+POLL_MIN_INTERVAL = float(os.getenv("BATCH_POLL_MIN_INTERVAL", 10))
+POLL_MAX_INTERVAL = float(os.getenv("BATCH_POLL_MAX_INTERVAL", 300))
+
+EINDSTATUSSEN = {"completed", "failed", "expired", "cancelled"}
+
+
+def json_blok(tekst):
+    """Inhoud van het laatste <json>...</json> blok, of None."""
+    einde = tekst.rfind("</json>")
+    if einde == -1:
+        return None
+    begin = tekst.rfind("<json>", 0, einde)
+    if begin == -1:
+        return None
+    blok = tekst[begin + len("<json>"):einde].strip()
+    # Modellen zetten er soms nog een ```json codeblok omheen
+    if blok.startswith("```"):
+        blok = blok.split("\n", 1)[1] if "\n" in blok else ""
+        blok = blok.rsplit("```", 1)[0].strip()
+    return blok
+
+
+def output_tekst(body):
+    """Alle output_text delen van de berichten in een Responses API antwoord."""
+    delen = []
+    for item in body.get("output") or []:
+        if item.get("type") != "message":
+            continue
+        for deel in item.get("content") or []:
+            if deel.get("type") == "output_text":
+                delen.append(deel.get("text", ""))
+    return "".join(delen)
+
+
+def rij_uit_custom_id(custom_id):
+    # Oude runs zonder index: custom_id eindigt op _<Excel index>
+    try:
+        return int(custom_id.rsplit("_", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def verwerk_regel(regel, index):
+    """Eén regel uit een output of error file -> (custom_id, records per Excel regel)."""
+    data = json.loads(regel)
+    custom_id = data.get("custom_id")
+    response = data.get("response") or {}
+    body = response.get("body") or {}
+    status_code = response.get("status_code")
+
+    resultaat = None
+    fout = data.get("error") or body.get("error")
+    if fout:
+        fout = fout.get("message", json.dumps(fout)) if isinstance(fout, dict) else str(fout)
+    elif status_code != 200:
+        fout = f"HTTP {status_code}"
+    else:
+        blok = json_blok(output_tekst(body))
+        if blok is None:
+            fout = "geen <json> blok in het antwoord"
+        else:
+            try:
+                resultaat = json.loads(blok)
+            except json.JSONDecodeError as e:
+                fout = f"ongeldige JSON in <json> blok: {e}"
+
+    basis = {
+        "custom_id": custom_id,
+        "status_code": status_code,
+        "tool_calls": sum(1 for item in body.get("output") or [] if item.get("type") == "mcp_call"),
+        "result": resultaat,
+        "error": fout,
+    }
+    rijen = index.get(custom_id) or [rij_uit_custom_id(custom_id)]
+    return custom_id, [{"row": rij, **basis} for rij in rijen]
+
+
+def laad_index(pad):
+    index = {}
+    if Path(pad).is_file():
+        with open(pad, encoding="utf-8") as f:
+            for regel in f:
+                entry = json.loads(regel)
+                index[entry["custom_id"]] = entry["rows"]
+    return index
+
+
+def herstel_log(pad):
+    """Kap een half geschreven laatste regel af en geef de al verwerkte (file_id, custom_id) paren terug."""
+    pad = Path(pad)
+    if not pad.is_file():
+        return set()
+    with open(pad, "rb+") as f:
+        inhoud = f.read()
+        if inhoud and not inhoud.endswith(b"\n"):
+            f.truncate(inhoud.rfind(b"\n") + 1)
+            inhoud = inhoud[:inhoud.rfind(b"\n") + 1]
+    verwerkt = set()
+    for regel in inhoud.splitlines():
+        record = json.loads(regel)
+        verwerkt.add((record["file_id"], record["custom_id"]))
+    return verwerkt
+
+
+class Collector:
+    def __init__(self, client, index, log, status, verwerkt, poll_min, poll_max, poll_concurrency, download_concurrency):
+        self.client = client
+        self.index = index
+        self.log = log
+        self.status = status
+        self.verwerkt = verwerkt
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.poll_semafoor = asyncio.Semaphore(poll_concurrency)
+        self.download_semafoor = asyncio.Semaphore(download_concurrency)
+        self.records = 0
+
+    def bewaar_status(self):
+        bewaar_manifest(self.status, STATUS_BESTAND)
+
+    async def wacht_op_batch(self, batch_id):
+        bekend = self.status["batches"].get(batch_id)
+        if bekend and bekend["status"] in EINDSTATUSSEN:
+            return bekend
+        interval = self.poll_min
+        while True:
+            async with self.poll_semafoor:
+                batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in EINDSTATUSSEN:
+                break
+            tellingen = batch.request_counts
+            voortgang = f" ({tellingen.completed + tellingen.failed}/{tellingen.total})" if tellingen else ""
+            print(f"   {batch_id}: {batch.status}{voortgang}, opnieuw over {interval:.0f}s")
+            # Jitter, zodat honderden batches niet allemaal tegelijk gepolld worden
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+            interval = min(interval * 2, self.poll_max)
+
+        bekend = {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+        self.status["batches"][batch_id] = bekend
+        self.bewaar_status()
+        print(f"   {batch_id}: {batch.status}")
+        return bekend
+
+    async def download(self, batch_id, file_id):
+        """Stream een output/error file regel voor regel naar het resultaten log."""
+        nieuw = 0
+        async with self.download_semafoor:
+            async with self.client.files.with_streaming_response.content(file_id) as response:
+                async for regel in response.iter_lines():
+                    if not regel.strip():
+                        continue
+                    custom_id, records = verwerk_regel(regel, self.index)
+                    if (file_id, custom_id) in self.verwerkt:
+                        continue  # al binnen uit een eerdere, afgebroken download
+                    # Alle regels van één request in één write, zodat een request nooit half in het log staat
+                    self.log.write("".join(
+                        json.dumps({**record, "batch_id": batch_id, "file_id": file_id}) + "\n" for record in records
+                    ))
+                    self.verwerkt.add((file_id, custom_id))
+                    nieuw += len(records)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.status["files_done"].append(file_id)
+        self.bewaar_status()
+        self.records += nieuw
+        print(f"   {batch_id}: {file_id} verwerkt ({nieuw} nieuwe regels)")
+
+    async def verzamel(self, batch_id):
+        batch = await self.wacht_op_batch(batch_id)
+        for file_id in (batch["output_file_id"], batch["error_file_id"]):
+            if file_id and file_id not in self.status["files_done"]:
+                await self.download(batch_id, file_id)
+
+
+def batch_ids_uit_submit():
+    manifest = laad_manifest()
+    if manifest:
+        return [s["batch_id"] for s in manifest["shards"] if s["batch_id"]], manifest
+    try:
+        with open(BATCH_ID_BESTAND) as f:
+            return [regel.strip() for regel in f if regel.strip()], None
+    except FileNotFoundError:
+        return [], None
+
+
+async def collect(batch_ids, index, args):
+    status = laad_manifest(STATUS_BESTAND) or {"batches": {}, "files_done": []}
+    verwerkt = herstel_log(RESULTATEN_BESTAND)
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    with open(RESULTATEN_BESTAND, "a", encoding="utf-8") as log:
+        collector = Collector(
+            client, index, log, status, verwerkt, args.poll_min, args.poll_max, POLL_CONCURRENCY, args.concurrency
+        )
+        resultaten = await asyncio.gather(*(collector.verzamel(b) for b in batch_ids), return_exceptions=True)
+    fouten = [(b, r) for b, r in zip(batch_ids, resultaten) if isinstance(r, Exception)]
+    for batch_id, fout in fouten:
+        print(f"   {batch_id} mislukt: {type(fout).__name__}: {fout}")
+    print(f"   {collector.records} nieuwe regels in {RESULTATEN_BESTAND}")
+    return not fouten
+
+
+def schrijf_excel(bron, uitvoer=EXCEL_UITVOER):
+    """Resultaten plat slaan en naast de originele Excel kolommen zetten."""
+    resultaten = pd.read_json(RESULTATEN_BESTAND, lines=True, dtype={"custom_id": str})
+    if resultaten.empty:
+        print("   Nog geen resultaten om te exporteren.")
+        return
+    # Een request dat eerst faalde kan later alsnog gelukt zijn; per regel telt het laatste record
+    resultaten = resultaten.drop_duplicates("row", keep="last").set_index("row")
+    gevonden = resultaten["result"].map(lambda r: r if isinstance(r, dict) else {})
+    plat = pd.json_normalize(gevonden.tolist()).set_axis(resultaten.index).add_prefix("result.")
+    resultaten = resultaten.drop(columns=["result"]).join(plat)
+    if bron and Path(bron).is_file():
+        resultaten = pd.read_excel(bron).join(resultaten, how="left")
+    resultaten.to_excel(uitvoer)
+    print(f"   {len(resultaten)} regels geschreven naar {uitvoer}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Haal resultaten van gestarte OpenAI batches op en koppel ze aan de Excel regels.")
+    parser.add_argument("--batch-id", action="append", help="Alleen deze batch(es); standaard alles uit het manifest")
+    parser.add_argument("--concurrency", type=int, default=DOWNLOAD_CONCURRENCY, help="Gelijktijdige downloads")
+    parser.add_argument("--poll-min", type=float, default=POLL_MIN_INTERVAL)
+    parser.add_argument("--poll-max", type=float, default=POLL_MAX_INTERVAL)
+    parser.add_argument("--no-excel", action="store_true", help="Alleen het JSONL log bijwerken")
+    args = parser.parse_args()
+
+    if not OPENAI_API_KEY:
+        raise ValueError("Geen OPENAI_API_KEY gevonden in .env bestand!")
+
+    batch_ids, manifest = batch_ids_uit_submit()
+    if args.batch_id:
+        batch_ids = args.batch_id
+    if not batch_ids:
+        print(f"Geen batches gevonden in {MANIFEST_BESTAND} of {BATCH_ID_BESTAND}.")
+        return
+    index = laad_index((manifest or {}).get("index", INDEX_BESTAND))
+
+    print(f"1. {len(batch_ids)} batch(es) volgen (max {POLL_CONCURRENCY} polls, {args.concurrency} downloads tegelijk)...")
+    gelukt = asyncio.run(collect(batch_ids, index, args))
+
+    if not args.no_excel:
+        print(f"2. Excel export: {EXCEL_UITVOER}")
+        schrijf_excel((manifest or {}).get("source"))
+
+    if not gelukt:
+        print("Niet alle batches zijn binnen; draai het script opnieuw om te hervatten.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
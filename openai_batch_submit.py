@@ -1,61 +1,41 @@
-import pandas as pd
-from openai import OpenAI
+import argparse
+import asyncio
+import hashlib
 import json
 import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
 from dotenv import load_dotenv
+from openai import AsyncOpenAI
 
 # --- CONFIGURATIE ---
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 
-if not OPENAI_API_KEY:
-    raise ValueError("Geen OPENAI_API_KEY gevonden in .env bestand!")
-if not SERPAPI_API_KEY:
-    raise ValueError("Geen SERPAPI_API_KEY gevonden! Deze is nodig voor de Remote MCP URL.")
-
 MODEL_NAAM = "o4-mini-deep-research-2025-06-26"
 BESTANDSNAAM = "excel.xlsx"
-JSONL_BESTAND = "batch_input_mcp_research.jsonl"
+SHARD_MAP = "batch_shards"
+MANIFEST_BESTAND = "batch_manifest.json"
+# custom_id -> alle Excel regels die dat request dekt, om resultaten terug uit te vouwen
+INDEX_BESTAND = "batch_index.jsonl"
+BATCH_ID_BESTAND = "batch_id_deep.txt"
+
+# Limieten van de OpenAI Batch API per input file: 50.000 requests en 200 MB.
+# Standaard blijven we met de bytes wat onder de grens.
+MAX_REQUESTS_PER_BATCH = int(os.getenv("BATCH_MAX_REQUESTS", 50_000))
+MAX_BYTES_PER_BATCH = int(os.getenv("BATCH_MAX_BYTES", 190 * 1024 * 1024))
+# Aantal shards dat tegelijk wordt geüpload en gestart
+UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 4))
 
 # Remote MCP Configuratie
 MCP_SERVER_URL = f"https://serper-mcp.pontifexxpaddock.com/mcp?api_key={SERPAPI_API_KEY}"
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def clean_text(text):
-    if pd.isna(text): return ""
-    return "".join([c if c.isalnum() else " " for c in str(text)]).strip()
-
-def main():
-    print(f"1. Excel inlezen: {BESTANDSNAAM}...")
-    try:
-        df = pd.read_excel(BESTANDSNAAM)
-    except FileNotFoundError:
-        print(f"Bestand '{BESTANDSNAAM}' niet gevonden!")
-        return
-
-    # DEBUG: Reduced to 1 item for faster testing
-    if len(df) > 1:
-        df_to_process = df.sample(n=1, random_state=42) 
-        print(f"Testmodus: 1 item geselecteerd uit {len(df)} regels.")
-    else:
-        df_to_process = df
-    
-    print(f"Bezig met genereren van batch bestand met Remote MCP: {MCP_SERVER_URL}")
-    
-    with open(JSONL_BESTAND, 'w', encoding='utf-8') as f:
-        for index, row in df_to_process.iterrows():
-            art_nr = str(row.get('Artikelnummer', ''))
-            omschrijving = str(row.get('Omschrijving', ''))
-            groep = str(row.get('Artikel_Groep', ''))
-            
-            veilige_id = clean_text(art_nr).replace(" ", "_")
-            custom_id = f"{veilige_id}_{index}" 
-            
-            prompt_text = f"""
+PROMPT_TEMPLATE = """
             You are a Senior Procurement Analyst. Research and validate this article using the provided search tool.
-            
+
             Article: {art_nr}
             Description: {omschrijving}
             Group: {groep}
@@ -66,54 +46,289 @@ def main():
             3. Market Price (EUR)
             4. Lifecycle Status (Active/EOL)
             5. Successor if EOL
-            
+
             CRITICAL INSTRUCTION:
-            Use the 'fetch' tool to inspect search results and verify details on official websites. Do not rely solely on search snippets.
+            Use the 'search_and_fetch' tool to search and read the top results in one call, and 'fetch' to open further results or read on with a cursor. Verify details on official websites. Do not rely solely on search snippets.
 
             OUTPUT FORMAT:
             Provide your report and then the results in JSON format within <json> tags.
             """
 
-            request_body = {
-                "custom_id": custom_id,
-                "method": "POST",
-                "url": "/v1/responses", 
-                "body": {
-                    "model": MODEL_NAAM,
-                    "input": prompt_text,
-                    "tools": [
-                        {
-                            "type": "mcp",
-                            "server_label": "serper_mcp",
-                            "server_url": MCP_SERVER_URL,
-                            "require_approval": "never"
-                        }
-                    ],
-                    "max_tool_calls": 20
-                }
-            }
-            f.write(json.dumps(request_body) + "\n")
-
-    print(f"2. Uploaden naar OpenAI ({JSONL_BESTAND})...")
-    batch_file = client.files.create(
-        file=open(JSONL_BESTAND, "rb"),
-        purpose="batch"
+# Alles aan een request behalve custom_id en input is per run gelijk; die stukken
+# worden één keer ge-encodeerd en per regel aan elkaar geplakt.
+MODEL_JSON = json.dumps(MODEL_NAAM)
+BODY_TAIL = json.dumps({
+    "tools": [
+        {
+            "type": "mcp",
+            "server_label": "serper_mcp",
+            "server_url": MCP_SERVER_URL,
+            "require_approval": "never"
+        }
+    ],
+    "max_tool_calls": 20
+})[1:]
+
+NIET_ALFANUMERIEK = r"[\W_]"
+
+
+def clean_column(kolom):
+    """Alles behalve letters en cijfers wordt een spatie, voor een hele kolom tegelijk; NaN wordt ""."""
+    return kolom.fillna("").astype(str).str.replace(NIET_ALFANUMERIEK, " ", regex=True).str.strip()
+
+
+def tekst_kolom(df, naam):
+    # Zelfde waarden als str(row.get(naam, '')) per rij
+    if naam not in df:
+        return pd.Series("", index=df.index)
+    return df[naam].map(str)
+
+
+def artikel_sleutels(df):
+    """Eén sleutel per artikel: Artikelnummer + Omschrijving via clean_column, hoofdletterongevoelig."""
+    def normaliseer(kolom):
+        return clean_column(kolom).str.casefold().str.replace(r"\s+", " ", regex=True)
+
+    return normaliseer(tekst_kolom(df, "Artikelnummer")) + "|" + normaliseer(tekst_kolom(df, "Omschrijving"))
+
+
+def request_regel(custom_id, prompt_text):
+    """Eén JSONL regel, byte-gelijk aan json.dumps van het volledige request."""
+    return (
+        f'{{"custom_id": {json.dumps(custom_id)}, "method": "POST", "url": "/v1/responses", '
+        f'"body": {{"model": {MODEL_JSON}, "input": {json.dumps(prompt_text)}, {BODY_TAIL}}}\n'
     )
-    
-    print(f"3. Batch starten (File ID: {batch_file.id})...")
-    batch_job = client.batches.create(
-        input_file_id=batch_file.id,
-        endpoint="/v1/responses",
-        completion_window="24h",
-        metadata={"description": f"MCP Remote Relay Test - {len(df_to_process)} items"}
+
+
+def bouw_requests(df, index=None, dedup=True):
+    """Yield (custom_id, jsonl regel) per artikel; kolommen worden in één keer voorbereid.
+
+    Met dedup krijgt elk uniek artikel (zie artikel_sleutels) één request,
+    gebouwd uit de eerste regel waarin het voorkomt. Naar `index` gaat per
+    request een regel {"custom_id": ..., "rows": [...]} met alle Excel regels
+    die het dekt.
+    """
+    art_nrs = tekst_kolom(df, "Artikelnummer")
+    omschrijvingen = tekst_kolom(df, "Omschrijving")
+    groepen = tekst_kolom(df, "Artikel_Groep")
+    custom_ids = clean_column(art_nrs).str.replace(" ", "_") + "_" + df.index.astype(str)
+
+    if dedup:
+        sleutels = artikel_sleutels(df).tolist()
+    else:
+        sleutels = df.index.tolist()
+    rijen_per_sleutel = {}
+    for sleutel, rij in zip(sleutels, df.index.tolist()):
+        rijen_per_sleutel.setdefault(sleutel, []).append(rij)
+
+    for sleutel, custom_id, art_nr, omschrijving, groep in zip(sleutels, custom_ids, art_nrs, omschrijvingen, groepen):
+        rijen = rijen_per_sleutel.pop(sleutel, None)
+        if rijen is None:
+            continue  # dubbel artikel, al verstuurd met de eerste regel
+        if index is not None:
+            index.write(json.dumps({"custom_id": custom_id, "rows": rijen}) + "\n")
+        prompt_text = PROMPT_TEMPLATE.format(art_nr=art_nr, omschrijving=omschrijving, groep=groep)
+        yield custom_id, request_regel(custom_id, prompt_text)
+
+
+def schrijf_shards(regels, shard_map, max_requests=MAX_REQUESTS_PER_BATCH, max_bytes=MAX_BYTES_PER_BATCH):
+    """Stream regels naar shard_XXXX.jsonl bestanden binnen de Batch API limieten."""
+    shard_map = Path(shard_map)
+    shard_map.mkdir(parents=True, exist_ok=True)
+    for oud in shard_map.glob("shard_*.jsonl"):
+        oud.unlink()
+
+    shards = []
+    f = None
+
+    def sluit():
+        if f is not None:
+            f.close()
+            shards[-1]["sha256"] = digest.hexdigest()
+
+    for custom_id, regel in regels:
+        data = regel.encode("utf-8")
+        if len(data) > max_bytes:
+            raise ValueError(f"Request {custom_id} is groter dan {max_bytes} bytes")
+        if f is None or shards[-1]["requests"] >= max_requests or shards[-1]["bytes"] + len(data) > max_bytes:
+            sluit()
+            pad = shard_map / f"shard_{len(shards):04d}.jsonl"
+            f = open(pad, "wb")
+            digest = hashlib.sha256()
+            shards.append({
+                "shard": len(shards),
+                "path": str(pad),
+                "requests": 0,
+                "bytes": 0,
+                "first_custom_id": custom_id,
+                "file_id": None,
+                "batch_id": None,
+            })
+        f.write(data)
+        digest.update(data)
+        shards[-1]["requests"] += 1
+        shards[-1]["bytes"] += len(data)
+    sluit()
+    return shards
+
+
+def bewaar_manifest(manifest, pad=MANIFEST_BESTAND):
+    # Eerst naar een tijdelijk bestand, zodat een onderbroken run nooit een half manifest achterlaat
+    tmp = f"{pad}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, pad)
+
+
+def laad_manifest(pad=MANIFEST_BESTAND):
+    try:
+        with open(pad, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def manifest_bruikbaar(manifest, bron):
+    """Een bestaand manifest hervatten kan alleen als alle shards nog ongewijzigd op schijf staan."""
+    if not manifest or manifest.get("source") != bron or not manifest.get("complete"):
+        return False
+    if not Path(manifest.get("index", INDEX_BESTAND)).is_file():
+        return False
+    return all(
+        Path(shard["path"]).is_file() and Path(shard["path"]).stat().st_size == shard["bytes"]
+        for shard in manifest["shards"]
+    )
+
+
+async def zoek_bestaande_batch(client, file_id, max_batches=1000):
+    """Batch die al voor deze file is gestart (run onderbroken vóór het manifest bijgewerkt was)."""
+    gezien = 0
+    async for batch in client.batches.list(limit=100):
+        if batch.input_file_id == file_id:
+            return batch.id
+        gezien += 1
+        if gezien >= max_batches:
+            break
+    return None
+
+
+async def verwerk_shard(client, manifest, shard, semafoor):
+    async with semafoor:
+        naam = f"shard {shard['shard']}"
+        if not shard["file_id"]:
+            print(f"   {naam}: uploaden ({shard['requests']} requests, {shard['bytes'] / 1e6:.1f} MB)...")
+            with open(shard["path"], "rb") as f:
+                batch_file = await client.files.create(file=f, purpose="batch")
+            shard["file_id"] = batch_file.id
+            bewaar_manifest(manifest)
+        elif not shard["batch_id"]:
+            shard["batch_id"] = await zoek_bestaande_batch(client, shard["file_id"])
+            if shard["batch_id"]:
+                bewaar_manifest(manifest)
+
+        if not shard["batch_id"]:
+            batch_job = await client.batches.create(
+                input_file_id=shard["file_id"],
+                endpoint="/v1/responses",
+                completion_window="24h",
+                metadata={
+                    "description": f"MCP Remote Relay - {shard['requests']} items",
+                    "shard": str(shard["shard"]),
+                },
+            )
+            shard["batch_id"] = batch_job.id
+            bewaar_manifest(manifest)
+        print(f"   {naam}: batch {shard['batch_id']} (file {shard['file_id']})")
+
+
+async def submit(manifest, concurrency=UPLOAD_CONCURRENCY):
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    semafoor = asyncio.Semaphore(concurrency)
+    open_shards = [s for s in manifest["shards"] if not s["batch_id"]]
+    print(f"3. {len(open_shards)} van {len(manifest['shards'])} shards uploaden en starten (max {concurrency} tegelijk)...")
+    resultaten = await asyncio.gather(
+        *(verwerk_shard(client, manifest, shard, semafoor) for shard in open_shards), return_exceptions=True
     )
+    fouten = [(shard, r) for shard, r in zip(open_shards, resultaten) if isinstance(r, Exception)]
+    for shard, fout in fouten:
+        print(f"   shard {shard['shard']} mislukt: {fout}")
+    return not fouten
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bouw, shard en start OpenAI batches vanuit de Excel sheet.")
+    parser.add_argument("--excel", default=BESTANDSNAAM)
+    parser.add_argument("--sample", type=int, default=0, help="Alleen N willekeurige regels (testmodus)")
+    parser.add_argument("--fresh", action="store_true", help="Bestaand manifest negeren en opnieuw beginnen")
+    parser.add_argument("--dry-run", action="store_true", help="Alleen shards en manifest schrijven, niets uploaden")
+    parser.add_argument("--concurrency", type=int, default=UPLOAD_CONCURRENCY)
+    parser.add_argument("--no-dedup", action="store_true", help="Eén request per regel, ook voor dubbele artikelen")
+    args = parser.parse_args()
+
+    if not OPENAI_API_KEY and not args.dry_run:
+        raise ValueError("Geen OPENAI_API_KEY gevonden in .env bestand!")
+    if not SERPAPI_API_KEY:
+        raise ValueError("Geen SERPAPI_API_KEY gevonden! Deze is nodig voor de Remote MCP URL.")
+
+    manifest = None if args.fresh else laad_manifest()
+    if manifest_bruikbaar(manifest, args.excel):
+        print(f"1-2. Hervatten vanuit {MANIFEST_BESTAND} ({len(manifest['shards'])} shards, {manifest['rows']} regels)")
+    else:
+        if manifest and any(s["batch_id"] for s in manifest["shards"]) and not args.fresh:
+            print(f"{MANIFEST_BESTAND} hoort bij een andere of gewijzigde run waarvan al batches lopen. Gebruik --fresh om opnieuw te beginnen.")
+            return
+        print(f"1. Excel inlezen: {args.excel}...")
+        try:
+            df = pd.read_excel(args.excel)
+        except FileNotFoundError:
+            print(f"Bestand '{args.excel}' niet gevonden!")
+            return
+        if args.sample and len(df) > args.sample:
+            df = df.sample(n=args.sample, random_state=42)
+            print(f"Testmodus: {args.sample} item(s) geselecteerd.")
+
+        print(f"2. Batch bestanden genereren in {SHARD_MAP}/ met Remote MCP: {MCP_SERVER_URL}")
+        manifest = {
+            "source": args.excel,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "model": MODEL_NAAM,
+            "rows": len(df),
+            "dedup": not args.no_dedup,
+            "index": INDEX_BESTAND,
+            "complete": False,
+            "shards": [],
+        }
+        bewaar_manifest(manifest)
+        with open(INDEX_BESTAND, "w", encoding="utf-8") as index:
+            manifest["shards"] = schrijf_shards(bouw_requests(df, index, dedup=not args.no_dedup), SHARD_MAP)
+        requests = sum(shard["requests"] for shard in manifest["shards"])
+        manifest["requests"] = requests
+        manifest["reduction_ratio"] = round(1 - requests / len(df), 4) if len(df) else 0.0
+        manifest["complete"] = True
+        bewaar_manifest(manifest)
+        print(
+            f"   {len(df)} regels -> {requests} unieke requests "
+            f"(reductie {manifest['reduction_ratio']:.1%}), verdeeld over {len(manifest['shards'])} shard(s)"
+        )
+
+    if args.dry_run:
+        return
 
+    gelukt = asyncio.run(submit(manifest, args.concurrency))
+
+    batch_ids = [s["batch_id"] for s in manifest["shards"] if s["batch_id"]]
     print("-" * 40)
-    print(f"BATCH ID: {batch_job.id}")
+    for batch_id in batch_ids:
+        print(f"BATCH ID: {batch_id}")
     print("-" * 40)
-    
-    with open("batch_id_deep.txt", "w") as f:
-        f.write(batch_job.id)
+
+    with open(BATCH_ID_BESTAND, "w") as f:
+        f.write("\n".join(batch_ids))
+
+    if not gelukt:
+        print("Niet alle shards zijn gestart; draai het script opnieuw om te hervatten.")
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
     main()
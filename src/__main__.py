@@ -0,0 +1,5 @@
+"""`python -m src`: serve create_app() with the settings from src/serving.py."""
+from .serving import run
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,361 @@
+"""Per-tenant weighted fair queueing and load shedding for tool calls.
+
+A tenant is the resolved Serper API key (as a hash, see `api_key_namespace`).
+Without admission control one shop's batch of thousands of rows can take
+every slot of a task, and the other keys only see timeouts. Every `tools/call`
+POST on /mcp therefore first takes a slot from the worker's `FairQueue`:
+
+- At most ADMISSION_CAPACITY tool calls run at once per worker, and at most
+  the class cap per tenant.
+- Waiting tenants are served in start-time fair queueing order. Every slot a
+  tenant gets advances its virtual clock by 1/weight, so a tenant with weight
+  4 gets four slots for every one of a weight-1 tenant when both are
+  backlogged. A tenant that was idle does not bank credit.
+- A call that cannot start in time is rejected up front with `503` and
+  `Retry-After`. That covers a full per-tenant queue (ADMISSION_MAX_QUEUE),
+  and an estimated wait beyond ADMISSION_QUEUE_TIMEOUT. The estimate is the
+  tenant's queue, its fair share of the slots and the recent mean service
+  time. A call still waiting at the deadline gets the same 503.
+
+Tenant classes come from ADMISSION_CLASSES (`name=weight/cap,...`). Tenants
+are put in a class with ADMISSION_TENANTS (`<tenant hash>=<class>,...`; with
+STATS_TOKEN set the hashes are listed under `admission` in /stats). Everything
+else is `default`.
+Metrics are labelled by class, never by tenant.
+"""
+import asyncio
+import collections
+import json
+import logging
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+from . import timing
+from .cache import api_key_namespace
+from .config import env_bool, env_float, env_int, env_str
+from .metrics import ADMISSION_SHED, ADMISSION_WAIT
+
+ADMISSION_ENABLED = env_bool("ADMISSION_ENABLED", True)
+ADMISSION_CAPACITY = env_int("ADMISSION_CAPACITY", 64)
+ADMISSION_QUEUE_TIMEOUT = env_float("ADMISSION_QUEUE_TIMEOUT", 20)
+ADMISSION_MAX_QUEUE = env_int("ADMISSION_MAX_QUEUE", 200)
+# name=weight/cap; `default` is used for tenants without a class. Without a cap
+# a tenant may use every idle slot, so the queue stays work-conserving.
+ADMISSION_CLASSES = env_str("ADMISSION_CLASSES", "default=1")
+ADMISSION_TENANTS = env_str("ADMISSION_TENANTS", "")
+# Bodies larger than this are not read to classify them; they queue as a tool call
+ADMISSION_PEEK_BYTES = env_int("ADMISSION_PEEK_BYTES", 64 * 1024)
+
+DEFAULT_CLASS = "default"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_classes(spec, capacity=ADMISSION_CAPACITY):
+    """`interactive=4/16,batch=1/4` -> {name: (weight, cap)}; always has `default`.
+
+    A class without a cap gets `capacity`. Invalid entries are skipped with a
+    warning, like invalid env values in config.py.
+    """
+    classes = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if not name or not value:
+            continue
+        weight, _, cap = value.partition("/")
+        try:
+            classes[name.strip()] = (max(0.01, float(weight)), max(1, int(cap or capacity)))
+        except ValueError:
+            logger.warning("ADMISSION_CLASSES: ignoring invalid entry %r", item.strip())
+    classes.setdefault(DEFAULT_CLASS, (1.0, capacity))
+    return classes
+
+
+def parse_tenants(spec):
+    tenants = {}
+    for item in spec.split(","):
+        tenant, _, name = item.strip().partition("=")
+        if tenant and name:
+            tenants[tenant.strip()] = name.strip()
+    return tenants
+
+
+class Overloaded(Exception):
+    """A tool call that cannot start in time; answered with 503 + Retry-After."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Tenant:
+    __slots__ = ("id", "tenant_class", "weight", "cap", "in_flight", "waiters", "finish")
+
+    def __init__(self, id, tenant_class, weight, cap):
+        self.id = id
+        self.tenant_class = tenant_class
+        self.weight = weight
+        self.cap = cap
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        # Virtual time at which this tenant's last granted slot "finishes"
+        self.finish = 0.0
+
+
+class ClassStats:
+    __slots__ = ("admitted", "shed", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.admitted = 0
+        self.shed = collections.Counter()
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class FairQueue:
+    """Weighted fair slots for tool calls, with per-tenant caps and deadlines."""
+
+    def __init__(
+        self,
+        capacity=ADMISSION_CAPACITY,
+        classes=None,
+        tenant_classes=None,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        max_tenants=1024,
+    ):
+        self.capacity = max(1, capacity)
+        self.classes = classes if classes is not None else parse_classes(ADMISSION_CLASSES, self.capacity)
+        self.classes.setdefault(DEFAULT_CLASS, (1.0, self.capacity))
+        self.tenant_classes = tenant_classes if tenant_classes is not None else parse_tenants(ADMISSION_TENANTS)
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.max_tenants = max_tenants
+        self.in_flight = 0
+        self.vclock = 0.0
+        # EWMA of how long a slot is held, for the wait estimate
+        self.service_time = None
+        self._tenants = collections.OrderedDict()
+        self.class_stats = collections.defaultdict(ClassStats)
+
+    @property
+    def queued(self):
+        return sum(len(t.waiters) for t in self._tenants.values())
+
+    def tenant(self, tenant_id):
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            name = self.tenant_classes.get(tenant_id, DEFAULT_CLASS)
+            if name not in self.classes:
+                name = DEFAULT_CLASS
+            weight, cap = self.classes[name]
+            tenant = self._tenants[tenant_id] = Tenant(tenant_id, name, weight, cap)
+            # Forget idle tenants so the table stays bounded
+            if len(self._tenants) > self.max_tenants:
+                for old_id, old in list(self._tenants.items()):
+                    if not old.in_flight and not old.waiters and old_id != tenant_id:
+                        del self._tenants[old_id]
+                        break
+        else:
+            self._tenants.move_to_end(tenant_id)
+        return tenant
+
+    def estimate_wait(self, tenant):
+        """Rough seconds until a new call of `tenant` would start, or 0 when it can start now."""
+        if self._can_start(tenant) and not tenant.waiters and not self._others_eligible(tenant):
+            return 0.0
+        if self.service_time is None:
+            return 0.0
+        active = [t for t in self._tenants.values() if t.in_flight or t.waiters or t is tenant]
+        total_weight = sum(t.weight for t in active)
+        share = min(tenant.cap, self.capacity * tenant.weight / total_weight)
+        return (len(tenant.waiters) + 1) / max(share, 1e-6) * self.service_time
+
+    async def acquire(self, tenant_id):
+        """Wait for a slot; returns the Tenant to pass to release(). Raises Overloaded."""
+        tenant = self.tenant(tenant_id)
+        stats = self.class_stats[tenant.tenant_class]
+        if len(tenant.waiters) >= self.max_queue:
+            raise self._shed(tenant, "queue_full", self.estimate_wait(tenant) or self.queue_timeout)
+        estimate = self.estimate_wait(tenant)
+        if estimate > self.queue_timeout:
+            raise self._shed(tenant, "deadline", estimate)
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        tenant.waiters.append(waiter)
+        # Free capacity goes out in fair order right away, possibly to this call
+        self._dispatch()
+        try:
+            if not waiter.done():
+                await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we gave up: pass it on
+                self.release(tenant)
+            else:
+                waiter.cancel()
+                if waiter in tenant.waiters:
+                    tenant.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed(tenant, "timeout", self.estimate_wait(tenant) or self.queue_timeout) from None
+            raise
+        waited = time.monotonic() - started
+        stats.admitted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        ADMISSION_WAIT.labels(tenant.tenant_class).observe(waited)
+        return tenant
+
+    def release(self, tenant, held=None):
+        tenant.in_flight -= 1
+        self.in_flight -= 1
+        if held is not None:
+            self.service_time = held if self.service_time is None else 0.9 * self.service_time + 0.1 * held
+        self._dispatch()
+
+    def _can_start(self, tenant):
+        return self.in_flight < self.capacity and tenant.in_flight < tenant.cap
+
+    def _others_eligible(self, tenant):
+        return any(t.waiters and t.in_flight < t.cap for t in self._tenants.values() if t is not tenant)
+
+    def _grant(self, tenant):
+        start = max(self.vclock, tenant.finish)
+        tenant.finish = start + 1.0 / tenant.weight
+        self.vclock = start
+        tenant.in_flight += 1
+        self.in_flight += 1
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity:
+            eligible = [t for t in self._tenants.values() if t.waiters and t.in_flight < t.cap]
+            if not eligible:
+                return
+            # Smallest virtual start time first; ties go to the heavier tenant
+            tenant = min(eligible, key=lambda t: (max(self.vclock, t.finish), -t.weight))
+            waiter = tenant.waiters.popleft()
+            if waiter.done():
+                continue
+            self._grant(tenant)
+            waiter.set_result(None)
+
+    def _shed(self, tenant, reason, retry_after):
+        self.class_stats[tenant.tenant_class].shed[reason] += 1
+        ADMISSION_SHED.labels(tenant.tenant_class, reason).inc()
+        return Overloaded(reason, retry_after)
+
+    def stats(self, tenants=False):
+        """Totals per class; with `tenants` also the busiest tenant hashes."""
+        per_class = {}
+        for name, (weight, cap) in self.classes.items():
+            per_class[name] = {"weight": weight, "cap": cap, "tenants": 0, "in_flight": 0, "queued": 0}
+        for tenant in self._tenants.values():
+            summary = per_class[tenant.tenant_class]
+            summary["tenants"] += 1
+            summary["in_flight"] += tenant.in_flight
+            summary["queued"] += len(tenant.waiters)
+        for name, stats in self.class_stats.items():
+            summary = per_class[name]
+            waited = stats.admitted or 1
+            summary.update({
+                "admitted": stats.admitted,
+                "shed": dict(stats.shed),
+                "mean_wait_ms": round(stats.wait_total / waited * 1000, 1),
+                "max_wait_ms": round(stats.wait_max * 1000, 1),
+            })
+        report = {
+            "enabled": ADMISSION_ENABLED,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queue_timeout_s": self.queue_timeout,
+            "service_time_ms": round(self.service_time * 1000, 1) if self.service_time else None,
+            "classes": per_class,
+        }
+        if tenants:
+            # Tenant hashes only; put one in ADMISSION_TENANTS to give it a class
+            busy = [t for t in self._tenants.values() if t.in_flight or t.waiters]
+            report["busy_tenants"] = {
+                t.id: {"class": t.tenant_class, "in_flight": t.in_flight, "queued": len(t.waiters)} for t in busy[:20]
+            }
+        return report
+
+
+fair_queue = FairQueue()
+
+
+def is_tool_call(body):
+    try:
+        message = json.loads(body)
+    except ValueError:
+        return None
+    messages = message if isinstance(message, list) else [message]
+    for m in messages:
+        if isinstance(m, dict) and m.get("method") == "tools/call":
+            return m
+    return None
+
+
+class AdmissionMiddleware:
+    """Pure ASGI layer behind FrontDoorMiddleware: one fair-queue slot per tools/call POST."""
+
+    def __init__(self, app, queue=None):
+        self.app = app
+        self.queue = queue or fair_queue
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != "/mcp":
+            return await self.app(scope, receive, send)
+
+        # Read the (small) JSON-RPC body to see whether it calls a tool, then replay it.
+        # Past ADMISSION_PEEK_BYTES stop reading and parsing: the rest streams through once a slot is free.
+        messages = []
+        body = b""
+        oversized = False
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if len(body) > ADMISSION_PEEK_BYTES:
+                oversized = True
+                break
+            if not message.get("more_body", False):
+                break
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        # A body too large to classify is queued like a tool call, so it cannot skip the queue
+        call = {} if oversized else is_tool_call(body)
+        if call is None:
+            return await self.app(scope, replay, send)
+
+        tenant_id = api_key_namespace(scope.get("state", {}).get("api_key"))
+        started = time.perf_counter()
+        try:
+            tenant = await self.queue.acquire(tenant_id)
+        except Overloaded as e:
+            response = JSONResponse(
+                {
+                    "jsonrpc": "2.0",
+                    "id": call.get("id"),
+                    "error": {"code": -32000, "message": f"Server busy ({e.reason}), retry after {e.retry_after}s"},
+                },
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            return await response(scope, replay, send)
+        granted = time.perf_counter()
+        timing.add("queue", granted - started)
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            self.queue.release(tenant, time.perf_counter() - granted)
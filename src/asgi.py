@@ -0,0 +1,13 @@
+"""Helpers shared by the pure ASGI layers (timing, compression)."""
+
+
+def is_event_stream(headers):
+    """True when ASGI response headers declare `text/event-stream`.
+
+    ASGI asks for lowercase header names, but not every app sends them, so
+    names and the media type are compared case-insensitively.
+    """
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            return value.strip().lower().startswith(b"text/event-stream")
+    return False
@@ -0,0 +1,196 @@
+"""Tiered result cache for the `search` tool.
+
+Tier one is a bounded in-memory LRU with a TTL per entry. Tier two is an
+optional SQLite database in WAL mode (SEARCH_CACHE_PATH) so results survive a
+restart and can be shared by several workers on one host.
+
+Keys are built from the normalized query plus the Serper payload parameters
+(`gl`, `hl`, `num`) and are namespaced by a hash of the caller's API key, so
+one tenant never sees results paid for by another and raw keys never touch
+disk.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .config import env_bool, env_float, env_int, env_str
+
+CACHE_ENABLED = env_bool("SEARCH_CACHE_ENABLED", True)
+CACHE_TTL = env_float("SEARCH_CACHE_TTL", 24 * 3600)
+CACHE_MAX_ENTRIES = env_int("SEARCH_CACHE_SIZE", 2048)
+CACHE_PATH = env_str("SEARCH_CACHE_PATH", "")
+
+
+def normalize_query(query):
+    """Case-, width- and whitespace-insensitive form of a search query."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def api_key_namespace(api_key):
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def cache_key(api_key, payload):
+    parts = [
+        api_key_namespace(api_key),
+        normalize_query(str(payload.get("q", ""))),
+        str(payload.get("gl", "")),
+        str(payload.get("hl", "")),
+        str(payload.get("num", "")),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class LRUCache:
+    """Bounded LRU with per-entry expiry. Not thread-safe; used from the event loop."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, now=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= (now or time.time()):
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires_at=None):
+        if self.max_entries <= 0:
+            return
+        self._data[key] = (expires_at or time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+
+class SQLiteStore:
+    """Persistent second tier. Calls are blocking and run in a worker thread."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._writes = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            self._writes += 1
+            # Expired rows are purged lazily, once every 500 writes
+            if self._writes % 500 == 0:
+                self._conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SearchCache:
+    """Memory LRU in front of an optional SQLite store, with hit/miss counters."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, path=CACHE_PATH, enabled=CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = SQLiteStore(path, ttl) if (enabled and path) else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+
+    async def get(self, api_key, payload):
+        if not self.enabled:
+            return None
+        key = cache_key(api_key, payload)
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            found = await asyncio.to_thread(self.disk.get, key)
+            if found is not None:
+                value, expires_at = found
+                self.memory.set(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, api_key, payload, value):
+        if not self.enabled:
+            return
+        key = cache_key(api_key, payload)
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at)
+        self.stores += 1
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires_at)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": self.disk is not None,
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "stores": self.stores,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+search_cache = SearchCache()
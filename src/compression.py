@@ -0,0 +1,267 @@
+"""Negotiated gzip / brotli compression that keeps SSE streams streaming.
+
+`fetch` results run to hundreds of KB of markdown and `search` results are
+verbose JSON. FastMCP answers tool calls either as one JSON body or as a
+`text/event-stream`. A buffering GZip middleware would hold an event stream
+back until it ends. `CompressionMiddleware` handles the two cases separately:
+
+- Plain bodies are buffered up to COMPRESS_MIN_BYTES. A smaller complete body
+  goes out unchanged. Anything larger is compressed, in one shot when the
+  body is complete (with a new Content-Length), otherwise as a stream.
+- Event streams get their (compressed) headers as soon as the app starts
+  the response, because a stateful session's GET stream can idle for
+  minutes before its first event. Every body message is compressed and
+  followed by a flush (Z_SYNC_FLUSH / brotli flush). The client can decode
+  each event as soon as it arrives, so progress notifications stay live.
+  The compression window carries over between events, so repeated keys
+  compress well.
+
+The encoding is picked from Accept-Encoding in the order of COMPRESS_ENCODINGS.
+brotli is only offered when the `brotli` package is installed
+(`pip install .[brotli]`). COMPRESS_LEVEL trades CPU for bytes: `fast`,
+`balanced` or `max`.
+
+Responses that already have a Content-Encoding, non-text content types and
+statuses without a body pass through untouched.
+"""
+import time
+import zlib
+
+from . import timing
+from .asgi import is_event_stream
+from .config import env_bool, env_int, env_str
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip only
+    brotli = None
+
+COMPRESS_ENABLED = env_bool("COMPRESS_ENABLED", True)
+COMPRESS_MIN_BYTES = env_int("COMPRESS_MIN_BYTES", 1024)
+# Server preference; the first one the client accepts wins
+COMPRESS_ENCODINGS = [e.strip() for e in env_str("COMPRESS_ENCODINGS", "br,gzip").split(",") if e.strip()]
+COMPRESS_LEVEL = env_str("COMPRESS_LEVEL", "fast")
+
+# (gzip level, brotli quality) per preset
+LEVELS = {"fast": (1, 1), "balanced": (6, 4), "max": (9, 9)}
+
+COMPRESSIBLE_TYPES = ("text/", "application/json")
+NO_BODY_STATUSES = (204, 304)
+
+
+def available_encodings():
+    return [e for e in COMPRESS_ENCODINGS if e == "gzip" or (e == "br" and brotli is not None)]
+
+
+def negotiate(accept_encoding, offered=None):
+    """Pick an encoding from an Accept-Encoding header value, or None for identity."""
+    offered = available_encodings() if offered is None else offered
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class GzipEncoder:
+    __slots__ = ("_z",)
+
+    def __init__(self, level):
+        # wbits 31 = gzip container
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush):
+        out = self._z.compress(data)
+        return out + self._z.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    __slots__ = ("_c",)
+
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data, flush):
+        out = self._c.process(data)
+        return out + self._c.flush() if flush else out
+
+    def finish(self):
+        return self._c.finish()
+
+
+def make_encoder(encoding, level=None):
+    gzip_level, brotli_quality = LEVELS.get(level or COMPRESS_LEVEL, LEVELS["fast"])
+    if encoding == "br":
+        return BrotliEncoder(brotli_quality)
+    return GzipEncoder(gzip_level)
+
+
+def compressible(headers):
+    content_type = ""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value.decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compressed_headers(headers, encoding, length=None):
+    out = [(name, value) for name, value in headers if name not in (b"content-length", b"vary")]
+    vary = [value for name, value in headers if name == b"vary"]
+    out.append((b"content-encoding", encoding.encode("latin-1")))
+    out.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    if length is not None:
+        out.append((b"content-length", str(length).encode("latin-1")))
+    return out
+
+
+def with_vary(headers):
+    if any(name == b"vary" for name, _ in headers):
+        return headers
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+
+class CompressionStats:
+    def __init__(self):
+        self.responses = {}
+        self.streams = 0
+        self.skipped_small = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "enabled": COMPRESS_ENABLED,
+            "encodings": available_encodings(),
+            "level": COMPRESS_LEVEL,
+            "min_bytes": COMPRESS_MIN_BYTES,
+            "responses": dict(self.responses),
+            "streams": self.streams,
+            "skipped_small": self.skipped_small,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_in / self.bytes_out, 2) if self.bytes_out else None,
+            "cpu_ms": round(self.seconds * 1000, 1),
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """Pure ASGI layer: gzip / brotli for JSON bodies and, event by event, for SSE."""
+
+    def __init__(self, app, min_bytes=None, level=None):
+        self.app = app
+        self.min_bytes = COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESS_ENABLED:
+            return await self.app(scope, receive, send)
+        accept = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value
+                break
+        encoding = negotiate(accept.decode("latin-1")) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        stats = compression_stats
+        state = {"start": None, "buffer": [], "size": 0, "encoder": None, "stream": False, "passthrough": False}
+
+        def encode(data, flush, last):
+            started = time.perf_counter()
+            encoder = state["encoder"]
+            out = encoder.compress(data, flush and not last)
+            if last:
+                out += encoder.finish()
+            elapsed = time.perf_counter() - started
+            stats.seconds += elapsed
+            stats.bytes_in += len(data)
+            stats.bytes_out += len(out)
+            timing.add("compress", elapsed)
+            return out
+
+        async def send_start(headers):
+            start = state["start"]
+            state["start"] = None
+            await send({**start, "headers": headers})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if message["status"] < 200 or message["status"] in NO_BODY_STATUSES or not compressible(headers):
+                    state["passthrough"] = True
+                    return await send(message)
+                if is_event_stream(headers):
+                    state["stream"] = True
+                    state["encoder"] = make_encoder(encoding, self.level)
+                    stats.responses[encoding] = stats.responses.get(encoding, 0) + 1
+                    stats.streams += 1
+                    return await send({**message, "headers": compressed_headers(headers, encoding)})
+                state["start"] = {**message, "headers": headers}
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if state["encoder"] is not None:
+                # Already compressing: events are flushed one by one, plain bodies only at the end
+                out = encode(body, state["stream"], not more)
+                if out or not more:
+                    await send({"type": "http.response.body", "body": out, "more_body": more})
+                return
+
+            state["buffer"].append(body)
+            state["size"] += len(body)
+            if more and state["size"] < self.min_bytes:
+                return  # keep buffering until the threshold or the end
+            data = b"".join(state["buffer"])
+            state["buffer"] = []
+            start_headers = state["start"]["headers"]
+            if not more and state["size"] < self.min_bytes:
+                stats.skipped_small += 1
+                await send_start(with_vary(start_headers))
+                return await send({"type": "http.response.body", "body": data, "more_body": False})
+            state["encoder"] = make_encoder(encoding, self.level)
+            stats.responses[encoding] = stats.responses.get(encoding, 0) + 1
+            out = encode(data, False, not more)
+            if not more:
+                # Complete body: one shot, with the compressed length
+                await send_start(compressed_headers(start_headers, encoding, len(out)))
+                return await send({"type": "http.response.body", "body": out, "more_body": False})
+            await send_start(compressed_headers(start_headers, encoding))
+            await send({"type": "http.response.body", "body": out, "more_body": True})
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if state["start"] is not None:
+                # App ended without a final body message: flush what was held back
+                start = state["start"]
+                state["start"] = None
+                await send(start)
+                if state["buffer"]:
+                    await send({"type": "http.response.body", "body": b"".join(state["buffer"]), "more_body": False})
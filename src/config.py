@@ -0,0 +1,37 @@
+"""Environment-variable helpers shared by the server modules.
+
+All tuning knobs are read from the environment (or `.env` via python-dotenv),
+just like MCP_HOST / MCP_PORT. Invalid values fall back to the default instead
+of crashing the server at import time.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_str(name, default=""):
+    value = os.getenv(name)
+    return value if value not in (None, "") else default
+
+
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,560 @@
+"""Local HTML -> markdown extraction for `fetch` (FETCH_ENGINE=local, with r.jina.ai as fallback).
+
+The target page is downloaded directly and reduced to its main content in the
+style of Readability: scripts, navigation, footers, cookie banners and other
+boilerplate are dropped, text blocks are scored by length, commas and link
+density, and the best container (plus related siblings) is rendered as
+markdown with headings, lists, links and tables kept.
+
+Parsing is pure Python (stdlib `html.parser`) and CPU-bound, so it runs in a
+process pool (FETCH_EXTRACT_POOL=process, the default) or thread pool and never
+on the event loop. Pages whose extracted text is shorter than
+FETCH_LOCAL_MIN_CHARS (JavaScript shells, consent walls) are left to r.jina.ai.
+"""
+import asyncio
+import multiprocessing
+import re
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from .config import env_float, env_int, env_str
+
+# "jina" (every page via r.jina.ai) or "local" (direct download + extract_markdown, Jina as fallback)
+FETCH_ENGINE = env_str("FETCH_ENGINE", "jina")
+FETCH_EXTRACT_POOL = env_str("FETCH_EXTRACT_POOL", "process")
+FETCH_EXTRACT_WORKERS = env_int("FETCH_EXTRACT_WORKERS", 2)
+FETCH_LOCAL_MIN_CHARS = env_int("FETCH_LOCAL_MIN_CHARS", 200)
+# One direct attempt only: on any failure Jina (with its own retries) takes over
+FETCH_LOCAL_TIMEOUT = env_float("FETCH_LOCAL_TIMEOUT", 15.0)
+
+# Subtrees that never carry readable content
+SKIP_TAGS = frozenset([
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "button", "input", "select", "textarea", "option", "dialog", "head",
+    "nav", "aside", "footer",
+])
+VOID_TAGS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+])
+BLOCK_TAGS = frozenset([
+    "p", "div", "section", "article", "main", "header", "body", "html", "figure", "figcaption", "center",
+    "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "dl", "dt", "dd", "table", "pre", "blockquote",
+    "hr", "address", "details", "summary", "form", "fieldset",
+])
+# Rendered as block containers too, but not block-level for the parser (they don't close <p>)
+CONTAINER_TAGS = BLOCK_TAGS | {"tr", "td", "th", "thead", "tbody", "tfoot", "caption"}
+# Open tags that a new start tag closes implicitly
+IMPLIED_END = {
+    "p": {"p"},
+    "li": {"li"},
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+    "tr": {"tr", "td", "th"},
+    "td": {"td", "th"},
+    "th": {"td", "th"},
+    "option": {"option"},
+}
+# Tags that stop the search for an implicitly closed tag
+SCOPE_TAGS = {"li": {"ul", "ol"}, "tr": {"table"}, "td": {"tr", "table"}, "th": {"tr", "table"}}
+# A block start tag closes an open <p>, unless another block sits in between
+P_SCOPE = BLOCK_TAGS - {"p"} | {"td", "th"}
+
+UNLIKELY = re.compile(
+    r"-ad-|ad-break|agegate|banner|breadcrumb|combx|comment|community|consent|cookie|cover-wrap|disqus|"
+    r"extra|footer|gdpr|header|legends|menu|modal|newsletter|nav|pager|pagination|popup|promo|related|"
+    r"remark|replies|rss|share|shoutbox|sidebar|skyscraper|social|sponsor|subscribe|supplemental|"
+    r"toolbar|widget",
+    re.I,
+)
+MAYBE = re.compile(r"and|article|body|column|content|main|product|shadow|spec|detail", re.I)
+POSITIVE = re.compile(
+    r"article|body|content|entry|hentry|h-entry|main|page|pagination|post|text|blog|story|product|spec|"
+    r"detail|description|datasheet",
+    re.I,
+)
+NEGATIVE = re.compile(
+    r"-ad-|hidden|^hid$| hid$| hid |^hid |banner|combx|comment|com-|contact|cookie|foot|footer|"
+    r"footnote|gdpr|masthead|media|meta|modal|outbrain|promo|related|scroll|share|shoutbox|sidebar|"
+    r"skyscraper|sponsor|shopping|tags|tool|widget",
+    re.I,
+)
+HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden", re.I)
+SKIP_ROLES = frozenset(["navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog", "menu", "menubar"])
+WHITESPACE = re.compile(r"\s+")
+
+
+class Node:
+    __slots__ = ("tag", "attrs", "children", "parent", "score", "text_len", "link_len")
+
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.children = []
+        self.parent = parent
+        self.score = None
+        self.text_len = 0
+        self.link_len = 0
+
+    def text(self):
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return "".join(parts)
+
+    def iter(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(c for c in reversed(node.children) if not isinstance(c, str))
+
+
+class TreeBuilder(HTMLParser):
+    """Forgiving HTML -> Node tree; drops SKIP_TAGS subtrees while parsing."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#root")
+        self.stack = [self.root]
+        # Skipped subtree: its tag and how many of those are open (other tags may never be closed)
+        self.skip_tag = None
+        self.skip_depth = 0
+        self.title = ""
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self.in_title = not self.title
+            return
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+            elif tag == "body" and self.skip_tag == "head":
+                self.skip_tag, self.skip_depth = None, 0  # </head> weggelaten
+            else:
+                return
+        if self.skip_depth:
+            return
+        if tag in SKIP_TAGS:
+            if tag not in VOID_TAGS:
+                self.skip_tag, self.skip_depth = tag, 1
+            return
+        if tag in BLOCK_TAGS:
+            self._close("p", scope=P_SCOPE)
+        for closes in IMPLIED_END.get(tag, ()):
+            self._close(closes, scope=SCOPE_TAGS.get(tag, ()))
+        node = Node(tag, {k: v or "" for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and not self.skip_depth and self.stack[-1].tag == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+            return
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+            return
+        self._close(tag)
+
+    def _close(self, tag, scope=()):
+        for i in range(len(self.stack) - 1, 0, -1):
+            open_tag = self.stack[i].tag
+            if open_tag == tag:
+                del self.stack[i:]
+                return
+            if open_tag in scope:
+                return
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif not self.skip_depth:
+            self.stack[-1].children.append(data)
+
+
+def is_boilerplate(node):
+    attrs = node.attrs
+    if "hidden" in attrs or attrs.get("aria-hidden") == "true" or HIDDEN_STYLE.search(attrs.get("style", "")):
+        return True
+    if attrs.get("role") in SKIP_ROLES:
+        return True
+    if node.tag in ("body", "html", "article", "main", "table", "tbody", "tr", "td", "th"):
+        return False
+    match = f"{attrs.get('class', '')} {attrs.get('id', '')}"
+    return bool(UNLIKELY.search(match)) and not MAYBE.search(match)
+
+
+def prune(root):
+    """Remove hidden and unlikely subtrees; a <header> only survives when it holds the <h1>."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        kept = []
+        for child in node.children:
+            if isinstance(child, str):
+                kept.append(child)
+            elif is_boilerplate(child):
+                continue
+            elif child.tag == "header" and not any(n.tag == "h1" for n in child.iter()):
+                continue
+            else:
+                kept.append(child)
+                stack.append(child)
+        node.children = kept
+
+
+def class_weight(node):
+    weight = 0
+    for value in (node.attrs.get("class", ""), node.attrs.get("id", "")):
+        if value:
+            if NEGATIVE.search(value):
+                weight -= 25
+            if POSITIVE.search(value):
+                weight += 25
+    return weight
+
+
+def initial_score(node):
+    score = class_weight(node)
+    if node.tag in ("div", "article", "main", "section"):
+        score += 5
+    elif node.tag in ("pre", "td", "blockquote", "table", "tbody"):
+        score += 3
+    elif node.tag in ("address", "ol", "ul", "dl", "dd", "dt", "li", "form"):
+        score -= 3
+    elif node.tag in ("h1", "h2", "h3", "h4", "h5", "h6", "th"):
+        score -= 5
+    return score
+
+
+def measure(root):
+    """Fill in text_len / link_len for every node in one bottom-up pass."""
+    order = list(root.iter())
+    for node in reversed(order):
+        text_len = link_len = 0
+        for child in node.children:
+            if isinstance(child, str):
+                text_len += len(child.strip())
+            else:
+                text_len += child.text_len
+                link_len += child.link_len
+        node.text_len = text_len
+        node.link_len = text_len if node.tag == "a" else link_len
+
+
+def link_density(node):
+    return node.link_len / node.text_len if node.text_len else 0.0
+
+
+def best_content(root):
+    """The highest scoring container, Readability style."""
+    for tag in ("article", "main"):
+        found = [n for n in root.iter() if n.tag == tag or (tag == "main" and n.attrs.get("role") == "main")]
+        if len(found) == 1 and found[0].text_len >= FETCH_LOCAL_MIN_CHARS:
+            return found[0]
+
+    candidates = []
+    for node in root.iter():
+        if node.tag not in ("p", "td", "pre", "li", "dd", "div", "section"):
+            continue
+        if node.tag != "p" and any(not isinstance(c, str) and c.tag in BLOCK_TAGS for c in node.children):
+            continue  # alleen elementen die zelf tekst dragen tellen als paragraaf
+        if node.text_len < 25:
+            continue
+        text = node.text()
+        score = 1 + text.count(",") + text.count(";") + min(len(text) // 100, 3)
+        parent, level = node.parent, 0
+        while parent is not None and parent.tag != "#root" and level < 3:
+            if parent.score is None:
+                parent.score = initial_score(parent)
+                candidates.append(parent)
+            # Ouder telt volledig, grootouder half, daarboven steeds minder
+            parent.score += score / (1 if level == 0 else 2 if level == 1 else level * 3)
+            parent, level = parent.parent, level + 1
+
+    if not candidates:
+        return root
+    for candidate in candidates:
+        candidate.score *= 1 - link_density(candidate)
+    top = max(candidates, key=lambda n: n.score)
+    # Een te smalle top (één tabelcel, één lijst) vervangen door de ouder met vergelijkbare score
+    while top.parent is not None and top.parent.tag != "#root" and top.parent.score is not None and (
+        top.parent.score >= top.score * 0.75
+    ):
+        top = top.parent
+    return top
+
+
+def with_siblings(top):
+    """Siblings of the top candidate that look like more of the same content."""
+    parent = top.parent
+    if parent is None or parent.tag == "#root":
+        return [top]
+    threshold = max(10.0, (top.score or 0) * 0.2)
+    kept = []
+    for sibling in parent.children:
+        if isinstance(sibling, str):
+            continue
+        if sibling is top:
+            kept.append(sibling)
+        elif sibling.score is not None and sibling.score >= threshold:
+            kept.append(sibling)
+        elif sibling.tag == "p" or sibling.tag == "table":
+            if sibling.text_len > 80 and link_density(sibling) < 0.25:
+                kept.append(sibling)
+    return kept
+
+
+class MarkdownRenderer:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def url(self, href):
+        href = href.strip()
+        if not href or href.startswith(("javascript:", "#", "data:", "mailto:")):
+            return None
+        return urljoin(self.base_url, href)
+
+    def inline(self, node):
+        if isinstance(node, str):
+            return WHITESPACE.sub(" ", node)
+        tag = node.tag
+        if tag == "br":
+            return "\n"
+        if tag == "img":
+            alt = WHITESPACE.sub(" ", node.attrs.get("alt", "")).strip()
+            src = self.url(node.attrs.get("src", ""))
+            return f"![{alt}]({src})" if alt and src else ""
+        content = "".join(self.inline(c) for c in node.children)
+        if tag == "a":
+            text = content.strip()
+            href = self.url(node.attrs.get("href", ""))
+            return f"[{text}]({href})" if text and href else content
+        if tag in ("strong", "b") and content.strip():
+            return f"**{content.strip()}** "
+        if tag in ("em", "i") and content.strip():
+            return f"*{content.strip()}* "
+        if tag == "code" and content.strip():
+            return f"`{content.strip()}`"
+        if tag in BLOCK_TAGS:
+            return f" {content} "
+        return content
+
+    def blocks(self, node, out, depth=0):
+        """Append markdown blocks for `node` to `out`."""
+        tag = node.tag
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            text = self.clean(self.inline_children(node))
+            if text:
+                out.append(f"{'#' * int(tag[1])} {text}")
+        elif tag in ("ul", "ol"):
+            self.list_block(node, out, depth)
+        elif tag == "table":
+            self.table(node, out)
+        elif tag == "pre":
+            out.append("```\n" + node.text().strip("\n") + "\n```")
+        elif tag == "blockquote":
+            inner = []
+            self.children_blocks(node, inner, depth)
+            if inner:
+                out.append("\n".join("> " + line for block in inner for line in block.split("\n")))
+        elif tag == "hr":
+            out.append("---")
+        elif tag == "dt":
+            text = self.clean(self.inline_children(node))
+            if text:
+                out.append(f"**{text}**")
+        else:
+            self.children_blocks(node, out, depth)
+
+    def inline_children(self, node):
+        return "".join(self.inline(c) for c in node.children)
+
+    def children_blocks(self, node, out, depth):
+        # Losse tekst en inline tags tussen blokken worden één paragraaf
+        buffer = []
+
+        def flush():
+            text = self.clean("".join(buffer))
+            if text:
+                out.append(text)
+            buffer.clear()
+
+        for child in node.children:
+            if isinstance(child, str) or child.tag not in CONTAINER_TAGS:
+                buffer.append(self.inline(child))
+            else:
+                flush()
+                self.blocks(child, out, depth)
+        flush()
+
+    def list_block(self, node, out, depth):
+        lines = []
+        number = 0
+        for item in node.children:
+            if isinstance(item, str) or item.tag != "li":
+                continue
+            number += 1
+            marker = f"{number}." if node.tag == "ol" else "-"
+            text = self.clean("".join(
+                self.inline(c) for c in item.children if isinstance(c, str) or c.tag not in ("ul", "ol")
+            ))
+            if text:
+                lines.append(f"{'  ' * depth}{marker} {text}")
+            for child in item.children:
+                if not isinstance(child, str) and child.tag in ("ul", "ol"):
+                    nested = []
+                    self.list_block(child, nested, depth + 1)
+                    lines.extend(nested)
+        if lines:
+            out.append("\n".join(lines))
+
+    def table(self, node, out):
+        rows = []
+        header = False
+        for row in node.iter():
+            if row.tag != "tr" or self.owning_table(row) is not node:
+                continue
+            cells = [c for c in row.children if not isinstance(c, str) and c.tag in ("td", "th")]
+            if not cells:
+                continue
+            if not rows and all(c.tag == "th" for c in cells):
+                header = True
+            rows.append([self.clean(self.inline_children(c)).replace("|", "\\|").replace("\n", " ") for c in cells])
+        rows = [r for r in rows if any(r)]
+        if not rows:
+            return
+        if any(t.tag == "table" for t in node.iter() if t is not node) or max(len(r) for r in rows) == 1:
+            # Layout tabel: cellen als gewone blokken
+            for row in node.iter():
+                if row.tag in ("td", "th") and self.owning_table(row) is node:
+                    self.children_blocks(row, out, 0)
+            return
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+        if not header:
+            rows.insert(0, [""] * width)
+        lines = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * width]
+        lines += ["| " + " | ".join(r) + " |" for r in rows[1:]]
+        out.append("\n".join(lines))
+
+    @staticmethod
+    def owning_table(node):
+        parent = node.parent
+        while parent is not None and parent.tag != "table":
+            parent = parent.parent
+        return parent
+
+    @staticmethod
+    def clean(text):
+        lines = [WHITESPACE.sub(" ", line).strip() for line in text.split("\n")]
+        return "\n".join(line for line in lines if line)
+
+
+def extract_markdown(html, url=""):
+    """Main content of an HTML document as markdown.
+
+    Returns {"title", "markdown", "text_chars"}; text_chars counts the visible
+    text, so callers can tell an empty JavaScript shell from a real page.
+    """
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    root = builder.root
+    prune(root)
+    measure(root)
+    top = best_content(root)
+    renderer = MarkdownRenderer(url)
+    out = []
+    for node in with_siblings(top):
+        renderer.blocks(node, out)
+    title = WHITESPACE.sub(" ", builder.title).strip()
+    markdown = "\n\n".join(out)
+    return {
+        "title": title,
+        "markdown": markdown,
+        "text_chars": len(WHITESPACE.sub("", markdown)),
+    }
+
+
+def render_page(page, url):
+    """The r.jina.ai reader layout, so the model sees the same shape from both engines."""
+    return f"Title: {page['title']}\n\nURL Source: {url}\n\nMarkdown Content:\n{page['markdown']}"
+
+
+class NeedsFallback(Exception):
+    """The page can't be served locally; the message is the reason, for /stats."""
+
+
+class ExtractPool:
+    """Lazily started executor for extract_markdown, shut down with the app."""
+
+    def __init__(self, kind=FETCH_EXTRACT_POOL, workers=FETCH_EXTRACT_WORKERS):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self._executor = None
+        self.jobs = 0
+
+    def executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: forking a process with a running event loop and threads is unsafe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="extract")
+        return self._executor
+
+    async def extract(self, html, url):
+        self.jobs += 1
+        if self.kind == "inline":
+            return extract_markdown(html, url)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor(), extract_markdown, html, url)
+        except BrokenExecutor:
+            # Een gecrashte worker maakt de hele pool onbruikbaar; de volgende call start een nieuwe
+            self.shutdown()
+            raise
+
+    async def warm(self):
+        """Start the workers before the first fetch needs them (startup warm-up)."""
+        await asyncio.gather(*(self.extract("<p>warm-up</p>", "") for _ in range(self.workers)))
+        return self.workers
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {"pool": self.kind, "workers": self.workers, "started": self._executor is not None, "jobs": self.jobs}
+
+
+extract_pool = ExtractPool()
+
+
+def with_extract_pool(app_lifespan):
+    """Wrap a Starlette lifespan so the extraction pool is shut down with the app."""
+
+    @asynccontextmanager
+    async def combined(app):
+        try:
+            async with app_lifespan(app) as state:
+                yield state
+        finally:
+            extract_pool.shutdown()
+
+    return combined
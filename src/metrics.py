@@ -0,0 +1,304 @@
+"""Prometheus metrics for the `/metrics` route.
+
+Series are labelled only by bounded values: tool name (unknown tools collapse
+into "unknown"), upstream name (serper / jina / direct), phase, route class and
+outcome. Raw queries, URLs and API keys never become labels.
+
+Counters that already live elsewhere (search cache, single-flight, limiters,
+circuit breakers, hedging, fetch buffer) are exported by `StatsCollector` at
+scrape time instead of being counted twice.
+"""
+import time
+
+from fastmcp.exceptions import NotFoundError
+from fastmcp.server.middleware import Middleware
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from . import timing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+TOOL_LATENCY = Histogram(
+    "mcp_tool_duration_seconds", "Tool call latency", ["tool"], buckets=LATENCY_BUCKETS
+)
+TOOL_CALLS = Counter("mcp_tool_calls_total", "Tool calls by outcome", ["tool", "outcome"])
+TOOL_RESPONSE_BYTES = Histogram(
+    "mcp_tool_response_bytes", "Size of tool results", ["tool"], buckets=SIZE_BUCKETS
+)
+TOOLS_IN_FLIGHT = Gauge("mcp_tools_in_flight", "Tool calls currently running")
+
+HTTP_IN_FLIGHT = Gauge("mcp_http_requests_in_flight", "HTTP requests in flight", ["route"])
+HTTP_REQUESTS = Counter("mcp_http_requests_total", "HTTP requests", ["route", "status_class"])
+HTTP_RESPONSE_BYTES = Histogram(
+    "mcp_http_response_bytes", "HTTP response body size", ["route"], buckets=SIZE_BUCKETS
+)
+
+UPSTREAM_PHASE = Histogram(
+    "mcp_upstream_phase_seconds",
+    "Upstream request phases: connect (TCP+TLS), ttfb, body",
+    ["upstream", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "mcp_upstream_responses_total", "Upstream responses", ["upstream", "status_class"]
+)
+UPSTREAM_ERRORS = Counter(
+    "mcp_upstream_errors_total",
+    "Upstream problems by kind (rate_limited, http_5xx, timeout, connection, circuit_open, queue_timeout)",
+    ["upstream", "kind"],
+)
+
+ADMISSION_WAIT = Histogram(
+    "mcp_admission_wait_seconds", "Time tool calls waited for a fair-queue slot", ["tenant_class"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_SHED = Counter(
+    "mcp_admission_shed_total", "Tool calls rejected with 503 (queue_full, deadline, timeout)", ["tenant_class", "reason"]
+)
+
+KNOWN_ROUTES = ("/mcp", "/sse", "/messages", "/healthcheck", "/ready", "/version", "/stats", "/metrics", "/debug", "/")
+
+
+def route_label(path):
+    for route in KNOWN_ROUTES:
+        if path == route or (route != "/" and path.startswith(route + "/")):
+            return route
+    return "other"
+
+
+class PhaseTracer:
+    """httpcore trace callback turning connection events into phase timings."""
+
+    __slots__ = ("upstream", "_started", "_request_sent")
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self._started = {}
+        self._request_sent = None
+
+    async def __call__(self, event, info):
+        # Events look like "http11.receive_response_headers.complete"
+        _, _, rest = event.partition(".")
+        step, _, state = rest.rpartition(".")
+        now = time.perf_counter()
+        if state == "started":
+            self._started[step] = now
+            if step == "send_request_headers":
+                self._request_sent = now
+            return
+        started = self._started.pop(step, None)
+        if started is None:
+            return
+        if step in ("connect_tcp", "start_tls"):
+            self.observe("connect", now - started)
+        elif step == "receive_response_headers" and self._request_sent is not None:
+            self.observe("ttfb", now - self._request_sent)
+        elif step == "receive_response_body":
+            self.observe("body", now - started)
+
+    def observe(self, phase, seconds):
+        UPSTREAM_PHASE.labels(self.upstream, phase).observe(seconds)
+        # Same numbers end up in the Server-Timing header of the request that made the call
+        timing.add(f"{self.upstream}-{phase}", seconds)
+
+
+def upstream_event_hooks(upstream):
+    """httpx event hooks that time every request made by one upstream client."""
+
+    async def on_request(request):
+        request.extensions["trace"] = PhaseTracer(upstream)
+
+    async def on_response(response):
+        UPSTREAM_RESPONSES.labels(upstream, f"{response.status_code // 100}xx").inc()
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+class ToolMetricsMiddleware(Middleware):
+    """FastMCP middleware recording latency, size and outcome per tool call."""
+
+    @staticmethod
+    def request_timing(context):
+        """The RequestTiming of the HTTP request carrying this call (see timing.py)."""
+        request = None
+        if context.fastmcp_context is not None:
+            try:
+                request = context.fastmcp_context.request_context.request
+            except (AttributeError, ValueError):
+                pass
+        state = getattr(request, "scope", {}).get("state") or {}
+        return state.get("timing") or timing.current.get()
+
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        started = time.perf_counter()
+        request_timing = self.request_timing(context)
+        timing_token = timing.current.set(request_timing)
+        TOOLS_IN_FLIGHT.inc()
+        outcome = "exception"
+        try:
+            result = await call_next(context)
+            text = "".join(getattr(block, "text", "") for block in result.content or [])
+            outcome = "error" if text.startswith("Error") else "ok"
+            TOOL_RESPONSE_BYTES.labels(tool).observe(len(text.encode()))
+            return result
+        except NotFoundError:
+            tool = "unknown"
+            raise
+        finally:
+            timing.current.reset(timing_token)
+            TOOLS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            TOOL_LATENCY.labels(tool).observe(elapsed)
+            if request_timing is not None:
+                request_timing.tools.append(tool)
+                request_timing.add("tool", elapsed)
+            TOOL_CALLS.labels(tool, outcome).inc()
+
+
+class HTTPMetricsMiddleware:
+    """Pure ASGI layer counting in-flight requests and response bytes per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = route_label(scope["path"])
+        status = [0]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(route).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.labels(route).dec()
+            HTTP_REQUESTS.labels(route, f"{status[0] // 100}xx").inc()
+            HTTP_RESPONSE_BYTES.labels(route).observe(size[0])
+
+
+class StatsCollector:
+    """Export the in-process counters of the cache, limiters, breakers and fetch."""
+
+    def describe(self):
+        # Nothing to pre-declare; avoids a collect() (and import cycle) at registration
+        return []
+
+    def collect(self):
+        from .admission import fair_queue
+        from .cache import search_cache
+        from .compression import compression_stats
+        from .page_store import page_store
+        from .sessions import session_stats
+        from .pages import fetch_stats, page_buffer
+        from .resilience import breakers, hedge_budget, limiters
+        from .upstream import UPSTREAM_TIMEOUTS, singleflight
+
+        cache = search_cache.stats()
+        hits = CounterMetricFamily("mcp_search_cache_hits", "Search cache hits", labels=["tier"])
+        hits.add_metric(["memory"], cache["memory_hits"])
+        hits.add_metric(["disk"], cache["disk_hits"])
+        yield hits
+        for name in ("misses", "bypasses", "evictions", "expirations", "stores"):
+            yield CounterMetricFamily(f"mcp_search_cache_{name}", f"Search cache {name}", value=cache[name])
+        yield GaugeMetricFamily("mcp_search_cache_entries", "Search cache entries in memory", value=cache["entries"])
+
+        yield CounterMetricFamily("mcp_singleflight_calls", "Upstream calls started", value=singleflight.calls)
+        yield CounterMetricFamily(
+            "mcp_singleflight_coalesced", "Callers that joined an in-flight call", value=singleflight.coalesced
+        )
+
+        limit = GaugeMetricFamily("mcp_limiter_min_limit", "Lowest adaptive limit across tenants", labels=["upstream"])
+        in_flight = GaugeMetricFamily("mcp_limiter_in_flight", "Upstream calls in flight", labels=["upstream"])
+        queued = GaugeMetricFamily("mcp_limiter_queued", "Calls waiting for upstream capacity", labels=["upstream"])
+        throttled = CounterMetricFamily("mcp_limiter_throttled", "Overload signals seen", labels=["upstream"])
+        for upstream, summary in limiters.stats()["upstreams"].items():
+            limit.add_metric([upstream], summary["min_limit"] or 0)
+            in_flight.add_metric([upstream], summary["in_flight"])
+            queued.add_metric([upstream], summary["queued"])
+            throttled.add_metric([upstream], summary["throttled"])
+        yield from (limit, in_flight, queued, throttled)
+        yield CounterMetricFamily("mcp_upstream_retries", "Upstream retries", value=limiters.retries)
+
+        state = GaugeMetricFamily(
+            "mcp_circuit_breaker_open",
+            "1 when the breaker is open or half-open; for direct, the number of hosts",
+            labels=["upstream"],
+        )
+        trips = CounterMetricFamily("mcp_circuit_breaker_trips", "Times the breaker opened", labels=["upstream"])
+        for upstream in UPSTREAM_TIMEOUTS:
+            # direct keeps one breaker per site; the host never becomes a label
+            upstream_breakers = list(breakers.hosts(upstream).values()) or [breakers.get(upstream)]
+            state.add_metric([upstream], sum(breaker.state != "closed" for breaker in upstream_breakers))
+            trips.add_metric([upstream], sum(breaker.trips for breaker in upstream_breakers))
+        yield from (state, trips)
+
+        yield CounterMetricFamily("mcp_fetch_hedges", "Hedged fetch attempts sent", value=hedge_budget.hedges)
+        yield CounterMetricFamily("mcp_fetch_hedge_wins", "Hedges that answered first", value=hedge_budget.hedge_wins)
+
+        fetch = fetch_stats.as_dict(page_buffer)
+        yield CounterMetricFamily("mcp_fetch_downloads", "Pages downloaded", value=fetch["downloads"])
+        yield CounterMetricFamily("mcp_fetch_truncated", "Pages cut off at the byte cap", value=fetch["truncated"])
+        yield CounterMetricFamily("mcp_fetch_buffer_hits", "Cursor reads served from the buffer", value=fetch["buffer_hits"])
+        yield GaugeMetricFamily("mcp_fetch_buffer_bytes", "Bytes held by the page buffer", value=fetch["buffer_bytes"])
+
+        store = page_store.stats()
+        lookups = CounterMetricFamily("mcp_fetch_store_lookups", "Page store lookups by outcome", labels=["outcome"])
+        for outcome in ("hits", "revalidated", "stale", "misses"):
+            lookups.add_metric([outcome], store[outcome])
+        yield lookups
+        yield CounterMetricFamily(
+            "mcp_fetch_store_bytes_saved", "Upstream bytes not downloaded thanks to the page store", value=store["bytes_saved"]
+        )
+        yield CounterMetricFamily("mcp_fetch_store_evictions", "Pages evicted from the store", value=store["evictions"])
+        yield GaugeMetricFamily("mcp_fetch_store_bytes", "Compressed bytes held by the page store", value=store["bytes"])
+
+        compression = compression_stats.as_dict()
+        responses = CounterMetricFamily("mcp_http_compressed_responses", "Responses sent compressed", labels=["encoding"])
+        for encoding, count in compression["responses"].items():
+            responses.add_metric([encoding], count)
+        yield responses
+        compressed = CounterMetricFamily(
+            "mcp_http_compression_bytes", "Response bytes before (in) and after (out) compression", labels=["direction"]
+        )
+        compressed.add_metric(["in"], compression["bytes_in"])
+        compressed.add_metric(["out"], compression["bytes_out"])
+        yield compressed
+        admission = fair_queue.stats()
+        queued = GaugeMetricFamily("mcp_admission_queued", "Tool calls waiting for a slot", labels=["tenant_class"])
+        running = GaugeMetricFamily("mcp_admission_in_flight", "Tool calls holding a slot", labels=["tenant_class"])
+        for name, summary in admission["classes"].items():
+            queued.add_metric([name], summary["queued"])
+            running.add_metric([name], summary["in_flight"])
+        yield from (queued, running)
+
+        sessions = session_stats.as_dict()
+        yield GaugeMetricFamily("mcp_sessions", "Open stateful MCP sessions", value=sessions["sessions"])
+        requests = CounterMetricFamily("mcp_session_requests", "/mcp requests by session handling", labels=["path"])
+        requests.add_metric(["created"], sessions["created"])
+        requests.add_metric(["reused"], sessions["reused"])
+        requests.add_metric(["stateless"], sessions["stateless"])
+        yield requests
+        fallbacks = CounterMetricFamily("mcp_session_fallbacks", "Session requests answered statelessly", labels=["reason"])
+        for reason, count in sessions["fallbacks"].items():
+            fallbacks.add_metric([reason], count)
+        yield fallbacks
+        evicted = CounterMetricFamily("mcp_session_evictions", "Sessions removed from the table", labels=["reason"])
+        for reason, count in sessions["evicted"].items():
+            evicted.add_metric([reason], count)
+        yield evicted
+        yield CounterMetricFamily(
+            "mcp_http_compression_seconds", "CPU time spent compressing responses", value=compression["cpu_ms"] / 1000
+        )
+
+
+REGISTRY.register(StatsCollector())
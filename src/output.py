@@ -0,0 +1,69 @@
+"""Output shaping and JSON encoding for the search tools.
+
+`full` keeps today's pretty-printed Serper.dev payload. `compact` drops the
+blocks agents never read (knowledge graph, people-also-ask, related searches,
+search parameters) and encodes without whitespace. `organic_only` returns just
+the organic results. An optional `fields` list projects each organic result
+onto the given keys.
+
+Encoding uses orjson when installed and falls back to the stdlib.
+"""
+import json
+
+from . import timing
+from .config import env_str
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+OUTPUT_MODES = ("full", "compact", "organic_only")
+DEFAULT_MODE = env_str("SEARCH_DEFAULT_MODE", "full")
+
+# Top-level Serper.dev blocks that compact mode keeps
+COMPACT_BLOCKS = ("answerBox", "organic", "shopping", "news", "topStories")
+# Keys of an organic result that compact mode keeps
+COMPACT_ORGANIC_FIELDS = ("title", "link", "snippet", "date", "price", "currency", "rating")
+
+
+def dumps(obj, pretty=False):
+    with timing.phase("encode"):
+        if orjson is not None:
+            option = orjson.OPT_INDENT_2 if pretty else 0
+            return orjson.dumps(obj, option=option).decode()
+        if pretty:
+            return json.dumps(obj, indent=2, ensure_ascii=False)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _project(item, fields):
+    return {key: item[key] for key in fields if key in item}
+
+
+def shape(data, mode="full", fields=None):
+    """Reduce one Serper.dev response according to `mode` and `fields`."""
+    if not isinstance(data, dict):
+        return data
+    organic = data.get("organic") or []
+    if mode == "organic_only":
+        return [_project(item, fields) for item in organic] if fields else organic
+    if mode == "compact":
+        shaped = {key: data[key] for key in COMPACT_BLOCKS if key in data}
+        shaped["organic"] = [_project(item, fields or COMPACT_ORGANIC_FIELDS) for item in organic]
+        return shaped
+    if fields:
+        return {**data, "organic": [_project(item, fields) for item in organic]}
+    return data
+
+
+def resolve_mode(mode):
+    """Validate a caller-supplied mode; empty means the server default."""
+    mode = (mode or DEFAULT_MODE).strip().lower()
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of: {', '.join(OUTPUT_MODES)}")
+    return mode
+
+
+def render(data, mode="full", fields=None):
+    return dumps(shape(data, mode, fields), pretty=(mode == "full"))
@@ -0,0 +1,402 @@
+"""Compressed, revalidating store of `fetch` results, keyed by normalized URL.
+
+Deep-research runs read the same datasheets and distributor pages for many
+articles. The store keeps every successful page so later fetches skip the
+download:
+
+- Bodies are compressed with zstd when `zstandard` is installed, else gzip.
+  They are written to FETCH_STORE_PATH (a directory under the system temp
+  dir by default). With FETCH_STORE_PATH=memory they stay in the worker's
+  memory instead, within FETCH_STORE_MEMORY_BYTES split over the workers.
+- The in-memory index holds metadata only: size, freshness and validators.
+  It is an LRU bounded by FETCH_STORE_MAX_ENTRIES and by FETCH_STORE_MAX_BYTES
+  of compressed data; evicting an entry deletes its file.
+- Pages read through r.jina.ai (or won by a direct hedge) are fresh for
+  FETCH_STORE_TTL and then fetched again. Pages the server downloaded itself (FETCH_ENGINE=local) keep the
+  origin's `ETag` / `Last-Modified`. After FETCH_STORE_REVALIDATE_AFTER they
+  are revalidated with a conditional GET, and a 304 serves the stored copy.
+  `Cache-Control: no-store` is honoured and `max-age` shortens freshness.
+
+Files are written atomically (temp file + rename), so several workers can
+share one directory. Each worker keeps its own index and budget, and a file
+another worker wrote is picked up on the first lookup.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .config import env_bool, env_float, env_int, env_str
+from .pages import PageBody
+from .serving import worker_count
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional, gzip is used instead
+    zstandard = None
+
+FETCH_STORE_ENABLED = env_bool("FETCH_STORE_ENABLED", True)
+# `memory` keeps the bodies in the worker instead of on disk
+FETCH_STORE_PATH = env_str("FETCH_STORE_PATH", os.path.join(tempfile.gettempdir(), "serper-fetch-store"))
+FETCH_STORE_TTL = env_float("FETCH_STORE_TTL", 24 * 3600)
+FETCH_STORE_REVALIDATE_AFTER = env_float("FETCH_STORE_REVALIDATE_AFTER", 3600)
+FETCH_STORE_MAX_BYTES = env_int("FETCH_STORE_MAX_BYTES", 256 * 1024 * 1024)
+# Per task, for FETCH_STORE_PATH=memory: every worker holds its own copy
+FETCH_STORE_MEMORY_BYTES = env_int("FETCH_STORE_MEMORY_BYTES", 32 * 1024 * 1024)
+FETCH_STORE_MAX_ENTRIES = env_int("FETCH_STORE_MAX_ENTRIES", 20_000)
+FETCH_STORE_CODEC = env_str("FETCH_STORE_CODEC", "zstd" if zstandard is not None else "gzip")
+
+# Query parameters that only track the click and never change the page
+TRACKING_PARAMS = frozenset(["gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "ref_src"])
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+MAGIC = b"PGS1"
+
+
+def normalize_url(url):
+    """Scheme/host lower-cased, default port, fragment and tracking parameters dropped, query sorted."""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def store_key(url):
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()[:32]
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def max_age(cache_control):
+    """`max-age` in seconds from a Cache-Control header, or None."""
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age":
+            try:
+                return max(0, int(value.strip('"')))
+            except ValueError:
+                return None
+    return None
+
+
+class StoredPage:
+    """Index entry: everything about a stored page except its body."""
+
+    __slots__ = (
+        "key", "url", "size", "raw_size", "codec", "fresh_until", "etag", "last_modified",
+        "source", "status_code", "bytes_read", "truncated", "body",
+    )
+
+    def __init__(self, key, size, **meta):
+        self.key = key
+        self.size = size
+        self.url = meta.get("url", "")
+        self.raw_size = meta.get("raw_size", 0)
+        self.codec = meta.get("codec", "gzip")
+        self.fresh_until = meta.get("fresh_until", 0.0)
+        self.etag = meta.get("etag")
+        self.last_modified = meta.get("last_modified")
+        self.source = meta.get("source", "jina")
+        self.status_code = meta.get("status_code", 200)
+        self.bytes_read = meta.get("bytes_read", 0)
+        self.truncated = meta.get("truncated", False)
+        self.body = None
+
+    def meta(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name not in ("key", "size", "body")}
+
+    def is_fresh(self):
+        return self.fresh_until > time.time()
+
+    def can_revalidate(self):
+        # Only pages we downloaded ourselves carry the origin's validators
+        return self.source == "local" and bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageStore:
+    """LRU index over compressed page bodies on disk (or in memory), with hit counters."""
+
+    def __init__(
+        self,
+        path=FETCH_STORE_PATH,
+        max_bytes=FETCH_STORE_MAX_BYTES,
+        max_entries=FETCH_STORE_MAX_ENTRIES,
+        ttl=FETCH_STORE_TTL,
+        revalidate_after=FETCH_STORE_REVALIDATE_AFTER,
+        codec=FETCH_STORE_CODEC,
+        enabled=FETCH_STORE_ENABLED,
+    ):
+        if path == "memory":
+            path = ""
+            max_bytes = min(max_bytes, FETCH_STORE_MEMORY_BYTES // worker_count())
+        self.enabled = enabled and max_bytes > 0 and max_entries > 0
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate_after = revalidate_after
+        self.codec = codec if codec in ("zstd", "gzip") and (codec != "zstd" or zstandard is not None) else "gzip"
+        self._index = OrderedDict()
+        self._memory = {}  # key -> compressed body when there is no path
+        self._loaded = not path
+        self._load_lock = asyncio.Lock()
+        self.size = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.stale = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+        self.bytes_saved = 0
+        self.raw_bytes_stored = 0
+        self.compressed_bytes_stored = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _read(self, key):
+        with open(self._file(key), "rb") as f:
+            blob = f.read()
+        if blob[:4] != MAGIC:
+            raise ValueError("not a page store file")
+        (length,) = struct.unpack(">I", blob[4:8])
+        meta = json.loads(blob[8:8 + length])
+        return meta, blob[8 + length:], len(blob)
+
+    def _write(self, key, meta, data):
+        # <path>/<2 hex>/<key>: magic, header length, JSON header, compressed body
+        target = self._file(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        header = json.dumps(meta).encode()
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + struct.pack(">I", len(header)) + header + data)
+        os.replace(tmp, target)
+
+    def _unlink(self, key):
+        try:
+            os.unlink(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self):
+        """(mtime, key, size) of every stored file, oldest first."""
+        found = []
+        if not os.path.isdir(self.path):
+            return found
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        return sorted(found)
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for _, key, size in await asyncio.to_thread(self._scan):
+                self._index[key] = StoredPage(key, size)
+                self.size += size
+            self._loaded = True
+            await self._evict()
+
+    def _load_body(self, key, entry):
+        if self.path:
+            meta, data, size = self._read(key)
+        else:
+            meta, data = entry.meta(), self._memory[key]
+            size = len(data)
+        return meta, decompress(data, meta.get("codec", "gzip")).decode("utf-8"), size
+
+    async def get(self, url):
+        """The stored page for `url` with its body, fresh or not, or None.
+
+        The caller clears `entry.body` when done, so the index keeps metadata only.
+        """
+        if not self.enabled:
+            return None
+        await self._ensure_loaded()
+        key = store_key(url)
+        entry = self._index.get(key)
+        if entry is None and not self.path:
+            self.misses += 1
+            return None
+        try:
+            meta, text, size = await asyncio.to_thread(self._load_body, key, entry)
+        except Exception as e:
+            # FileNotFoundError: evicted by another worker, or never stored
+            corrupt = not isinstance(e, FileNotFoundError)
+            self.errors += corrupt
+            self._forget(key, unlink=corrupt)
+            self.misses += 1
+            return None
+        if entry is None:
+            # Written by another worker after our scan
+            entry = self._index[key] = StoredPage(key, size)
+            self.size += size
+        if not entry.url:
+            # Scanned at startup: the metadata lives in the file header
+            for name, value in meta.items():
+                if name in StoredPage.__slots__ and name not in ("key", "size", "body"):
+                    setattr(entry, name, value)
+        self._index.move_to_end(key)
+        entry.body = PageBody(text, entry.bytes_read, entry.truncated, entry.status_code)
+        return entry
+
+    def record_hit(self, entry, revalidated=False):
+        if revalidated:
+            self.revalidated += 1
+            entry.fresh_until = time.time() + self.revalidate_after
+        else:
+            self.hits += 1
+        self.bytes_saved += entry.bytes_read
+
+    def record_stale(self):
+        self.stale += 1
+
+    def freshness(self, source, cache_control=None):
+        """Seconds a new entry stays fresh, or None when it must not be stored."""
+        directives = (cache_control or "").lower()
+        if "no-store" in directives:
+            return None
+        fresh_for = self.revalidate_after if source == "local" else self.ttl
+        age = max_age(cache_control)
+        if age is not None:
+            fresh_for = min(fresh_for, age)
+        return fresh_for
+
+    async def put(self, url, body, source, etag=None, last_modified=None, cache_control=None):
+        if not self.enabled:
+            return
+        fresh_for = self.freshness(source, cache_control)
+        if fresh_for is None:
+            return
+        await self._ensure_loaded()
+        key = store_key(url)
+        raw = body.text.encode("utf-8")
+        data = await asyncio.to_thread(compress, raw, self.codec)
+        if len(data) > self.max_bytes:
+            return
+        entry = StoredPage(
+            key,
+            len(data),
+            url=normalize_url(url),
+            raw_size=len(raw),
+            codec=self.codec,
+            fresh_until=time.time() + fresh_for,
+            etag=etag,
+            last_modified=last_modified,
+            source=source,
+            status_code=body.status_code,
+            bytes_read=body.bytes_read,
+            truncated=body.truncated,
+        )
+        if self.path:
+            try:
+                await asyncio.to_thread(self._write, key, entry.meta(), data)
+            except OSError:
+                self.errors += 1
+                return
+        self._forget(key, unlink=False)
+        if not self.path:
+            self._memory[key] = data
+        self._index[key] = entry
+        self.size += entry.size
+        self.stores += 1
+        self.raw_bytes_stored += len(raw)
+        self.compressed_bytes_stored += len(data)
+        await self._evict()
+
+    def _forget(self, key, unlink=False):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+        self._memory.pop(key, None)
+        if unlink and self.path:
+            self._unlink(key)
+
+    async def _evict(self):
+        victims = []
+        while self._index and (self.size > self.max_bytes or len(self._index) > self.max_entries):
+            key = next(iter(self._index))
+            self._forget(key)
+            victims.append(key)
+            self.evictions += 1
+        if victims and self.path:
+            await asyncio.to_thread(lambda: [self._unlink(key) for key in victims])
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.stale + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": bool(self.path),
+            "codec": self.codec,
+            "entries": len(self._index),
+            "max_entries": self.max_entries,
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "revalidate_after_seconds": self.revalidate_after,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "stale": self.stale,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_ratio": round((self.hits + self.revalidated) / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "compression_ratio": (
+                round(self.raw_bytes_stored / self.compressed_bytes_stored, 2) if self.compressed_bytes_stored else None
+            ),
+        }
+
+
+page_store = PageStore()
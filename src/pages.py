@@ -0,0 +1,162 @@
+"""Streaming, size-capped page bodies for the `fetch` tool.
+
+Upstream bodies are streamed and decoded incrementally with a hard byte cap,
+so a multi-megabyte page never sits in memory whole. Long documents are served
+to the model in `max_chars` chunks addressed by a character `cursor`; the
+decoded text lives in a short-lived per-URL buffer so paging through it does
+not download the page again.
+"""
+import codecs
+import time
+from collections import OrderedDict
+
+from .config import env_float, env_int
+
+FETCH_MAX_BYTES = env_int("FETCH_MAX_BYTES", 2 * 1024 * 1024)
+FETCH_DEFAULT_MAX_CHARS = env_int("FETCH_DEFAULT_MAX_CHARS", 100_000)
+FETCH_BUFFER_TTL = env_float("FETCH_BUFFER_TTL", 300.0)
+FETCH_BUFFER_MAX_BYTES = env_int("FETCH_BUFFER_MAX_BYTES", 64 * 1024 * 1024)
+
+
+class PageBody:
+    """Decoded (possibly truncated) page text plus how it was read."""
+
+    __slots__ = ("text", "bytes_read", "truncated", "status_code")
+
+    def __init__(self, text, bytes_read, truncated, status_code):
+        self.text = text
+        self.bytes_read = bytes_read
+        self.truncated = truncated
+        self.status_code = status_code
+
+
+async def read_capped(response, max_bytes=FETCH_MAX_BYTES):
+    """Read a streamed httpx response up to `max_bytes`, decoding as we go.
+
+    Stops pulling from the network as soon as the cap is reached; the caller's
+    `client.stream(...)` block then closes the connection.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    parts = []
+    bytes_read = 0
+    truncated = False
+    async for chunk in response.aiter_bytes():
+        remaining = max_bytes - bytes_read
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+            truncated = True
+        bytes_read += len(chunk)
+        parts.append(decoder.decode(chunk))
+        if truncated or bytes_read >= max_bytes:
+            truncated = True
+            break
+    parts.append(decoder.decode(b"", final=True))
+    return PageBody("".join(parts), bytes_read, truncated, response.status_code)
+
+
+def paginate(body, cursor=0, max_chars=FETCH_DEFAULT_MAX_CHARS):
+    """Return the chunk of `body.text` starting at `cursor`, with a paging footer."""
+    text = body.text
+    total = len(text)
+    start = min(max(0, cursor), total)
+    end = total if max_chars <= 0 else min(total, start + max_chars)
+    chunk = text[start:end]
+    notes = []
+    if end < total:
+        notes.append(
+            f"[Showing characters {start}-{end} of {total}. "
+            f"Call fetch again with cursor={end} for the next part.]"
+        )
+    elif start > 0:
+        notes.append(f"[Showing characters {start}-{end} of {total}. End of document.]")
+    if body.truncated and end >= total:
+        notes.append(f"[Document cut off after {body.bytes_read} bytes.]")
+    if notes:
+        chunk += "\n\n" + "\n".join(notes)
+    return chunk
+
+
+class PageBuffer:
+    """Per-URL buffer of decoded pages with a TTL and a total size budget."""
+
+    def __init__(self, ttl=FETCH_BUFFER_TTL, max_bytes=FETCH_BUFFER_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _weight(body):
+        # Upper bound for the str's footprint without walking it
+        return len(body.text) * 4
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at <= time.monotonic():
+            self._drop(url)
+            return None
+        self._entries.move_to_end(url)
+        return body
+
+    def put(self, url, body):
+        weight = self._weight(body)
+        if weight > self.max_bytes:
+            return
+        self._drop(url)
+        self._entries[url] = (time.monotonic() + self.ttl, body)
+        self.size += weight
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.size -= self._weight(entry[1])
+
+
+class FetchStats:
+    def __init__(self):
+        self.downloads = 0
+        self.buffer_hits = 0
+        self.truncated = 0
+        self.bytes_read = 0
+        self.peak_body_bytes = 0
+        self.local_pages = 0
+        self.local_fallbacks = {}
+        self.extract_seconds = 0.0
+
+    def record_fallback(self, reason):
+        self.local_fallbacks[reason] = self.local_fallbacks.get(reason, 0) + 1
+
+    def record(self, body):
+        self.downloads += 1
+        self.bytes_read += body.bytes_read
+        self.peak_body_bytes = max(self.peak_body_bytes, body.bytes_read)
+        if body.truncated:
+            self.truncated += 1
+
+    def as_dict(self, buffer):
+        return {
+            "downloads": self.downloads,
+            "buffer_hits": self.buffer_hits,
+            "truncated": self.truncated,
+            "bytes_read": self.bytes_read,
+            "peak_body_bytes": self.peak_body_bytes,
+            "local_pages": self.local_pages,
+            "local_fallbacks": self.local_fallbacks,
+            "extract_seconds": round(self.extract_seconds, 3),
+            "max_body_bytes": FETCH_MAX_BYTES,
+            "buffer_entries": len(buffer),
+            "buffer_bytes": buffer.size,
+            "buffer_max_bytes": buffer.max_bytes,
+        }
+
+
+page_buffer = PageBuffer()
+fetch_stats = FetchStats()
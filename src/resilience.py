@@ -0,0 +1,546 @@
+"""Adaptive concurrency limits and 429-aware retries per upstream.
+
+Serper.dev and r.jina.ai answer overload with 429s, 5xx and timeouts. Instead
+of hammering them (and letting the model retry immediately), every upstream
+call goes through an `AdaptiveLimiter` for its (upstream, tenant) pair:
+
+* AIMD: the concurrency limit grows by ~1 per window of successful calls and
+  shrinks multiplicatively on 429/5xx, timeouts or latency well above the
+  observed baseline.
+* `Retry-After` pauses the whole limiter until the upstream says it is ready.
+* Callers queue (FIFO) while capacity is short, until their deadline.
+
+`call_with_retries` wraps one logical upstream call with jittered exponential
+backoff under an overall deadline, behind a per-upstream `CircuitBreaker` that
+fails fast while the upstream is down.
+"""
+import asyncio
+import collections
+import email.utils
+import random
+import time
+
+import httpx
+
+from .config import env_bool, env_float, env_int, env_str
+from .metrics import UPSTREAM_ERRORS
+
+LIMIT_INITIAL = env_int("UPSTREAM_LIMIT_INITIAL", 16)
+LIMIT_MIN = env_int("UPSTREAM_LIMIT_MIN", 1)
+LIMIT_MAX = env_int("UPSTREAM_LIMIT_MAX", 64)
+LIMIT_BACKOFF = env_float("UPSTREAM_LIMIT_BACKOFF", 0.7)
+LATENCY_TOLERANCE = env_float("UPSTREAM_LATENCY_TOLERANCE", 3.0)
+RETRY_ATTEMPTS = env_int("UPSTREAM_RETRY_ATTEMPTS", 4)
+RETRY_BASE_DELAY = env_float("UPSTREAM_RETRY_BASE_DELAY", 0.25)
+RETRY_MAX_DELAY = env_float("UPSTREAM_RETRY_MAX_DELAY", 8.0)
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryableStatus(Exception):
+    """Upstream answered with a status worth retrying (429 / 5xx)."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(Exception):
+    """Gave up on an upstream call; the message is meant for the model."""
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def raise_for_retryable(response):
+    if response.status_code in RETRYABLE_STATUS:
+        raise RetryableStatus(response.status_code, parse_retry_after(response.headers.get("retry-after")))
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a FIFO wait queue and Retry-After pauses."""
+
+    def __init__(self, initial=LIMIT_INITIAL, minimum=LIMIT_MIN, maximum=LIMIT_MAX):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.baseline_latency = None
+        self._waiters = collections.deque()
+        self._last_decrease = 0.0
+        self._wake_handle = None
+        # Counters
+        self.queued_total = 0
+        self.throttled = 0
+        self.errors = 0
+        self.successes = 0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _has_capacity(self):
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.blocked_until
+
+    async def acquire(self, timeout=None):
+        if not self._waiters and self._has_capacity():
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        self._schedule_wake()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Capacity was handed to us just as we gave up: pass it on
+                self.in_flight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency=None, overloaded=False, error=False):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if overloaded:
+            self.throttled += 1
+            self._decrease(now)
+        elif error:
+            self.errors += 1
+        else:
+            self.successes += 1
+            if latency is not None:
+                baseline = self.baseline_latency
+                saturated = self.in_flight + 1 >= int(self.limit)
+                if saturated and baseline is not None and latency > baseline * LATENCY_TOLERANCE:
+                    # Latency blow-up at full capacity is an early overload signal
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.baseline_latency = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+        self._wake()
+
+    def pause(self, seconds):
+        """Stop handing out capacity for `seconds` (Retry-After)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self._schedule_wake()
+
+    def _decrease(self, now):
+        # At most one multiplicative decrease per baseline latency window
+        window = max(0.05, self.baseline_latency or 0.05)
+        if now - self._last_decrease >= window:
+            self.limit = max(self.minimum, self.limit * LIMIT_BACKOFF)
+            self._last_decrease = now
+
+    def _wake(self):
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._schedule_wake()
+
+    def _schedule_wake(self):
+        delay = self.blocked_until - time.monotonic()
+        if self._waiters and delay > 0 and self._wake_handle is None:
+
+            def wake():
+                self._wake_handle = None
+                self._wake()
+
+            self._wake_handle = asyncio.get_running_loop().call_later(delay, wake)
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queued_total": self.queued_total,
+            "paused_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "baseline_latency_ms": round(self.baseline_latency * 1000, 1) if self.baseline_latency else None,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "errors": self.errors,
+        }
+
+
+class LimiterRegistry:
+    """One limiter per (upstream, tenant); tenant is an API-key hash or ''."""
+
+    def __init__(self, max_tenants=1024):
+        self.max_tenants = max_tenants
+        self._limiters = collections.OrderedDict()
+        self.retries = 0
+        self.gave_up = 0
+
+    def get(self, upstream, tenant=""):
+        key = (upstream, tenant)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = AdaptiveLimiter()
+            # Forget idle tenants so the table stays bounded
+            if len(self._limiters) > self.max_tenants:
+                for old_key, old in list(self._limiters.items()):
+                    if old.in_flight == 0 and not old.queued and old_key != key:
+                        del self._limiters[old_key]
+                        break
+        else:
+            self._limiters.move_to_end(key)
+        return limiter
+
+    def stats(self):
+        per_upstream = {}
+        for (upstream, _), limiter in self._limiters.items():
+            summary = per_upstream.setdefault(
+                upstream, {"tenants": 0, "in_flight": 0, "queued": 0, "throttled": 0, "min_limit": None}
+            )
+            summary["tenants"] += 1
+            summary["in_flight"] += limiter.in_flight
+            summary["queued"] += limiter.queued
+            summary["throttled"] += limiter.throttled
+            limit = round(limiter.limit, 2)
+            summary["min_limit"] = limit if summary["min_limit"] is None else min(summary["min_limit"], limit)
+        return {"retries": self.retries, "gave_up": self.gave_up, "upstreams": per_upstream}
+
+
+limiters = LimiterRegistry()
+
+
+# Circuit breakers, one per upstream host: `direct` fetches any site, so it gets one per URL host
+BREAKER_WINDOW = env_float("BREAKER_WINDOW", 30.0)
+BREAKER_MIN_CALLS = env_int("BREAKER_MIN_CALLS", 10)
+BREAKER_FAILURE_RATIO = env_float("BREAKER_FAILURE_RATIO", 0.5)
+BREAKER_OPEN_SECONDS = env_float("BREAKER_OPEN_SECONDS", 30.0)
+BREAKER_HALF_OPEN_PROBES = env_int("BREAKER_HALF_OPEN_PROBES", 2)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of outcomes.
+
+    Only upstream health counts as failure (5xx, timeouts, connection errors);
+    429s are a per-tenant rate limit and are left to the limiter. While open,
+    calls fail fast. After BREAKER_OPEN_SECONDS a few probe calls are let
+    through; if they all succeed the breaker closes, otherwise it reopens.
+    """
+
+    def __init__(self):
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.trips = 0
+        self.rejected = 0
+        self._outcomes = collections.deque()
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - BREAKER_WINDOW:
+            self._outcomes.popleft()
+
+    def retry_in(self):
+        return max(0.0, self.opened_at + BREAKER_OPEN_SECONDS - time.monotonic())
+
+    def allow(self):
+        """Reserve the right to make one call; False means fail fast."""
+        if self.state == OPEN:
+            if self.retry_in() > 0:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= BREAKER_HALF_OPEN_PROBES:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record(self, ok):
+        """Report the outcome of an allowed call: True, False, or None (neutral)."""
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if ok is False:
+                self._open(now)
+            elif ok:
+                self.probe_successes += 1
+                if self.probe_successes >= BREAKER_HALF_OPEN_PROBES:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+            return
+        if ok is None or self.state != CLOSED:
+            return
+        self._outcomes.append((now, ok))
+        self._prune(now)
+        failures = sum(1 for _, outcome in self._outcomes if not outcome)
+        if len(self._outcomes) >= BREAKER_MIN_CALLS and failures / len(self._outcomes) >= BREAKER_FAILURE_RATIO:
+            self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._outcomes.clear()
+
+    def stats(self):
+        self._prune(time.monotonic())
+        failures = sum(1 for _, outcome in self._outcomes if not outcome)
+        return {
+            "state": self.state,
+            "retry_in_s": round(self.retry_in(), 1) if self.state == OPEN else 0,
+            "window_calls": len(self._outcomes),
+            "window_failures": failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class BreakerRegistry:
+    """One breaker per upstream, or per (upstream, host) for routes without a fixed host."""
+
+    def __init__(self, max_hosts=1024):
+        self.max_hosts = max_hosts
+        self._breakers = collections.OrderedDict()
+
+    def get(self, upstream, host=""):
+        key = (upstream, host)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker()
+            # Forget the least recently used host so the table stays bounded
+            if host and len(self._breakers) > self.max_hosts:
+                for old_key in self._breakers:
+                    if old_key[1] and old_key != key:
+                        del self._breakers[old_key]
+                        break
+        else:
+            self._breakers.move_to_end(key)
+        return breaker
+
+    def hosts(self, upstream):
+        """Per-host breakers of one upstream, by host."""
+        return {host: breaker for (name, host), breaker in self._breakers.items() if name == upstream and host}
+
+
+breakers = BreakerRegistry()
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2**attempt)))
+
+
+async def call_with_retries(upstream, tenant, attempt_fn, deadline, host=""):
+    """Run `attempt_fn()` under the tenant's limiter, retrying overload signals.
+
+    `deadline` is the overall time budget in seconds, queueing included.
+    `host` gives routes that reach arbitrary sites a breaker per host.
+    Raises UpstreamUnavailable when the budget or the attempts run out.
+    """
+    limiter = limiters.get(upstream, tenant)
+    breaker = breakers.get(upstream, host)
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    last_problem = "no attempt made"
+
+    for attempt in range(max(1, RETRY_ATTEMPTS)):
+        remaining = give_up_at - loop.time()
+        if remaining <= 0:
+            break
+        paused_for = limiter.blocked_until - time.monotonic()
+        if paused_for > remaining:
+            # Upstream asked us to back off for longer than this call may wait
+            last_problem = f"rate limited, retry after {paused_for:.0f}s"
+            UPSTREAM_ERRORS.labels(upstream, "rate_limited").inc()
+            break
+        if not breaker.allow():
+            last_problem = f"temporarily unavailable (circuit open), retry after {breaker.retry_in():.0f}s"
+            UPSTREAM_ERRORS.labels(upstream, "circuit_open").inc()
+            break
+        try:
+            await limiter.acquire(timeout=remaining)
+        except BaseException as e:
+            breaker.record(None)
+            if not isinstance(e, asyncio.TimeoutError):
+                raise
+            last_problem = "too busy (queued until the deadline)"
+            UPSTREAM_ERRORS.labels(upstream, "queue_timeout").inc()
+            break
+
+        started = loop.time()
+        retry_after = None
+        try:
+            async with asyncio.timeout(max(0.001, give_up_at - loop.time())):
+                result = await attempt_fn()
+        except RetryableStatus as e:
+            limiter.release(overloaded=e.status_code in (429, 503), error=True)
+            breaker.record(None if e.status_code == 429 else False)
+            retry_after = e.retry_after
+            if e.status_code == 429:
+                last_problem = "rate limited (HTTP 429)"
+                UPSTREAM_ERRORS.labels(upstream, "rate_limited").inc()
+            else:
+                last_problem = f"temporarily unavailable (HTTP {e.status_code})"
+                UPSTREAM_ERRORS.labels(upstream, "http_5xx").inc()
+            if retry_after:
+                limiter.pause(retry_after)
+        except (TimeoutError, httpx.TimeoutException):
+            limiter.release(overloaded=True)
+            breaker.record(False)
+            last_problem = "timed out"
+            UPSTREAM_ERRORS.labels(upstream, "timeout").inc()
+        except (httpx.ConnectError, httpx.RemoteProtocolError, httpx.ReadError) as e:
+            limiter.release(error=True)
+            breaker.record(False)
+            last_problem = f"connection failed ({type(e).__name__})"
+            UPSTREAM_ERRORS.labels(upstream, "connection").inc()
+        except BaseException:
+            limiter.release(error=True)
+            breaker.record(None)
+            raise
+        else:
+            limiter.release(latency=loop.time() - started)
+            breaker.record(True)
+            return result
+
+        delay = max(retry_after or 0.0, backoff_delay(attempt))
+        if loop.time() + delay >= give_up_at or attempt + 1 >= RETRY_ATTEMPTS:
+            if retry_after:
+                last_problem += f", retry after {retry_after:.0f}s"
+            break
+        limiters.retries += 1
+        await asyncio.sleep(delay)
+
+    limiters.gave_up += 1
+    raise UpstreamUnavailable(last_problem)
+
+
+# Hedged requests (opt-in, used by fetch)
+HEDGE_ENABLED = env_bool("FETCH_HEDGE", False)
+HEDGE_ROUTE = env_str("FETCH_HEDGE_ROUTE", "jina")
+HEDGE_PERCENTILE = env_float("FETCH_HEDGE_PERCENTILE", 95.0)
+HEDGE_MIN_DELAY = env_float("FETCH_HEDGE_MIN_DELAY", 0.5)
+HEDGE_DEFAULT_DELAY = env_float("FETCH_HEDGE_DEFAULT_DELAY", 10.0)
+HEDGE_MIN_SAMPLES = env_int("FETCH_HEDGE_MIN_SAMPLES", 20)
+HEDGE_MAX_RATIO = env_float("FETCH_HEDGE_MAX_RATIO", 0.1)
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies for one upstream."""
+
+    def __init__(self, window=256):
+        self._samples = collections.deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, pct):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def hedge_delay(self):
+        """How long to wait on the first attempt before sending a hedge."""
+        if len(self) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.percentile(HEDGE_PERCENTILE))
+
+
+latency_trackers = collections.defaultdict(LatencyTracker)
+
+
+class HedgeBudget:
+    """Token bucket that caps hedges to a fraction of primary requests."""
+
+    def __init__(self, ratio=HEDGE_MAX_RATIO, burst=5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    def on_request(self):
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.hedges += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self):
+        return {
+            "enabled": HEDGE_ENABLED,
+            "route": HEDGE_ROUTE,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "denied_by_budget": self.denied,
+            "max_ratio": self.ratio,
+            "delays_s": {name: round(t.hedge_delay(), 3) for name, t in latency_trackers.items()},
+        }
+
+
+hedge_budget = HedgeBudget()
+
+
+async def hedged(primary_fn, secondary_fn, delay, budget=hedge_budget):
+    """Run primary_fn; if it is still running after `delay`, race a secondary.
+
+    The first successful result wins and the other attempt is cancelled. If one
+    attempt fails the other may still win; if both fail, the primary's error is
+    raised. Hedges are only sent while `budget` has tokens.
+    """
+    budget.on_request()
+    first = asyncio.ensure_future(primary_fn())
+    second = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not budget.try_spend():
+            return await first
+        second = asyncio.ensure_future(secondary_fn())
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    if task is second:
+                        budget.hedge_wins += 1
+                    return task.result()
+        return first.result()
+    finally:
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
@@ -1,104 +1,642 @@
-import uvicorn
 import os
-import json
-import httpx
-from typing import Any, Optional
+import asyncio
+import hmac
+import time
+from typing import Optional
 from datetime import datetime
-from dotenv import load_dotenv
+from urllib.parse import parse_qsl, urlsplit
 
+import httpx
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse, HTMLResponse
+from starlette.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
 from fastmcp import FastMCP
-from fastmcp.server.dependencies import get_http_request
+from fastmcp.server.dependencies import get_context, get_http_request
 
-print("--- SERVER STARTUP (Starlette Mode) ---")
-
-load_dotenv()
+from . import serving, sessions, startup, timing, upstream
+from .admission import AdmissionMiddleware, fair_queue
+from .cache import api_key_namespace, cache_key, search_cache
+from .compression import CompressionMiddleware, compression_stats
+from .config import env_float, env_int, env_str
+from .extract import (
+    FETCH_ENGINE,
+    FETCH_LOCAL_MIN_CHARS,
+    FETCH_LOCAL_TIMEOUT,
+    NeedsFallback,
+    extract_pool,
+    render_page,
+    with_extract_pool,
+)
+from .metrics import HTTPMetricsMiddleware, ToolMetricsMiddleware
+from .output import dumps, render, resolve_mode, shape
+from .page_store import page_store
+from .pages import FETCH_DEFAULT_MAX_CHARS, PageBody, fetch_stats, page_buffer, paginate, read_capped
+from .resilience import (
+    HEDGE_ENABLED,
+    HEDGE_ROUTE,
+    breakers,
+    call_with_retries,
+    hedge_budget,
+    hedged,
+    latency_trackers,
+    limiters,
+    raise_for_retryable,
+)
 
 # Version for deployment tracking - increment this with each deployment
 SERVER_VERSION = "1.0.6"
 
 # 1. Maak de FastMCP Server aan
 mcp = FastMCP("Serper.dev MCP Server")
+mcp.add_middleware(ToolMetricsMiddleware())
+
+# Serper.dev helpers, gedeeld door search en search_many
+SEARCH_MANY_CONCURRENCY = env_int("SEARCH_MANY_CONCURRENCY", 8)
+SEARCH_MANY_MAX_QUERIES = env_int("SEARCH_MANY_MAX_QUERIES", 100)
+# Serper.dev accepts a JSON array of payloads per POST; 1 disables the array form
+SERPER_BATCH_SIZE = env_int("SERPER_BATCH_SIZE", 25)
+# Only these answers to the array form mean "not supported"; search_many then sends one POST per query
+BATCH_REJECTED_STATUSES = (400, 422)
+# search_and_fetch: how many organic results to read, and how long to wait for them
+SEARCH_FETCH_TOP_K = env_int("SEARCH_FETCH_TOP_K", 3)
+SEARCH_FETCH_MAX_K = env_int("SEARCH_FETCH_MAX_K", 10)
+SEARCH_FETCH_MAX_CHARS = env_int("SEARCH_FETCH_MAX_CHARS", 8000)
+SEARCH_FETCH_PAGE_TIMEOUT = env_float("SEARCH_FETCH_PAGE_TIMEOUT", 20)
+SEARCH_FETCH_BUDGET = env_float("SEARCH_FETCH_BUDGET", 30)
+
+def serper_payload(query):
+    return {"q": query, "gl": "nl", "hl": "nl", "num": 10}
+
+def serper_headers(api_key):
+    return {'X-API-KEY': api_key, 'Content-Type': 'application/json'}
+
+async def serper_search(api_key, payload):
+    """One Serper.dev lookup, coalesced with identical in-flight calls. Raises on errors."""
+    client = upstream.get_client("serper")
+
+    async def attempt():
+        response = await client.post(
+            f"{upstream.SERPER_BASE_URL}/search", headers=serper_headers(api_key), json=payload
+        )
+        raise_for_retryable(response)
+        response.raise_for_status()
+        with timing.phase("decode"):
+            return response.json()
+
+    async def call_serper():
+        data = await call_with_retries(
+            "serper", api_key_namespace(api_key), attempt, upstream.UPSTREAM_TIMEOUTS["serper"]
+        )
+        await search_cache.set(api_key, payload, data)
+        return data
+
+    # Identieke gelijktijdige zoekopdrachten delen één upstream call
+    flight_key = ("serper", cache_key(api_key, payload))
+    return await upstream.singleflight.do(flight_key, call_serper)
+
+async def serper_search_batch(api_key, payloads):
+    """Several lookups in one POST using Serper.dev's array payload. Raises on errors."""
+    client = upstream.get_client("serper")
+
+    async def attempt():
+        response = await client.post(
+            f"{upstream.SERPER_BASE_URL}/search", headers=serper_headers(api_key), json=payloads
+        )
+        raise_for_retryable(response)
+        response.raise_for_status()
+        with timing.phase("decode"):
+            return response.json()
+
+    results = await call_with_retries(
+        "serper", api_key_namespace(api_key), attempt, upstream.UPSTREAM_TIMEOUTS["serper"]
+    )
+    if not isinstance(results, list) or len(results) != len(payloads):
+        raise ValueError("Unexpected batch response from Serper.dev")
+    for payload, data in zip(payloads, results):
+        await search_cache.set(api_key, payload, data)
+    return results
+
+async def cached_search(api_key, payload, bypass_cache=False):
+    """serper_search behind the per-key search cache. Raises on errors."""
+    if bypass_cache:
+        search_cache.bypasses += 1
+    else:
+        cached = await search_cache.get(api_key, payload)
+        if cached is not None:
+            return cached
+    return await serper_search(api_key, payload)
 
 # 2. Definieer de Tools
 @mcp.tool()
-async def search(query: str) -> str:
-    """Search Google using Serper.dev. Returns search results for the given query."""
+async def search(
+    query: str,
+    bypass_cache: bool = False,
+    mode: str = "",
+    fields: Optional[list[str]] = None,
+) -> str:
+    """Search Google using Serper.dev. Returns search results for the given query.
+
+    Results are cached per API key; set bypass_cache to force a fresh lookup.
+    mode is "full" (everything), "compact" (answer box and trimmed organic results)
+    or "organic_only"; fields limits each organic result to the given keys,
+    e.g. ["title", "link"].
+    """
     request = get_http_request()
     api_key = getattr(request.state, "api_key", None)
     
     if not api_key:
         return "Error: No API key available"
 
-    url = "https://google.serper.dev/search"
-    payload = {"q": query, "gl": "nl", "hl": "nl", "num": 10}
+    try:
+        mode = resolve_mode(mode)
+    except ValueError as e:
+        return f"Error: {e}"
 
-    headers = {'X-API-KEY': api_key, 'Content-Type': 'application/json'}
+    try:
+        data = await cached_search(api_key, serper_payload(query), bypass_cache)
+        return render(data, mode, fields)
+    except Exception as e:
+        return f"Error connecting to Serper.dev: {str(e)}"
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=payload, timeout=30.0)
+@mcp.tool()
+async def search_many(
+    queries: list[str],
+    bypass_cache: bool = False,
+    mode: str = "",
+    fields: Optional[list[str]] = None,
+) -> str:
+    """Search Google using Serper.dev for several queries in one call.
+
+    Returns a JSON list with one entry per query, in input order. Each entry has
+    "query" and either "results" or, when that query failed, "error".
+    mode and fields shape each result exactly like they do for search.
+    """
+    request = get_http_request()
+    api_key = getattr(request.state, "api_key", None)
+
+    if not api_key:
+        return "Error: No API key available"
+    try:
+        mode = resolve_mode(mode)
+    except ValueError as e:
+        return f"Error: {e}"
+    if len(queries) > SEARCH_MANY_MAX_QUERIES:
+        return f"Error: search_many accepts at most {SEARCH_MANY_MAX_QUERIES} queries per call"
+
+    payloads = [serper_payload(query) for query in queries]
+    entries = [{"query": query} for query in queries]
+
+    # Cache hits are answered directly; duplicate queries go upstream only once
+    pending = {}
+    for index, payload in enumerate(payloads):
+        if bypass_cache:
+            search_cache.bypasses += 1
+        else:
+            cached = await search_cache.get(api_key, payload)
+            if cached is not None:
+                entries[index]["results"] = cached
+                continue
+        pending.setdefault(cache_key(api_key, payload), []).append(index)
+
+    semaphore = asyncio.Semaphore(max(1, SEARCH_MANY_CONCURRENCY))
+
+    def resolve(key, data=None, error=None):
+        for index in pending[key]:
+            if error is None:
+                entries[index]["results"] = data
+            else:
+                entries[index]["error"] = f"Error connecting to Serper.dev: {error}"
+
+    async def run_single(key):
+        async with semaphore:
+            try:
+                resolve(key, data=await serper_search(api_key, payloads[pending[key][0]]))
+            except Exception as e:
+                resolve(key, error=str(e))
+
+    async def run_batch(keys):
+        async with semaphore:
+            try:
+                results = await serper_search_batch(api_key, [payloads[pending[k][0]] for k in keys])
+            except httpx.HTTPStatusError as e:
+                results = None if e.response.status_code in BATCH_REJECTED_STATUSES else e
+            except Exception as e:
+                results = e
+        if results is None:
+            # Array form rejected: fall back to one request per query
+            await asyncio.gather(*(run_single(key) for key in keys))
+            return
+        if isinstance(results, Exception):
+            # Quota, auth or outage: per-query requests would fail the same way, N times over
+            for key in keys:
+                resolve(key, error=str(results))
+            return
+        for key, data in zip(keys, results):
+            resolve(key, data=data)
+
+    keys = list(pending)
+    if SERPER_BATCH_SIZE > 1 and len(keys) > 1:
+        chunks = [keys[i:i + SERPER_BATCH_SIZE] for i in range(0, len(keys), SERPER_BATCH_SIZE)]
+        await asyncio.gather(*(run_batch(chunk) for chunk in chunks))
+    else:
+        await asyncio.gather(*(run_single(key) for key in keys))
+
+    for entry in entries:
+        if "results" in entry:
+            entry["results"] = shape(entry["results"], mode, fields)
+    return dumps(entries, pretty=(mode == "full"))
+
+FETCH_HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Content types the server extracts itself; PDF's e.d. are left to r.jina.ai
+LOCAL_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "")
+
+
+def content_type_of(response):
+    return response.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+def validators_of(response):
+    return {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "cache_control": response.headers.get("cache-control"),
+    }
+
+async def fetch_page(id, bypass_cache=False):
+    """One page as a PageBody, from the page store or downloaded. Raises on errors.
+
+    Identical in-flight fetches are coalesced. bypass_cache skips the stored
+    copy but still stores the fresh download.
+    """
+    jina_url = f"{upstream.JINA_BASE_URL}/{id}"
+    client = upstream.get_client("jina")
+
+    async def attempt():
+        async with client.stream("GET", jina_url, headers=FETCH_HEADERS) as response:
+            raise_for_retryable(response)
+            return await read_capped(response)
+
+    async def direct_attempt():
+        # Hedge via de site zelf: dezelfde extractie als FETCH_ENGINE=local, nooit ruwe HTML
+        async with upstream.get_client("direct").stream("GET", id, headers=FETCH_HEADERS) as response:
+            raise_for_retryable(response)
             response.raise_for_status()
-            return json.dumps(response.json(), indent=2, ensure_ascii=False)
+            content_type = content_type_of(response)
+            if content_type not in LOCAL_CONTENT_TYPES:
+                raise NeedsFallback("content_type")
+            raw = await read_capped(response)
+        return await render_local(raw, content_type, str(response.url)), validators_of(response)
+
+    async def via(route, attempt_fn):
+        started = time.monotonic()
+        # Page routes are keyless, so all tenants share one limiter per route
+        # Directe fetches gaan naar willekeurige sites: één breaker per host, niet één voor allemaal
+        host = (urlsplit(id).hostname or "").lower() if route == "direct" else ""
+        body = await call_with_retries(route, "", attempt_fn, upstream.UPSTREAM_TIMEOUTS[route], host=host)
+        latency_trackers[route].record(time.monotonic() - started)
+        return body
+
+    async def via_jina():
+        return "jina", await via("jina", attempt), {}
+
+    async def via_direct():
+        body, validators = await via("direct", direct_attempt)
+        return "direct", body, validators
+
+    async def download():
+        """(source, body, validators): r.jina.ai, or the site itself when a direct hedge wins."""
+        if not HEDGE_ENABLED:
+            return await via_jina()
+        # Trage r.jina.ai responses krijgen na de pXX latency een tweede poging
+        secondary = via_direct if HEDGE_ROUTE == "direct" else via_jina
+        return await hedged(via_jina, secondary, latency_trackers["jina"].hedge_delay())
+
+    async def render_local(raw, content_type, url):
+        """A page downloaded by the server itself, in the r.jina.ai layout. Raises NeedsFallback."""
+        if content_type == "text/plain":
+            return raw
+        started = time.perf_counter()
+        try:
+            page = await extract_pool.extract(raw.text, url)
         except Exception as e:
-            return f"Error connecting to Serper.dev: {str(e)}"
+            raise NeedsFallback("extract_error") from e
+        finally:
+            fetch_stats.extract_seconds += time.perf_counter() - started
+            timing.add("extract", time.perf_counter() - started)
+        if page["text_chars"] < FETCH_LOCAL_MIN_CHARS:
+            raise NeedsFallback("too_little_text")  # JavaScript shell, consent wall, ...
+        return PageBody(render_page(page, id), raw.bytes_read, raw.truncated, raw.status_code)
+
+    async def local(stored):
+        # Zelf downloaden en extraheren; alles wat daar niet lukt gaat alsnog via r.jina.ai
+        headers = FETCH_HEADERS
+        if stored is not None and stored.can_revalidate():
+            headers = {**FETCH_HEADERS, **stored.conditional_headers()}
+        try:
+            async with asyncio.timeout(FETCH_LOCAL_TIMEOUT):
+                async with upstream.get_client("direct").stream("GET", id, headers=headers) as response:
+                    if response.status_code == 304 and stored is not None:
+                        return None, {}  # de opgeslagen versie is nog actueel
+                    if response.status_code >= 400:
+                        raise NeedsFallback(f"http_{response.status_code}")
+                    content_type = content_type_of(response)
+                    if content_type not in LOCAL_CONTENT_TYPES:
+                        raise NeedsFallback("content_type")  # PDF's e.d. kan r.jina.ai wel lezen
+                    raw = await read_capped(response)
+        except (TimeoutError, httpx.HTTPError) as e:
+            raise NeedsFallback(type(e).__name__) from e
+        body = await render_local(raw, content_type, str(response.url))
+        if body is not raw:
+            fetch_stats.local_pages += 1
+        return body, validators_of(response)
+
+    def serve_stored(stored, revalidated=False):
+        page_store.record_hit(stored, revalidated)
+        page_buffer.put(id, stored.body)
+        return stored.body
+
+    async def call_fetch():
+        stored = None
+        if bypass_cache:
+            page_store.bypasses += 1
+        else:
+            stored = await page_store.get(id)
+        try:
+            return await refresh(stored)
+        finally:
+            if stored is not None:
+                stored.body = None  # de index houdt alleen metadata vast
+
+    async def refresh(stored):
+        if stored is not None and stored.is_fresh():
+            return serve_stored(stored)
+        body = None
+        validators = {}
+        if FETCH_ENGINE == "local":
+            try:
+                body, validators = await local(stored)
+            except NeedsFallback as e:
+                fetch_stats.record_fallback(str(e))
+            else:
+                if body is None:  # 304 Not Modified
+                    return serve_stored(stored, revalidated=True)
+        if stored is not None:
+            page_store.record_stale()
+        source = "local"
+        if body is None:
+            source, body, validators = await download()
+        fetch_stats.record(body)
+        if 200 <= body.status_code < 300:
+            page_buffer.put(id, body)
+            await page_store.put(id, body, source, **validators)
+        return body
+
+    return await upstream.singleflight.do(("fetch", id, bypass_cache), call_fetch)
+
+@mcp.tool()
+async def fetch(id: str, max_chars: int = 0, cursor: int = 0, bypass_cache: bool = False) -> str:
+    """Fetch content from a webpage. The id should be a URL to retrieve.
+
+    Long pages are returned in chunks of max_chars characters (0 = server default).
+    When more text is available the result ends with the cursor to pass next.
+    Pages are stored and reused; set bypass_cache to force a fresh download.
+    """
+    max_chars = max_chars if max_chars > 0 else FETCH_DEFAULT_MAX_CHARS
+
+    # Vervolgpagina's komen uit de buffer, zonder opnieuw te downloaden
+    if cursor > 0:
+        body = page_buffer.get(id)
+        if body is not None:
+            fetch_stats.buffer_hits += 1
+            return paginate(body, cursor, max_chars)
+
+    try:
+        body = await fetch_page(id, bypass_cache)
+        return paginate(body, cursor, max_chars)
+    except Exception as e:
+        return f"Error fetching page: {str(e)}"
 
 @mcp.tool()
-async def fetch(id: str) -> str:
-    """Fetch content from a webpage. The id should be a URL to retrieve."""
-    jina_url = f"https://r.jina.ai/{id}"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    async with httpx.AsyncClient() as client:
+async def search_and_fetch(
+    query: str,
+    k: int = 0,
+    max_chars_per_page: int = 0,
+    bypass_cache: bool = False,
+) -> str:
+    """Search Google and read the top k organic results in one call.
+
+    Returns JSON with the compact "search" results and "pages": one entry per
+    fetched result, in rank order, with "content" cut to max_chars_per_page
+    characters (0 = server default) or "error". Pages are fetched concurrently;
+    one that misses its deadline is reported as timed out instead of holding up
+    the others. Each page is also sent as a progress notification as soon as it
+    arrives. Use fetch with the page URL and cursor to read further.
+    bypass_cache refreshes both the search results and the pages.
+    """
+    request = get_http_request()
+    api_key = getattr(request.state, "api_key", None)
+
+    if not api_key:
+        return "Error: No API key available"
+
+    k = min(k if k > 0 else SEARCH_FETCH_TOP_K, SEARCH_FETCH_MAX_K)
+    max_chars = max_chars_per_page if max_chars_per_page > 0 else SEARCH_FETCH_MAX_CHARS
+    deadline = time.monotonic() + SEARCH_FETCH_BUDGET
+
+    try:
+        data = await cached_search(api_key, serper_payload(query), bypass_cache)
+    except Exception as e:
+        return f"Error connecting to Serper.dev: {str(e)}"
+
+    pages = []
+    for item in data.get("organic") or []:
+        link = item.get("link")
+        if link and all(page["url"] != link for page in pages):
+            pages.append({"rank": len(pages) + 1, "url": link, "title": item.get("title", "")})
+        if len(pages) == k:
+            break
+
+    async def read(page):
+        # Waiters are shielded from the shared download, so a page that times out still lands in the buffer
+        async with asyncio.timeout(SEARCH_FETCH_PAGE_TIMEOUT):
+            body = await fetch_page(page["url"], bypass_cache)
+        if not 200 <= body.status_code < 300:
+            raise ValueError(f"HTTP {body.status_code}")
+        return paginate(body, 0, max_chars)
+
+    tasks = {asyncio.ensure_future(read(page)): page for page in pages}
+    ctx = get_context()
+    done = 0
+
+    async def harvest(task):
+        nonlocal done
+        page = tasks[task]
         try:
-            response = await client.get(jina_url, headers=headers, timeout=60.0)
-            return response.text
+            page["content"] = task.result()
+        except TimeoutError:
+            page["error"] = f"Timed out after {SEARCH_FETCH_PAGE_TIMEOUT:g}s"
         except Exception as e:
-            return f"Error fetching page: {str(e)}"
+            page["error"] = f"Error fetching page: {str(e)}"
+        done += 1
+        await ctx.report_progress(done, len(pages), dumps(page))
+
+    pending = set(tasks)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        finished, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            await harvest(task)
+    # Budget op: pagina's die intussen klaar zijn tellen nog mee, alleen wat echt nog loopt wordt afgebroken
+    for task in [task for task in pending if task.done()]:
+        pending.discard(task)
+        await harvest(task)
+    for task in pending:
+        task.cancel()
+        tasks[task]["error"] = f"Search budget of {SEARCH_FETCH_BUDGET:g}s exhausted"
+
+    return dumps({"query": query, "search": shape(data, "compact"), "pages": pages})
 
 # 3. Middleware
-class ApiKeyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        # Skip for healthcheck and root
-        if request.url.path in ["/", "/healthcheck", "/version"]:
-            return await call_next(request)
+class FrontDoorMiddleware:
+    """Pure ASGI layer in front of FastMCP: API-key resolution and Accept fix-up.
+
+    Public routes pass straight through. Other requests get their Serper key
+    from the Authorization header, then ?api_key=, then SERPER_API_KEY, stored
+    in scope["state"] where request.state.api_key reads it. receive/send are
+    handed on untouched; a new scope is only built when /mcp needs its Accept
+    header rewritten.
+    """
+
+    # /debug/profile checks its own token
+    PUBLIC_PATHS = frozenset(["/", "/healthcheck", "/ready", "/version", "/stats", "/metrics", "/debug/profile"])
+    # OpenAI's Batch API doesn't send the Accept header FastMCP requires
+    MCP_ACCEPT = b"application/json, text/event-stream"
+
+    def __init__(self, app):
+        self.app = app
+        self.default_api_key = os.getenv("SERPER_API_KEY")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.PUBLIC_PATHS:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        authorization = accept = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value
+            elif name == b"accept":
+                accept = value
 
         api_key = None
-        auth = request.headers.get("Authorization")
-        if auth and auth.startswith("Bearer "):
-            api_key = auth.split(" ", 1)[1].strip()
-        
-        # KEY CHANGE: Check query parameters
-        if not api_key:
-            api_key = request.query_params.get("api_key")
-            
+        if authorization and authorization.startswith(b"Bearer "):
+            api_key = authorization[7:].strip().decode("latin-1")
+        if not api_key and b"api_key=" in scope["query_string"]:
+            query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+            api_key = dict(query).get("api_key")
         if not api_key:
-            api_key = os.getenv("SERPER_API_KEY")
-
+            api_key = self.default_api_key
         if not api_key:
-            return JSONResponse(
+            response = JSONResponse(
                 {"error": "Missing Serper API key. Provide it in the Authorization header or via query param ?api_key=..."},
                 status_code=401,
             )
-        
-        request.state.api_key = api_key
-        return await call_next(request)
+            return await response(scope, receive, send)
+        scope.setdefault("state", {})["api_key"] = api_key
+
+        if scope["path"] == "/mcp" and (
+            accept is None or b"application/json" not in accept or b"text/event-stream" not in accept
+        ):
+            headers = [header for header in scope["headers"] if header[0] != b"accept"]
+            headers.append((b"accept", self.MCP_ACCEPT))
+            scope = {**scope, "headers": headers}
+
+        timing.add("auth", time.perf_counter() - started)
+        await self.app(scope, receive, send)
 
 # 4. Handlers
+HEALTHCHECK_DEGRADED_STATUS = env_int("HEALTHCHECK_DEGRADED_STATUS", 200)
+# Upstreams with a fixed host; "direct" has a breaker per site instead
+HEALTH_UPSTREAMS = ("serper", "jina")
+# With a token /stats and /metrics need it, and /stats lists busy tenants; without one they only show totals
+STATS_TOKEN = env_str("STATS_TOKEN", "")
+
+def upstream_health():
+    """Breaker state of the fixed upstreams and the names of those not closed."""
+    # Een open circuit breaker betekent een gedegradeerde upstream, niet een kapotte task.
+    # Sites achter de directe fetch zijn geen dependency van de service en tellen niet mee.
+    upstreams = {name: breakers.get(name).stats() for name in HEALTH_UPSTREAMS}
+    return upstreams, [name for name, state in upstreams.items() if state["state"] != "closed"]
+
 async def healthcheck_handler(request):
-    return JSONResponse({"status": "healthy", "version": SERVER_VERSION})
+    upstreams, degraded = upstream_health()
+    direct_open = sorted(host for host, breaker in breakers.hosts("direct").items() if breaker.state != "closed")
+    return JSONResponse(
+        {
+            "status": "degraded" if degraded else "healthy",
+            "version": SERVER_VERSION,
+            "degraded_upstreams": degraded,
+            "upstreams": upstreams,
+            "direct_hosts_open": direct_open[:20],
+        },
+        status_code=HEALTHCHECK_DEGRADED_STATUS if degraded else 200,
+    )
+
+async def ready_handler(request):
+    # Readiness, not liveness: 503 until the startup warm-up has finished. This is the
+    # path the load balancer checks, so it also carries the degraded status (opt-in).
+    _, degraded = upstream_health()
+    status_code = 200 if startup.readiness.ready else 503
+    if status_code == 200 and degraded:
+        status_code = HEALTHCHECK_DEGRADED_STATUS
+    return JSONResponse({**startup.readiness.stats(), "degraded_upstreams": degraded}, status_code=status_code)
 
 async def version_handler(request):
     return JSONResponse({
         "version": SERVER_VERSION,
         "timestamp": datetime.now().isoformat(),
-        "asgi_wrapper": "AcceptHeaderASGIWrapper",
-        "stateless_http": True
+        "asgi_wrapper": "FrontDoorMiddleware",
+        "stateless_http": sessions.MCP_SESSION_MODE != "stateful"
     })
 
+def stats_allowed(request):
+    """True without STATS_TOKEN, else only for its X-Stats-Token or Bearer header."""
+    if not STATS_TOKEN:
+        return True
+    supplied = request.headers.get("x-stats-token", "")
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if not supplied and scheme.lower() == "bearer":
+        supplied = credentials.strip()
+    return hmac.compare_digest(supplied.encode(), STATS_TOKEN.encode())
+
+async def stats_handler(request):
+    if not stats_allowed(request):
+        return JSONResponse({"error": "Invalid or missing X-Stats-Token"}, status_code=403)
+    return JSONResponse({
+        "version": SERVER_VERSION,
+        "search_cache": search_cache.stats(),
+        "fetch": {
+            "engine": FETCH_ENGINE,
+            **fetch_stats.as_dict(page_buffer),
+            "extract_pool": extract_pool.stats(),
+            "store": page_store.stats(),
+        },
+        "limiters": limiters.stats(),
+        "hedging": hedge_budget.stats(),
+        "compression": compression_stats.as_dict(),
+        "sessions": sessions.session_stats.as_dict(),
+        "admission": fair_queue.stats(tenants=bool(STATS_TOKEN)),
+    })
+
+async def metrics_handler(request):
+    if not stats_allowed(request):
+        return JSONResponse({"error": "Invalid or missing X-Stats-Token"}, status_code=403)
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 async def root_handler(request):
     # Print routes for debugging, robust against missing attributes
     routes_info = []
@@ -120,62 +658,40 @@ async def root_handler(request):
         "debug_routes": routes_info
     })
 
-def main():
+def create_app():
+    """Build the wrapped ASGI app that main() serves (also used by bench/)."""
     middleware = [
-        Middleware(ApiKeyMiddleware),
+        # CORS first so preflights and 401s carry CORS headers
         Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(FrontDoorMiddleware),
+        # Fair slots per API key, after FrontDoor has resolved the key
+        Middleware(AdmissionMiddleware),
     ]
     
     # Gebruik de native FastMCP http app builder
     starlette_app = mcp.http_app(middleware=middleware, stateless_http=True)
+    if sessions.MCP_SESSION_MODE == "stateful":
+        # Sessions for clients that initialize; everything else stays stateless
+        sessions.install(starlette_app, mcp)
+    # Gedeelde upstream connection pools leven net zo lang als de app
+    starlette_app.router.lifespan_context = upstream.with_upstream_lifespan(
+        with_extract_pool(startup.with_warmup(starlette_app.router.lifespan_context, mcp))
+    )
     
     # Overschrijf/Voeg toe onze eigen routes
     starlette_app.add_route("/", root_handler, methods=["GET"])
     starlette_app.add_route("/healthcheck", healthcheck_handler, methods=["GET"])
+    starlette_app.add_route("/ready", ready_handler, methods=["GET"])
     starlette_app.add_route("/version", version_handler, methods=["GET"])
+    starlette_app.add_route("/stats", stats_handler, methods=["GET"])
+    starlette_app.add_route("/metrics", metrics_handler, methods=["GET"])
+    if timing.PROFILE_TOKEN:
+        starlette_app.add_route("/debug/profile", timing.profile_handler, methods=["GET"])
     
-    # ASGI Wrapper: Inject Accept header at the lowest level before FastMCP processes it
-    # This is needed because OpenAI's Batch API doesn't send the required Accept header
-    class AcceptHeaderASGIWrapper:
-        def __init__(self, app):
-            self.app = app
-        
-        async def __call__(self, scope, receive, send):
-            if scope["type"] == "http" and scope.get("path") == "/mcp":
-                # Check if Accept header is missing or incomplete
-                headers = list(scope.get("headers", []))
-                accept_present = False
-                accept_value = b""
-                
-                for i, (name, value) in enumerate(headers):
-                    if name.lower() == b"accept":
-                        accept_present = True
-                        accept_value = value
-                        break
-                
-                # If Accept header is missing or doesn't contain both required types
-                needs_injection = not accept_present or (
-                    b"application/json" not in accept_value or 
-                    b"text/event-stream" not in accept_value
-                )
-                
-                if needs_injection:
-                    # Remove existing Accept header if present
-                    headers = [(n, v) for n, v in headers if n.lower() != b"accept"]
-                    # Add the required Accept header
-                    headers.append((b"accept", b"application/json, text/event-stream"))
-                    scope = dict(scope)
-                    scope["headers"] = headers
-            
-            await self.app(scope, receive, send)
-    
-    # Wrap the Starlette app with our ASGI wrapper
-    wrapped_app = AcceptHeaderASGIWrapper(starlette_app)
-    
-    print("🚀 Starting Uvicorn (Starlette with ASGI wrapper)...")
-    host = os.getenv("MCP_HOST", "0.0.0.0")
-    port = int(os.getenv("MCP_PORT", "8000"))
-    uvicorn.run(wrapped_app, host=host, port=port, ws="none")
+    return HTTPMetricsMiddleware(timing.TimingMiddleware(CompressionMiddleware(starlette_app)))
+
+def main():
+    serving.run()
 
 if __name__ == "__main__":
     main()
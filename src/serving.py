@@ -0,0 +1,114 @@
+"""Uvicorn serving for create_app(): one process or a supervised worker pool.
+
+Workers load the app through the `create_app` factory (an import string), so
+each worker builds its own FastMCP app, caches, limiters and upstream
+connection pools. Nothing is inherited from the parent process.
+
+uvloop and httptools are used when installed (`pip install .[production]`),
+otherwise uvicorn's asyncio loop and h11 parser.
+"""
+import math
+import os
+import random
+from functools import partial
+from importlib.util import find_spec
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from .config import env_int, env_str
+
+APP_FACTORY = f"{__package__}.server:create_app"
+
+MCP_HOST = env_str("MCP_HOST", "0.0.0.0")
+MCP_PORT = env_int("MCP_PORT", 8000)
+# 0 = one worker per available CPU (affinity mask and cgroup quota)
+MCP_WORKERS = env_int("MCP_WORKERS", 0)
+MCP_LOOP = env_str("MCP_LOOP", "auto")
+MCP_HTTP = env_str("MCP_HTTP", "auto")
+# Longer than the load balancer's idle timeout (60 s on ALB), so the LB closes first
+MCP_KEEPALIVE_TIMEOUT = env_int("MCP_KEEPALIVE_TIMEOUT", 65)
+MCP_BACKLOG = env_int("MCP_BACKLOG", 2048)
+MCP_GRACEFUL_TIMEOUT = env_int("MCP_GRACEFUL_TIMEOUT", 30)
+# Recycle a worker after this many requests (0 = never), plus 0..jitter extra
+MCP_MAX_REQUESTS = env_int("MCP_MAX_REQUESTS", 0)
+MCP_MAX_REQUESTS_JITTER = env_int("MCP_MAX_REQUESTS_JITTER", 0)
+
+
+def cgroup_cpu_limit():
+    """CPU quota of this container in whole CPUs, or None when unlimited."""
+    try:  # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return math.ceil(int(quota) / int(period))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:  # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return math.ceil(quota / period) if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - macOS / Windows
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, limit)
+    return max(1, cpus)
+
+
+def worker_count(workers=None):
+    return workers or MCP_WORKERS or available_cpus()
+
+
+def pick(setting, fast, fallback):
+    if setting != "auto":
+        return setting
+    return fast if find_spec(fast) else fallback
+
+
+def build_config(workers=None):
+    return uvicorn.Config(
+        APP_FACTORY,
+        factory=True,
+        host=MCP_HOST,
+        port=MCP_PORT,
+        workers=worker_count(workers),
+        loop=pick(MCP_LOOP, "uvloop", "asyncio"),
+        http=pick(MCP_HTTP, "httptools", "h11"),
+        ws="none",
+        backlog=MCP_BACKLOG,
+        timeout_keep_alive=MCP_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=MCP_GRACEFUL_TIMEOUT,
+        limit_max_requests=MCP_MAX_REQUESTS or None,
+    )
+
+
+def serve_worker(config, sockets=None):
+    if config.limit_max_requests and MCP_MAX_REQUESTS_JITTER > 0:
+        # Spread recycling so the workers don't all restart at the same moment
+        config.limit_max_requests += random.randint(0, MCP_MAX_REQUESTS_JITTER)
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def run(workers=None):
+    config = build_config(workers)
+    print(
+        f"🚀 Starting Uvicorn: {config.workers} worker(s), loop={config.loop}, http={config.http}, "
+        f"max_requests={MCP_MAX_REQUESTS or 'off'}"
+    )
+    if config.workers == 1 and not config.limit_max_requests:
+        uvicorn.Server(config).run()
+        return
+    # The supervisor restarts workers that exit after limit_max_requests
+    sock = config.bind_socket()
+    Multiprocess(config, target=partial(serve_worker, config), sockets=[sock]).run()
@@ -0,0 +1,297 @@
+"""Optional stateful MCP sessions, with a stateless fallback.
+
+By default every /mcp request gets a fresh transport and server session
+(`stateless_http=True`). That is what the OpenAI Batch path needs, and it is
+what MCP_SESSION_MODE=stateless keeps. With MCP_SESSION_MODE=stateful,
+interactive clients that send `initialize` get a session. The session's
+transport and server task are reused by every later request that carries its
+`Mcp-Session-Id`:
+
+- The session table is bounded by MCP_SESSION_MAX. Sessions idle for longer
+  than MCP_SESSION_IDLE_TIMEOUT are terminated by a sweeper. A full table
+  first evicts the least recently used idle session. When every session is
+  busy, the new client is served statelessly.
+- Session ids start with this worker's task id (`<task>.<uuid>`), and the
+  initialize response sets the MCP_STICKY_COOKIE cookie to the same id. The
+  load balancer can pin on that cookie (ALB application-based stickiness).
+- A request whose session this worker doesn't know is not rejected. The
+  session may live on another task, or it expired or was evicted. A POST is
+  answered statelessly instead, so tool calls keep working when affinity is
+  lost. Only GET (the standalone event stream) and DELETE get the 404 that
+  tells a client to initialize again.
+- Requests without a session id that are not `initialize` (OpenAI's Batch
+  and Responses clients) always take the stateless path.
+
+With several workers per task each worker has its own table, so stickiness
+only pins the task. Requests that reach another worker fall back to the
+stateless path. Stateful mode works best with MCP_WORKERS=1.
+
+`SessionManager` builds on private parts of the SDK's session manager
+(`SDK_INTERNALS`). pyproject pins the mcp versions it was written against.
+If an SDK without them is installed anyway, `install` logs a warning and the
+server stays stateless.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from uuid import uuid4
+
+import anyio
+from anyio.abc import TaskStatus
+from fastmcp.server.http import StreamableHTTPASGIApp
+from mcp.server.streamable_http import MCP_SESSION_ID_HEADER, StreamableHTTPServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from starlette.responses import JSONResponse
+
+from .config import env_float, env_int, env_str
+
+MCP_SESSION_MODE = env_str("MCP_SESSION_MODE", "stateless")
+MCP_SESSION_MAX = env_int("MCP_SESSION_MAX", 1000)
+MCP_SESSION_IDLE_TIMEOUT = env_float("MCP_SESSION_IDLE_TIMEOUT", 600)
+# Empty = no cookie
+MCP_STICKY_COOKIE = env_str("MCP_STICKY_COOKIE", "mcp_task")
+# Defaults to a hash of hostname and pid: unique per task and per worker
+MCP_TASK_ID = env_str("MCP_TASK_ID", "") or hashlib.sha1(
+    f"{socket.gethostname()}-{os.getpid()}".encode()
+).hexdigest()[:12]
+
+SESSION_HEADER = MCP_SESSION_ID_HEADER.encode()
+# What SessionManager uses of StreamableHTTPSessionManager beyond its public API
+SDK_INTERNALS = ("_task_group", "_server_instances", "_handle_stateless_request")
+
+logger = logging.getLogger(__name__)
+
+
+def is_initialize(body):
+    try:
+        message = json.loads(body)
+    except ValueError:
+        return False
+    messages = message if isinstance(message, list) else [message]
+    return any(isinstance(m, dict) and m.get("method") == "initialize" for m in messages)
+
+
+class SessionStats:
+    def __init__(self):
+        self.sessions = 0
+        self.created = 0
+        self.reused = 0
+        self.stateless = 0
+        self.fallbacks = {"other_task": 0, "expired": 0, "full": 0}
+        self.evicted = {"idle": 0, "full": 0, "deleted": 0}
+
+    def as_dict(self):
+        return {
+            "mode": MCP_SESSION_MODE,
+            "task_id": MCP_TASK_ID,
+            "sessions": self.sessions,
+            "max_sessions": MCP_SESSION_MAX,
+            "created": self.created,
+            "reused": self.reused,
+            "stateless": self.stateless,
+            "fallbacks": dict(self.fallbacks),
+            "evicted": dict(self.evicted),
+        }
+
+
+session_stats = SessionStats()
+
+
+class SessionManager(StreamableHTTPSessionManager):
+    """StreamableHTTPSessionManager with a bounded, idle-evicted table and stateless fallback."""
+
+    def __init__(self, app, max_sessions=None, idle_timeout=None, stats=None, **kwargs):
+        super().__init__(app, stateless=False, **kwargs)
+        self.max_sessions = MCP_SESSION_MAX if max_sessions is None else max_sessions
+        self.idle_timeout = MCP_SESSION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.stats = stats or session_stats
+        # session id -> last use (monotonic), least recently used first
+        self._last_used = OrderedDict()
+        # session id -> requests currently inside the transport
+        self._busy = {}
+
+    @asynccontextmanager
+    async def run(self):
+        async with super().run():
+            self._task_group.start_soon(self._sweep)
+            yield
+
+    async def handle_request(self, scope, receive, send):
+        if self._task_group is None:
+            raise RuntimeError("Task group is not initialized. Make sure to use run().")
+        session_id = None
+        for name, value in scope["headers"]:
+            if name == SESSION_HEADER:
+                session_id = value.decode("latin-1")
+                break
+
+        if session_id is not None:
+            transport = self._server_instances.get(session_id)
+            if transport is not None:
+                self.stats.reused += 1
+                return await self._serve(session_id, transport, scope, receive, send)
+            if scope["method"] != "POST":
+                response = JSONResponse(
+                    {"jsonrpc": "2.0", "id": None, "error": {"code": -32001, "message": "Session not found"}},
+                    status_code=HTTPStatus.NOT_FOUND,
+                )
+                return await response(scope, receive, send)
+            # Affinity lost (another task / worker) or the session expired: answer without one
+            reason = "expired" if session_id.startswith(f"{MCP_TASK_ID}.") else "other_task"
+            self.stats.fallbacks[reason] += 1
+            return await self._stateless(scope, receive, send)
+
+        if scope["method"] != "POST":
+            return await self._stateless(scope, receive, send)
+        # Read the (small) JSON-RPC body to see whether this opens a session, then replay it
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        if not is_initialize(body):
+            return await self._stateless(scope, replay, send)
+        if not self._make_room():
+            self.stats.fallbacks["full"] += 1
+            return await self._stateless(scope, replay, send)
+        session_id, transport = await self._open()
+        await self._serve(session_id, transport, scope, replay, self._with_sticky_cookie(send))
+
+    async def _stateless(self, scope, receive, send):
+        self.stats.stateless += 1
+        await self._handle_stateless_request(scope, receive, send)
+
+    async def _serve(self, session_id, transport, scope, receive, send):
+        self._busy[session_id] = self._busy.get(session_id, 0) + 1
+        try:
+            await transport.handle_request(scope, receive, send)
+        finally:
+            self._busy[session_id] -= 1
+            if not self._busy[session_id]:
+                del self._busy[session_id]
+            if transport.is_terminated:
+                if session_id in self._server_instances:  # DELETE from the client
+                    self._forget(session_id, "deleted")
+            elif session_id in self._last_used:
+                self._last_used[session_id] = time.monotonic()
+                self._last_used.move_to_end(session_id)
+
+    async def _open(self):
+        session_id = f"{MCP_TASK_ID}.{uuid4().hex}"
+        transport = StreamableHTTPServerTransport(
+            mcp_session_id=session_id,
+            is_json_response_enabled=self.json_response,
+            event_store=self.event_store,
+            security_settings=self.security_settings,
+        )
+        self._server_instances[session_id] = transport
+        self._last_used[session_id] = time.monotonic()
+        self.stats.created += 1
+        self.stats.sessions = len(self._server_instances)
+
+        async def run_server(*, task_status: TaskStatus[None] = anyio.TASK_STATUS_IGNORED):
+            async with transport.connect() as (read_stream, write_stream):
+                task_status.started()
+                try:
+                    await self.app.run(read_stream, write_stream, self.app.create_initialization_options(), stateless=False)
+                except Exception:
+                    logger.exception("MCP session %s crashed", session_id)
+                finally:
+                    if session_id in self._server_instances and not transport.is_terminated:
+                        self._forget(session_id, None)
+
+        await self._task_group.start(run_server)
+        return session_id, transport
+
+    def _make_room(self):
+        """Evict least recently used idle sessions until one fits; False if they are all busy."""
+        idle = (session_id for session_id in list(self._last_used) if session_id not in self._busy)
+        while len(self._server_instances) >= self.max_sessions:
+            session_id = next(idle, None)
+            if session_id is None:
+                return False
+            self._evict(session_id, "full")
+        return True
+
+    def _evict(self, session_id, reason):
+        transport = self._server_instances.get(session_id)
+        self._forget(session_id, reason)
+        if transport is not None:
+            self._task_group.start_soon(transport.terminate)
+
+    def _forget(self, session_id, reason):
+        self._server_instances.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        if reason:
+            self.stats.evicted[reason] += 1
+        self.stats.sessions = len(self._server_instances)
+
+    async def _sweep(self):
+        interval = max(0.05, min(self.idle_timeout / 4, 30))
+        while True:
+            await anyio.sleep(interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            idle = [sid for sid, used in self._last_used.items() if used < cutoff and sid not in self._busy]
+            for session_id in idle:
+                self._evict(session_id, "idle")
+
+    def _with_sticky_cookie(self, send):
+        if not MCP_STICKY_COOKIE:
+            return send
+        cookie = f"{MCP_STICKY_COOKIE}={MCP_TASK_ID}; Path=/; HttpOnly; SameSite=Lax".encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie)]}
+            await send(message)
+
+        return send_wrapper
+
+
+def install(starlette_app, mcp, **kwargs):
+    """Serve the app's /mcp route through a SessionManager and run it in the app's lifespan.
+
+    Returns None, and leaves the app stateless, when the installed mcp SDK lacks
+    the internals SessionManager needs.
+    """
+    global MCP_SESSION_MODE
+    manager = SessionManager(mcp._mcp_server, **kwargs)
+    missing = [name for name in SDK_INTERNALS if not hasattr(manager, name)]
+    if missing:
+        logger.warning("MCP_SESSION_MODE=stateful needs %s from the mcp SDK; staying stateless", ", ".join(missing))
+        MCP_SESSION_MODE = "stateless"
+        return None
+    for route in starlette_app.router.routes:
+        if getattr(route, "path", None) == starlette_app.state.path:
+            route.app = route.endpoint = StreamableHTTPASGIApp(manager)
+    starlette_app.router.lifespan_context = with_session_manager(starlette_app.router.lifespan_context, manager)
+    return manager
+
+
+def with_session_manager(app_lifespan, manager):
+    """Wrap a Starlette lifespan so the session manager runs inside it."""
+
+    @asynccontextmanager
+    async def combined(app):
+        async with app_lifespan(app) as state:
+            async with manager.run():
+                yield state
+
+    return combined
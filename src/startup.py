@@ -0,0 +1,118 @@
+"""Startup warm-up behind the `/ready` endpoint.
+
+Once the app lifespan has started, a background task opens keep-alive
+connections to Serper.dev and r.jina.ai (DNS, TCP and TLS paid up front, the
+connections stay in the shared pools) and builds the FastMCP tool listing.
+With FETCH_ENGINE=local the extraction workers are started as well.
+`/healthcheck` answers as soon as uvicorn binds; `/ready` only once this is
+done, so the load balancer doesn't route the first tool calls to a cold task.
+
+Warm-up is best effort: an unreachable upstream is reported, not fatal, and
+the task is marked ready after STARTUP_WARMUP_TIMEOUT at the latest.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from . import extract, upstream
+from .config import env_bool, env_float, env_int
+
+STARTUP_WARMUP = env_bool("STARTUP_WARMUP", True)
+STARTUP_WARM_CONNECTIONS = env_int("STARTUP_WARM_CONNECTIONS", 2)
+STARTUP_WARMUP_TIMEOUT = env_float("STARTUP_WARMUP_TIMEOUT", 10.0)
+
+# Only upstreams with a fixed host can be pre-connected ("direct" fetches any URL)
+WARM_UPSTREAMS = ("serper", "jina")
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.warmup_seconds = None
+        self.steps = {}
+
+    def mark_ready(self):
+        self.ready = True
+        self.warmup_seconds = round(time.monotonic() - self.started_at, 3)
+
+    def stats(self):
+        return {
+            "status": "ready" if self.ready else "starting",
+            "warmup_seconds": self.warmup_seconds,
+            "warmup": self.steps,
+        }
+
+
+readiness = Readiness()
+
+
+def base_url(name):
+    return {"serper": upstream.SERPER_BASE_URL, "jina": upstream.JINA_BASE_URL}[name]
+
+
+async def preconnect(name, connections=STARTUP_WARM_CONNECTIONS):
+    """Open `connections` pooled connections to one upstream with cheap HEAD requests."""
+    client = upstream.get_client(name)
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.head(base_url(name) + "/") for _ in range(connections)), return_exceptions=True
+    )
+    errors = [f"{type(r).__name__}: {r}" for r in results if isinstance(r, BaseException)]
+    step = {"ok": not errors, "connections": connections - len(errors), "seconds": round(time.perf_counter() - started, 3)}
+    if errors:
+        step["error"] = errors[0]
+    return step
+
+
+async def warm_tools(mcp):
+    started = time.perf_counter()
+    tools = await mcp.get_tools()
+    for tool in tools.values():
+        tool.to_mcp_tool()
+    return {"ok": True, "tools": len(tools), "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def warm_extract_pool():
+    started = time.perf_counter()
+    workers = await extract.extract_pool.warm()
+    return {"ok": True, "workers": workers, "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def warm_up(mcp):
+    async def step(name, coro):
+        try:
+            readiness.steps[name] = await coro
+        except Exception as e:
+            readiness.steps[name] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    steps = [step("tools", warm_tools(mcp))]
+    if extract.FETCH_ENGINE == "local" and extract.extract_pool.kind != "inline":
+        steps.append(step("extract_pool", warm_extract_pool()))
+    if STARTUP_WARM_CONNECTIONS > 0:
+        steps += [step(name, preconnect(name)) for name in WARM_UPSTREAMS]
+    try:
+        await asyncio.wait_for(asyncio.gather(*steps), STARTUP_WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        readiness.steps["timeout"] = STARTUP_WARMUP_TIMEOUT
+    readiness.mark_ready()
+
+
+def with_warmup(app_lifespan, mcp):
+    """Wrap a Starlette lifespan so warm-up runs in the background once it has started."""
+
+    @asynccontextmanager
+    async def combined(app):
+        async with app_lifespan(app) as state:
+            readiness.started_at = time.monotonic()
+            if not STARTUP_WARMUP:
+                readiness.mark_ready()
+                yield state
+                return
+            task = asyncio.create_task(warm_up(mcp))
+            try:
+                yield state
+            finally:
+                task.cancel()
+
+    return combined
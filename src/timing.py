@@ -0,0 +1,247 @@
+"""Per-request phase timing: `Server-Timing` header, JSON access log, profiler.
+
+`TimingMiddleware` wraps the whole app. For every HTTP request it opens a
+`RequestTiming` in a context variable. The layers underneath add the time they
+spend to that object:
+
+- `auth`: key resolution in FrontDoorMiddleware
+- `tool`: the tool body, from ToolMetricsMiddleware
+- `<upstream>-connect`, `-ttfb`, `-body`: httpx trace events via PhaseTracer
+- `decode` / `encode`: parsing Serper.dev JSON and encoding tool results
+- `extract`: local HTML extraction
+- `compress`: gzip / brotli of the response body (CompressionMiddleware)
+- `queue`: waiting for a fair-queue slot (AdmissionMiddleware)
+
+Upstream phases are summed over every call a request makes, so with
+concurrent fetches they can add up to more than `total`. `dispatch` is what
+is left of `total` after `auth` and `tool`: FastMCP's JSON-RPC handling and
+transport.
+
+Tools of a stateful MCP session run in the session's own task, where the
+context variable belongs to the request that opened the session. The timing
+is therefore also put on the scope (`request.state.timing`), and
+ToolMetricsMiddleware makes the one of the current request current again.
+
+The `Server-Timing` header goes out with the first body chunk. For plain JSON
+responses it covers the whole request; for a tool call answered over SSE
+(`text/event-stream` on POST) it covers the work up to the first event. Only
+the GET event stream of a stateful session gets its headers right away and no
+`Server-Timing`, since its first event can be minutes off. The access log line is written when the response is finished and
+always has the full breakdown. It is sampled with ACCESS_LOG_SAMPLE_RATE;
+errors and requests slower than ACCESS_LOG_SLOW_MS are always logged.
+
+`profile_handler` serves `/debug/profile`. It only exists when PROFILE_TOKEN
+is set. It runs cProfile on the event loop thread for a few seconds and
+returns the pstats report.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+
+from .asgi import is_event_stream
+from .config import env_bool, env_float, env_int, env_str
+
+SERVER_TIMING = env_bool("SERVER_TIMING", True)
+ACCESS_LOG = env_bool("ACCESS_LOG", True)
+# Fraction of requests that get a log line (errors and slow requests always do)
+ACCESS_LOG_SAMPLE_RATE = env_float("ACCESS_LOG_SAMPLE_RATE", 1.0)
+ACCESS_LOG_SLOW_MS = env_float("ACCESS_LOG_SLOW_MS", 2000)
+
+# Empty = no /debug/profile route at all
+PROFILE_TOKEN = env_str("PROFILE_TOKEN", "")
+PROFILE_MAX_SECONDS = env_float("PROFILE_MAX_SECONDS", 30)
+PROFILE_DEFAULT_LINES = env_int("PROFILE_DEFAULT_LINES", 40)
+
+access_log = logging.getLogger("serper_mcp.access")
+if not access_log.handlers:
+    # One bare JSON object per line on stderr, next to uvicorn's own logs
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    access_log.addHandler(_handler)
+    access_log.setLevel(logging.INFO)
+    access_log.propagate = False
+
+
+class RequestTiming:
+    """Phase durations (seconds) collected for one HTTP request."""
+
+    __slots__ = ("request_id", "started", "phases", "tools")
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.tools = []
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def breakdown(self):
+        """Phases in milliseconds, with derived `dispatch` and `total`."""
+        total = time.perf_counter() - self.started
+        phases = dict(self.phases)
+        if "tool" in phases:
+            phases["dispatch"] = max(0.0, total - phases["tool"] - phases.get("auth", 0.0))
+        phases["total"] = total
+        return {name: round(seconds * 1000, 2) for name, seconds in phases.items()}
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.breakdown().items())
+
+
+current = ContextVar("request_timing", default=None)
+
+
+def add(name, seconds):
+    """Add `seconds` to phase `name` of the running request, if any."""
+    timing = current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def phase(name):
+    timing = current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def request_id_from(headers):
+    for name, value in headers:
+        if name == b"x-request-id":
+            value = value.decode("latin-1").strip()
+            # Reuse the caller's id so logs line up across hops, but keep it bounded
+            if value and len(value) <= 64 and value.isprintable():
+                return value
+            break
+    return uuid.uuid4().hex
+
+
+class TimingMiddleware:
+    """Pure ASGI layer: Server-Timing and X-Request-ID headers, one JSON log line per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timing = RequestTiming(request_id_from(scope["headers"]))
+        token = current.set(timing)
+        # Stateful MCP sessions run tools in the session's task, outside this context
+        scope.setdefault("state", {})["timing"] = timing
+        status = [0]
+        size = [0]
+        held = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = [*message.get("headers", []), (b"x-request-id", timing.request_id.encode("latin-1"))]
+                if scope["method"] == "GET" and is_event_stream(headers):
+                    # Long-lived session stream: the client waits for these headers, the phases go to the access log
+                    return await send({**message, "headers": headers})
+                # Held back until the body is ready, so the header includes the work done for it
+                held.append({**message, "headers": headers})
+                return
+            if message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+                if held:
+                    start = held.pop()
+                    if SERVER_TIMING:
+                        start["headers"].append((b"server-timing", timing.header().encode("latin-1")))
+                    await send(start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
+            if held:  # app ended without a body; still answer the start
+                await send(held.pop())
+            if ACCESS_LOG:
+                self.log(scope, timing, status[0], size[0])
+
+    @staticmethod
+    def log(scope, timing, status, size):
+        phases = timing.breakdown()
+        if not (
+            status >= 500
+            or status == 0
+            or phases["total"] >= ACCESS_LOG_SLOW_MS
+            or random.random() < ACCESS_LOG_SAMPLE_RATE
+        ):
+            return
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "request_id": timing.request_id,
+            "method": scope["method"],
+            # The path only: the query string can carry ?api_key=
+            "path": scope["path"],
+            "status": status,
+            "bytes": size,
+            "tool": ",".join(timing.tools) or None,
+            "duration_ms": phases["total"],
+            "phases": phases,
+        }
+        access_log.info(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def profile_handler(request):
+    """GET /debug/profile?seconds=5&sort=cumulative&lines=40 (X-Profile-Token header required).
+
+    Profiles everything that runs on the event loop during the window. With
+    format=pstats the raw stats come back, for snakeviz or `pstats`.
+    """
+    supplied = request.headers.get("x-profile-token", "")
+    if not PROFILE_TOKEN or not hmac.compare_digest(supplied, PROFILE_TOKEN):
+        return JSONResponse({"error": "Invalid or missing X-Profile-Token"}, status_code=403)
+    try:
+        seconds = min(float(request.query_params.get("seconds", 5)), PROFILE_MAX_SECONDS)
+        lines = int(request.query_params.get("lines", PROFILE_DEFAULT_LINES))
+    except ValueError:
+        return JSONResponse({"error": "seconds and lines must be numbers"}, status_code=400)
+    sort = request.query_params.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "ncalls"):
+        return JSONResponse({"error": "sort must be cumulative, tottime or ncalls"}, status_code=400)
+    if _profile_lock.locked():
+        return JSONResponse({"error": "A profile is already running"}, status_code=409)
+
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(max(0.0, seconds))
+        finally:
+            profiler.disable()
+
+    if request.query_params.get("format") == "pstats":
+        profiler.create_stats()
+        return Response(marshal.dumps(profiler.stats), media_type="application/octet-stream")
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(sort).print_stats(lines)
+    return PlainTextResponse(out.getvalue())
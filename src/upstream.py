@@ -0,0 +1,203 @@
+"""Process-wide pooled HTTP clients for the upstreams behind the tools.
+
+Every tool call used to build a fresh `httpx.AsyncClient()`, paying DNS, TCP
+and TLS to google.serper.dev / r.jina.ai on each call. Instead we keep one
+keep-alive pool per upstream for the lifetime of the app: `lifespan()` opens
+them when the ASGI app starts and closes them on shutdown.
+
+Each upstream has its own timeout budget and connection limits so a slow
+r.jina.ai cannot eat the connections Serper.dev needs.
+
+The `direct` client fetches URLs the model chose. Its hooks refuse anything
+but http(s) to public addresses, on every redirect hop, so a prompt cannot
+point it at cloud metadata or services on the internal network.
+"""
+import asyncio
+import importlib.util
+import ipaddress
+import socket
+from contextlib import asynccontextmanager
+
+import httpx
+
+from .config import env_bool, env_float, env_int, env_str
+from .metrics import upstream_event_hooks
+
+SERPER_BASE_URL = env_str("SERPER_BASE_URL", "https://google.serper.dev").rstrip("/")
+JINA_BASE_URL = env_str("JINA_BASE_URL", "https://r.jina.ai").rstrip("/")
+
+# Pool sizing, shared by all upstream clients
+MAX_CONNECTIONS = env_int("UPSTREAM_MAX_CONNECTIONS", 100)
+MAX_KEEPALIVE_CONNECTIONS = env_int("UPSTREAM_MAX_KEEPALIVE", 20)
+KEEPALIVE_EXPIRY = env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)
+CONNECT_TIMEOUT = env_float("UPSTREAM_CONNECT_TIMEOUT", 5.0)
+POOL_TIMEOUT = env_float("UPSTREAM_POOL_TIMEOUT", 10.0)
+HTTP2 = env_bool("UPSTREAM_HTTP2", False)
+
+# Per-upstream read/write budget (the old hard-coded 30s / 60s)
+UPSTREAM_TIMEOUTS = {
+    "serper": env_float("SERPER_TIMEOUT", 30.0),
+    "jina": env_float("JINA_TIMEOUT", 60.0),
+    # Direct GET of the target page (hedge route for fetch)
+    "direct": env_float("DIRECT_FETCH_TIMEOUT", 30.0),
+}
+
+
+# Only for test setups and intranets: let direct fetches reach private and loopback addresses
+FETCH_ALLOW_PRIVATE = env_bool("FETCH_ALLOW_PRIVATE", False)
+
+
+class BlockedDestination(httpx.RequestError):
+    """A direct fetch aimed at a non-HTTP scheme or a non-public address."""
+
+
+def is_public_address(address):
+    """False for loopback, private, link-local, reserved and multicast addresses."""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_destination(request):
+    """Request hook: httpx runs it for the first request and for every redirect hop."""
+    if FETCH_ALLOW_PRIVATE:
+        return
+    url = request.url
+    if url.scheme not in ("http", "https"):
+        raise BlockedDestination(f"scheme {url.scheme!r} is not allowed", request=request)
+    port = url.port or (443 if url.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise httpx.ConnectError(f"cannot resolve {url.host}: {e}", request=request) from e
+    for *_, sockaddr in infos:
+        if not is_public_address(sockaddr[0]):
+            raise BlockedDestination(f"{url.host} resolves to non-public address {sockaddr[0]}", request=request)
+
+
+async def check_peer(response):
+    """Response hook: the address actually connected to must be public too (DNS rebinding)."""
+    if FETCH_ALLOW_PRIVATE:
+        return
+    stream = response.extensions.get("network_stream")
+    peer = stream.get_extra_info("server_addr") if stream is not None else None
+    if peer and not is_public_address(peer[0]):
+        raise BlockedDestination(f"connected to non-public address {peer[0]}", request=response.request)
+
+
+def _http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_client(name):
+    """Build the pooled client for one upstream (`serper`, `jina`, ...)."""
+    total = UPSTREAM_TIMEOUTS.get(name, 30.0)
+    http2 = HTTP2
+    if http2 and not _http2_available():
+        print("⚠️ UPSTREAM_HTTP2=1 maar 'h2' is niet geïnstalleerd, val terug op HTTP/1.1")
+        http2 = False
+    event_hooks = upstream_event_hooks(name)
+    if name == "direct":
+        event_hooks["request"].append(check_destination)
+        event_hooks["response"].insert(0, check_peer)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(total, connect=min(CONNECT_TIMEOUT, total), pool=POOL_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+        follow_redirects=(name == "direct"),
+        event_hooks=event_hooks,
+    )
+
+
+class UpstreamClients:
+    """Registry of one long-lived client per upstream name."""
+
+    def __init__(self):
+        self._clients = {}
+
+    def get(self, name):
+        # Lazily built so tools also work outside the HTTP app (e.g. stdio runs)
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = build_client(name)
+        return client
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+clients = UpstreamClients()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent upstream calls into one.
+
+    While a call for `key` is in flight, later callers await the same task
+    instead of starting their own. The task is shielded: cancelling one waiter
+    never cancels the shared call, and its result or exception reaches every
+    waiter. The key is forgotten as soon as the call finishes, so this only
+    deduplicates overlapping requests, it does not cache.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved when every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+singleflight = SingleFlight()
+
+
+def get_client(name):
+    return clients.get(name)
+
+
+@asynccontextmanager
+async def lifespan():
+    """Own the upstream pools for the duration of the ASGI app lifespan."""
+    for name in UPSTREAM_TIMEOUTS:
+        clients.get(name)
+    try:
+        yield clients
+    finally:
+        await clients.aclose()
+
+
+def with_upstream_lifespan(app_lifespan):
+    """Wrap a Starlette lifespan so the upstream pools start before and close after it."""
+
+    @asynccontextmanager
+    async def combined(app):
+        async with lifespan():
+            async with app_lifespan(app) as state:
+                yield state
+
+    return combined
@@ -0,0 +1,76 @@
+"""Shared fixtures: the server app in-process, against local stub upstreams.
+
+Module constants in src/ are read from the environment at import time, so the
+defaults that keep tests offline and isolated are set before anything imports
+src. Per-test settings are patched on the modules instead.
+"""
+import asyncio
+import os
+
+import pytest
+import uvicorn
+
+# Warm-up HEAD requests would show up in the stub's request counts
+os.environ.setdefault("STARTUP_WARMUP", "0")
+# One JSON access log line per call would drown the test output
+os.environ.setdefault("ACCESS_LOG", "0")
+# A page store on disk would carry pages over from earlier runs
+os.environ.setdefault("FETCH_STORE_PATH", "memory")
+os.environ.setdefault("SEARCH_CACHE_PATH", "")
+
+from bench.fake_openai import FakeOpenAI  # noqa: E402
+from bench.loadtest import free_port  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """src.server with fresh caches, page store, breakers and limiters."""
+    from src import server
+    from src.cache import SearchCache
+    from src.page_store import PageStore
+    from src.pages import PageBuffer
+    from src.resilience import breakers, limiters
+
+    monkeypatch.setattr(server, "search_cache", SearchCache(path=""))
+    monkeypatch.setattr(server, "page_store", PageStore(path="memory"))
+    monkeypatch.setattr(server, "page_buffer", PageBuffer())
+    breakers._breakers.clear()
+    limiters._limiters.clear()
+    yield server
+    breakers._breakers.clear()
+    limiters._limiters.clear()
+
+
+@pytest.fixture
+def point_at(monkeypatch):
+    """Route Serper.dev and r.jina.ai traffic to a running StubUpstream."""
+    from src import upstream
+
+    def point(stub):
+        monkeypatch.setattr(upstream, "SERPER_BASE_URL", stub.base_url)
+        monkeypatch.setattr(upstream, "JINA_BASE_URL", stub.base_url)
+
+    return point
+
+
+@pytest.fixture
+async def fake_openai():
+    """FakeOpenAI served over HTTP, for the batch and deep research scripts (run as subprocesses).
+
+    Yields a factory: `await fake_openai(**kwargs)` -> (fake, base_url).
+    """
+    servers = []
+
+    async def start(**kwargs):
+        fake = FakeOpenAI(**kwargs)
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="critical"))
+        servers.append((server, asyncio.create_task(server.serve())))
+        while not server.started:
+            await asyncio.sleep(0.01)
+        return fake, f"http://127.0.0.1:{port}/v1"
+
+    yield start
+    for server, serving in servers:
+        server.should_exit = True
+        await serving
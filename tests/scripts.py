@@ -0,0 +1,28 @@
+"""Run the repo's top-level batch scripts as subprocesses, like a user would."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def script_env(base_url, **extra):
+    """Environment for a script against FakeOpenAI at `base_url`."""
+    return {
+        **os.environ,
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "fake-key",
+        "SERPAPI_API_KEY": "fake-key",
+        **{name: str(value) for name, value in extra.items()},
+    }
+
+
+async def run_script(script, cwd, env, *args):
+    """(exit code, combined output) of `python <script> <args>` in `cwd`."""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(REPO_ROOT / script), *args,
+        cwd=cwd, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+    )
+    output, _ = await process.communicate()
+    return process.returncode, output.decode()
@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import pytest
+
+from bench.harness import MCP_HEADERS, asgi_request, asgi_scope, in_process_client, rpc
+from src import admission
+from src.admission import AdmissionMiddleware, FairQueue, Overloaded, is_tool_call, parse_classes
+
+
+async def drain(queue, order, tenant_id, calls):
+    async def one():
+        tenant = await queue.acquire(tenant_id)
+        order.append(tenant_id)
+        await asyncio.sleep(0)
+        queue.release(tenant, 0.001)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+
+
+async def test_backlogged_tenants_share_slots_by_weight():
+    queue = FairQueue(capacity=1, classes={"default": (1.0, 1), "interactive": (4.0, 1)},
+                      tenant_classes={"shop": "interactive"}, queue_timeout=10, max_queue=100)
+    blocker = await queue.acquire("warm-up")
+    order = []
+    batch = asyncio.create_task(drain(queue, order, "batch", 40))
+    shop = asyncio.create_task(drain(queue, order, "shop", 40))
+    await asyncio.sleep(0.01)
+    queue.release(blocker)
+    await asyncio.gather(batch, shop)
+    # While both are backlogged, the weight-4 tenant gets four slots for every one of weight 1
+    first = order[:25]
+    assert first.count("shop") == 20 and first.count("batch") == 5
+
+
+async def test_tenant_cap_leaves_room_for_others():
+    queue = FairQueue(capacity=4, classes={"default": (1.0, 2)}, tenant_classes={}, queue_timeout=10)
+    held = [await queue.acquire("batch"), await queue.acquire("batch")]
+    waiting = asyncio.create_task(queue.acquire("batch"))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    other = await asyncio.wait_for(queue.acquire("shop"), 1)
+    assert queue.in_flight == 3
+    queue.release(held[0])
+    await asyncio.wait_for(waiting, 1)
+    for tenant in (held[1], other, waiting.result()):
+        queue.release(tenant)
+    assert queue.in_flight == 0
+
+
+async def test_full_queue_is_shed():
+    queue = FairQueue(capacity=1, classes={"default": (1.0, 1)}, tenant_classes={}, queue_timeout=10, max_queue=1)
+    tenant = await queue.acquire("batch")
+    waiting = asyncio.create_task(queue.acquire("batch"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(Overloaded) as shed:
+        await queue.acquire("batch")
+    assert shed.value.reason == "queue_full"
+    queue.release(tenant)
+    queue.release(await waiting)
+
+
+def test_parse_classes_skips_invalid_entries():
+    classes = parse_classes("interactive=4/16,batch=1/4,broken=x/2")
+    assert classes["interactive"] == (4.0, 16) and classes["batch"] == (1.0, 4)
+    assert "broken" not in classes and "default" in classes
+
+
+def test_is_tool_call():
+    assert is_tool_call(json.dumps(rpc("tools/call", {"name": "search"})))["method"] == "tools/call"
+    assert is_tool_call(json.dumps([rpc("tools/list"), rpc("tools/call", id=2)]))["id"] == 2
+    assert is_tool_call(json.dumps(rpc("tools/list"))) is None
+    assert is_tool_call(b"{not json") is None
+
+
+class RecordingApp:
+    def __init__(self, queue):
+        self.queue = queue
+        self.seen = []
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        self.seen.append((body, self.queue.in_flight))
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"{}", "more_body": False})
+
+
+def mcp_scope():
+    return asgi_scope("POST", "/mcp", [(k.encode(), v.encode()) for k, v in MCP_HEADERS.items()])
+
+
+async def test_only_tool_calls_take_a_slot_and_the_body_is_replayed():
+    queue = FairQueue(capacity=2, tenant_classes={}, queue_timeout=10)
+    app = RecordingApp(queue)
+    middleware = AdmissionMiddleware(app, queue)
+    listing = json.dumps(rpc("tools/list")).encode()
+    call = json.dumps(rpc("tools/call", {"name": "search", "arguments": {"query": "relais"}})).encode()
+
+    await asgi_request(middleware, mcp_scope(), listing)
+    await asgi_request(middleware, mcp_scope(), call)
+    assert app.seen == [(listing, 0), (call, 1)]
+    assert queue.in_flight == 0
+
+
+async def test_overloaded_tool_call_gets_503_with_retry_after():
+    queue = FairQueue(capacity=1, classes={"default": (1.0, 1)}, tenant_classes={}, queue_timeout=10, max_queue=0)
+    middleware = AdmissionMiddleware(RecordingApp(queue), queue)
+    call = json.dumps(rpc("tools/call", {"name": "search"}, id=7)).encode()
+    status, headers, chunks, _, _ = await asgi_request(middleware, mcp_scope(), call)
+    reply = json.loads(b"".join(chunks))
+    assert status == 503 and "retry-after" in headers
+    assert reply["id"] == 7 and reply["error"]["code"] == -32000
+    assert queue.class_stats["default"].shed["queue_full"] == 1
+
+
+def test_classes_without_a_cap_get_the_queue_capacity():
+    assert parse_classes("batch=1", capacity=3) == {"batch": (1.0, 3), "default": (1.0, 3)}
+    queue = FairQueue(capacity=3, tenant_classes={}, queue_timeout=10)
+    assert queue.classes["default"] == (1.0, 3)
+
+
+async def test_oversized_body_is_queued_and_streamed_through(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_PEEK_BYTES", 1024)
+    queue = FairQueue(capacity=1, classes={"default": (1.0, 1)}, tenant_classes={}, queue_timeout=10)
+    app = RecordingApp(queue)
+    middleware = AdmissionMiddleware(app, queue)
+    parts = [b"x" * 800] * 4
+    read = []
+
+    async def receive():
+        read.append(len(parts))
+        if parts:
+            return {"type": "http.request", "body": parts.pop(), "more_body": bool(parts)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    blocker = await queue.acquire("warm-up")
+    task = asyncio.create_task(middleware(mcp_scope(), receive, send))
+    await asyncio.sleep(0.01)
+    # Only the peek was read; the request waits for a slot like a tool call
+    assert not task.done() and len(read) == 2 and queue.queued == 1
+    queue.release(blocker)
+    await asyncio.wait_for(task, 1)
+    assert app.seen == [(b"x" * 3200, 1)]
+
+
+async def test_tenant_hashes_only_behind_the_stats_token(server, monkeypatch):
+    tenant = await server.fair_queue.acquire("a1b2c3d4")
+    try:
+        async with in_process_client(server.create_app()) as client:
+            public = (await client.get("/stats")).json()["admission"]
+            assert "busy_tenants" not in public and public["in_flight"] >= 1
+
+            monkeypatch.setattr(server, "STATS_TOKEN", "geheim")
+            assert (await client.get("/stats")).status_code == 403
+            assert (await client.get("/metrics", headers={"X-Stats-Token": "fout"})).status_code == 403
+            assert (await client.get("/metrics", headers={"Authorization": "Bearer geheim"})).status_code == 200
+            private = (await client.get("/stats", headers={"X-Stats-Token": "geheim"})).json()["admission"]
+            assert "a1b2c3d4" in private["busy_tenants"]
+    finally:
+        server.fair_queue.release(tenant)
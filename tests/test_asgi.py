@@ -0,0 +1,14 @@
+from src import compression, timing
+from src.asgi import is_event_stream
+
+
+def test_is_event_stream_ignores_case():
+    assert is_event_stream([(b"content-type", b"text/event-stream")])
+    assert is_event_stream([(b"Content-Type", b"Text/Event-Stream; charset=utf-8")])
+    assert not is_event_stream([(b"content-type", b"application/json")])
+    assert not is_event_stream([(b"x-content-type", b"text/event-stream")])
+    assert not is_event_stream([])
+
+
+def test_timing_and_compression_share_the_helper():
+    assert timing.is_event_stream is compression.is_event_stream is is_event_stream
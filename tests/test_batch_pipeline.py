@@ -0,0 +1,54 @@
+"""submit -> collect -> resume end-to-end against the fake OpenAI endpoints.
+
+The fake breaks off the first output download halfway and fails every
+ERROR_EVERY-th request. The first collect run therefore has to fail. The
+second must finish without downloading finished files again, and every Excel
+row must end up exactly once in the results, as a parsed <json> block or as
+an error.
+"""
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from tests.scripts import run_script, script_env
+
+ROWS = 300
+ARTICLES = 100
+MAX_REQUESTS = 25
+ERROR_EVERY = 7
+
+
+async def test_submit_collect_and_resume(fake_openai, tmp_path):
+    fake, base_url = await fake_openai(complete_after_polls=2, error_every=ERROR_EVERY, truncate_downloads=1)
+    pd.DataFrame({
+        "Artikelnummer": [f"ART-{i % ARTICLES:05d}" for i in range(ROWS)],
+        "Omschrijving": [f"Relais {i % ARTICLES}" for i in range(ROWS)],
+        "Artikel_Groep": ["Schakelmateriaal"] * ROWS,
+    }).to_excel(tmp_path / "excel.xlsx", index=False)
+    env = script_env(
+        base_url, BATCH_MAX_REQUESTS=MAX_REQUESTS, BATCH_POLL_MIN_INTERVAL=0.05, BATCH_POLL_MAX_INTERVAL=0.2
+    )
+
+    code, output = await run_script("openai_batch_submit.py", tmp_path, env)
+    assert code == 0, output
+    # Duplicate articles are submitted once
+    assert len(fake.batches) == -(-ARTICLES // MAX_REQUESTS)
+
+    code, output = await run_script("openai_batch_collect.py", tmp_path, env)
+    assert code == 1, output
+
+    downloads_before = dict(fake.downloads)
+    code, output = await run_script("openai_batch_collect.py", tmp_path, env)
+    assert code == 0, output
+    # Only the file behind the broken-off download is fetched again
+    again = [f for f, n in fake.downloads.items() if downloads_before.get(f, 0) and n > downloads_before[f]]
+    assert len(again) == 1
+
+    records = [json.loads(line) for line in Path(tmp_path, "batch_results.jsonl").read_text().splitlines()]
+    assert sorted(r["row"] for r in records) == list(range(ROWS))
+    assert all(bool(r["result"]) != bool(r["error"]) for r in records)
+    assert any(r["error"] for r in records)
+
+    excel = pd.read_excel(tmp_path / "batch_results.xlsx")
+    assert len(excel) == ROWS and "result.manufacturer" in excel and "Artikelnummer" in excel
@@ -0,0 +1,48 @@
+from src.cache import LRUCache, SearchCache, cache_key, normalize_query
+
+
+def test_normalize_query_ignores_case_width_and_whitespace():
+    assert normalize_query("  Siemens   6ES7214 ") == "siemens 6es7214"
+    assert normalize_query("ＡＢＣ\t123") == normalize_query("abc 123")
+
+
+def test_cache_key_covers_query_and_payload_parameters():
+    payload = {"q": "Relais 24V", "gl": "nl", "hl": "nl", "num": 10}
+    assert cache_key("key", payload) == cache_key("key", {**payload, "q": "  relais   24v"})
+    assert cache_key("key", payload) != cache_key("key", {**payload, "gl": "de"})
+    assert cache_key("key", payload) != cache_key("key", {**payload, "hl": "en"})
+    assert cache_key("key", payload) != cache_key("key", {**payload, "num": 20})
+
+
+def test_cache_key_is_namespaced_per_api_key():
+    payload = {"q": "relais"}
+    assert cache_key("tenant-a", payload) != cache_key("tenant-b", payload)
+    assert "tenant-a" not in cache_key("tenant-a", payload)
+
+
+def test_lru_evicts_least_recently_used_and_expires():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.set("old", 4, expires_at=100.0)
+    assert cache.get("old", now=101.0) is None
+    assert cache.expirations == 1
+
+
+async def test_search_cache_persists_in_sqlite(tmp_path):
+    path = str(tmp_path / "cache.db")
+    payload = {"q": "relais", "gl": "nl"}
+    first = SearchCache(path=path, ttl=60)
+    await first.set("key", payload, '{"organic": []}')
+    first.close()
+
+    restarted = SearchCache(path=path, ttl=60)
+    assert await restarted.get("key", payload) == '{"organic": []}'
+    assert await restarted.get("other-key", payload) is None
+    assert restarted.disk_hits == 1 and restarted.misses == 1
+    restarted.close()
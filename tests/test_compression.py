@@ -0,0 +1,101 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+from bench.harness import asgi_request, asgi_scope
+from src.compression import CompressionMiddleware, negotiate
+
+
+def test_negotiate_follows_server_order_and_q_values():
+    offered = ["br", "gzip"]
+    assert negotiate("gzip, deflate, br", offered) == "br"
+    assert negotiate("gzip, br;q=0", offered) == "gzip"
+    assert negotiate("deflate", offered) is None
+    assert negotiate("*;q=0.5", offered) == "br"
+    assert negotiate("*, br;q=0, gzip;q=0", offered) is None
+    assert negotiate("gzip;q=bogus", offered) is None
+    assert negotiate("GZIP", ["gzip"]) == "gzip"
+
+
+def json_app(body):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+        ]})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+    return app
+
+
+def sse_app(events):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")
+        ]})
+        for event in events:
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    return app
+
+
+GZIP = [(b"accept-encoding", b"gzip")]
+
+
+async def test_large_json_body_is_compressed_in_one_shot():
+    body = json.dumps({"organic": [{"title": "relais", "snippet": "x" * 50}] * 100}).encode()
+    status, headers, chunks, _, _ = await asgi_request(CompressionMiddleware(json_app(body)), asgi_scope("POST", "/mcp", GZIP))
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(b"".join(chunks))
+    assert gzip.decompress(b"".join(chunks)) == body
+
+
+async def test_small_body_and_identity_pass_unchanged():
+    body = b'{"ok": true}'
+    status, headers, chunks, _, _ = await asgi_request(CompressionMiddleware(json_app(body)), asgi_scope("POST", "/mcp", GZIP))
+    assert "content-encoding" not in headers and headers["vary"] == "Accept-Encoding"
+    assert b"".join(chunks) == body
+
+    big = b"[" + b"1," * 2000 + b"1]"
+    status, headers, chunks, _, _ = await asgi_request(CompressionMiddleware(json_app(big)), asgi_scope("POST", "/mcp"))
+    assert "content-encoding" not in headers and b"".join(chunks) == big
+
+
+async def test_event_stream_is_flushed_per_event():
+    events = [f"event: message\ndata: {json.dumps({'rank': i, 'text': 'pagina ' * 200})}\n\n".encode() for i in range(3)]
+    status, headers, chunks, _, _ = await asgi_request(CompressionMiddleware(sse_app(events)), asgi_scope("GET", "/mcp", GZIP))
+    assert headers["content-type"] == "text/event-stream"
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    # Every body message decodes to whole events on its own, without waiting for the end
+    decoder = zlib.decompressobj(31)
+    decoded = [decoder.decompress(chunk) for chunk in chunks if chunk]
+    assert decoded[:3] == events
+    assert b"".join(decoded) + decoder.flush() == b"".join(events)
+
+
+async def test_event_stream_headers_go_out_before_the_first_event():
+    release = asyncio.Event()
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        await release.wait()
+        await send({"type": "http.response.body", "body": b"event: message\ndata: {}\n\n", "more_body": False})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    task = asyncio.create_task(CompressionMiddleware(app)(asgi_scope("GET", "/mcp", GZIP), receive, send))
+    await asyncio.sleep(0.05)
+    assert [m["type"] for m in sent] == ["http.response.start"]
+    assert dict(sent[0]["headers"])[b"content-encoding"] == b"gzip"
+    release.set()
+    await task
+    assert gzip.decompress(b"".join(m.get("body", b"") for m in sent[1:])) == b"event: message\ndata: {}\n\n"
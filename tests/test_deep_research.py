@@ -0,0 +1,114 @@
+"""deep_research_mcp.py runs questions concurrently, capped, and resumes after a crash.
+
+The first run is killed (SIGKILL) once KILL_AFTER results are on disk; the
+second run has to finish the rest. A question the kill caught during its
+create call is in the state file without a response id. The test adds one
+such entry itself, so that path always runs. The second run must leave those
+questions alone; a third run with `--resubmit-unconfirmed` sends them again.
+"""
+import asyncio
+import json
+import signal
+import sys
+import time
+from collections import Counter
+
+from tests.scripts import REPO_ROOT, run_script, script_env
+
+ITEMS = 30
+CONCURRENCY = 5
+KILL_AFTER = 10
+ERROR_EVERY = 9
+
+
+def result_lines(path):
+    return path.read_text().count("\n") if path.is_file() else 0
+
+
+def question(i):
+    return f"Wat is de opvolger van relais RL-{int(i):03d}?"
+
+
+async def test_concurrent_runs_resume_after_a_kill(fake_openai, tmp_path):
+    fake, base_url = await fake_openai(complete_after_polls=2, error_every=ERROR_EVERY, response_seconds=0.3)
+    questions = tmp_path / "vragen.txt"
+    questions.write_text("".join(question(i) + "\n" for i in range(ITEMS)))
+    results = tmp_path / "deep_research_results.jsonl"
+    state_path = tmp_path / "deep_research_state.json"
+    env = script_env(base_url, DEEP_RESEARCH_POLL_MIN_INTERVAL=0.05, DEEP_RESEARCH_POLL_MAX_INTERVAL=0.2)
+    args = ["--input", str(questions), "--concurrency", str(CONCURRENCY)]
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(REPO_ROOT / "deep_research_mcp.py"), *args,
+        cwd=tmp_path, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    while result_lines(results) < KILL_AFTER and process.returncode is None:
+        await asyncio.sleep(0.02)
+    process.send_signal(signal.SIGKILL)
+    await process.wait()
+    assert result_lines(results) < ITEMS
+
+    # Eén vraag die nog niet verstuurd is, alsof de kill tussen vastleggen en create viel
+    state = json.loads(state_path.read_text())
+    done = {json.loads(line)["id"] for line in results.read_text().splitlines()}
+    fresh = next(str(i) for i in range(ITEMS) if str(i) not in done and str(i) not in state["pending"])
+    state["pending"][fresh] = {"response_id": None, "submitted_at": time.time()}
+    state_path.write_text(json.dumps(state))
+    unconfirmed = sorted(i for i, lopend in state["pending"].items() if not lopend["response_id"])
+
+    def submissions(item_ids):
+        sent = Counter(fake.response_inputs.values())
+        return sum(sent[question(i)] for i in item_ids)
+
+    before = submissions(unconfirmed)
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args)
+    assert code == 1, output
+    assert submissions(unconfirmed) == before
+    assert sorted(json.loads(state_path.read_text())["pending"]) == unconfirmed
+
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args, "--resubmit-unconfirmed")
+    # Exit code 1 betekent: klaar, maar met mislukte vragen (die de fake bewust laat falen)
+    assert code in (0, 1), output
+
+    records = [json.loads(line) for line in results.read_text().splitlines()]
+    ids = Counter(r["id"] for r in records)
+    assert sorted(ids) == sorted(str(i) for i in range(ITEMS)) and max(ids.values()) == 1
+    # Only the explicit resubmit may create a second response for a question
+    orphans = len(fake.responses) - len(set(fake.response_inputs.values()))
+    assert orphans <= len(unconfirmed)
+    assert fake.peak_active_responses <= CONCURRENCY + orphans
+    failed = sum(1 for r in records if r["status"] != "completed")
+    assert failed > 0
+    assert sum(1 for r in records if r.get("result")) == ITEMS - failed
+    assert sum(r.get("tool_calls", 0) for r in records) > 0
+
+
+async def test_failed_polls_and_lost_creates_stay_pending(fake_openai, tmp_path):
+    # De SDK probeert een 500 zelf nog twee keer; daarna faalt de poll van de run
+    fake, base_url = await fake_openai(complete_after_polls=1, fail_polls=3)
+    questions = tmp_path / "vragen.txt"
+    questions.write_text(question(1) + "\n")
+    results = tmp_path / "deep_research_results.jsonl"
+    state_path = tmp_path / "deep_research_state.json"
+    env = script_env(base_url, DEEP_RESEARCH_POLL_MIN_INTERVAL=0.05, DEEP_RESEARCH_POLL_MAX_INTERVAL=0.2)
+    args = ["--input", str(questions)]
+
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args)
+    assert code == 1, output
+    assert result_lines(results) == 0
+    assert json.loads(state_path.read_text())["pending"]["0"]["response_id"] in fake.responses
+
+    # De volgende run pakt dezelfde response op in plaats van de vraag opnieuw te versturen
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args)
+    assert code == 0, output
+    assert len(fake.responses) == 1 and json.loads(results.read_text())["status"] == "completed"
+
+    # Een create die OpenAI bereikte maar met een fout terugkwam, blijft als onbevestigd staan
+    fake.lost_creates = 3
+    questions.write_text(question(1) + "\n" + question(2) + "\n")
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args)
+    assert code == 1, output
+    assert json.loads(state_path.read_text())["pending"]["1"]["response_id"] is None
+    created = len(fake.responses)
+    code, output = await run_script("deep_research_mcp.py", tmp_path, env, *args)
+    assert code == 1 and len(fake.responses) == created, output
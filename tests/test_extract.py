@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.extract import FETCH_LOCAL_MIN_CHARS, ExtractPool, extract_markdown, render_page
+
+FIXTURES = Path(__file__).resolve().parent.parent / "bench" / "fixtures" / "html"
+EXPECTED = json.loads((FIXTURES / "expected.json").read_text())
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_fixture_page(name):
+    spec = EXPECTED[name]
+    page = extract_markdown((FIXTURES / name).read_text(encoding="utf-8"), spec["url"])
+    markdown = page["markdown"]
+    if spec.get("fallback"):
+        # JavaScript shells and consent walls go to r.jina.ai instead
+        assert page["text_chars"] < FETCH_LOCAL_MIN_CHARS
+        return
+    assert page["text_chars"] >= FETCH_LOCAL_MIN_CHARS
+    assert [s for s in spec["must_contain"] if s not in markdown] == []
+    assert [s for s in spec["must_not_contain"] if s in markdown] == []
+
+
+def test_relative_links_become_absolute_and_scripts_are_dropped():
+    html = """<html><head><title> Relais  RL-1 </title><script>var dataLayer = [];</script></head>
+    <body><article><h1>Relais RL-1</h1><p>Zie de <a href="/docs/rl-1.pdf">datasheet</a> voor details
+    over spoelspanning en schakelvermogen.</p></article></body></html>"""
+    page = extract_markdown(html, "https://shop.example/p/rl-1")
+    assert page["title"] == "Relais RL-1"
+    assert "[datasheet](https://shop.example/docs/rl-1.pdf)" in page["markdown"]
+    assert "dataLayer" not in page["markdown"]
+
+
+def test_render_page_uses_the_reader_layout():
+    rendered = render_page({"title": "Relais", "markdown": "# Relais"}, "https://shop.example/p")
+    assert rendered == "Title: Relais\n\nURL Source: https://shop.example/p\n\nMarkdown Content:\n# Relais"
+
+
+async def test_thread_pool_extracts_off_the_event_loop():
+    pool = ExtractPool(kind="thread", workers=1)
+    try:
+        page = await pool.extract("<h1>Relais</h1><p>Spoelspanning 24 V DC</p>", "")
+    finally:
+        pool.shutdown()
+    assert "Spoelspanning 24 V DC" in page["markdown"] and pool.jobs == 1
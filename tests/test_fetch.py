@@ -0,0 +1,40 @@
+"""fetch routes: a direct hedge that beats r.jina.ai is extracted like FETCH_ENGINE=local."""
+import asyncio
+from pathlib import Path
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+from src import resilience, upstream
+from src.extract import ExtractPool
+
+DATASHEET = (Path(__file__).resolve().parent.parent / "bench" / "fixtures" / "html" / "datasheet_manufacturer.html").read_text(
+    encoding="utf-8"
+)
+
+
+class SlowJinaStub(StubUpstream):
+    """r.jina.ai paths take a second; the site itself answers right away with HTML."""
+
+    async def respond(self, method, path, headers, body):
+        if path.startswith("/http"):
+            await asyncio.sleep(1.0)
+            return await super().respond(method, path, headers, body)
+        return 200, {"content-type": "text/html; charset=utf-8"}, DATASHEET.encode()
+
+
+async def test_winning_direct_hedge_is_extracted_and_stored_as_direct(server, point_at, monkeypatch):
+    monkeypatch.setattr(upstream, "FETCH_ALLOW_PRIVATE", True)
+    monkeypatch.setattr(server, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(server, "HEDGE_ROUTE", "direct")
+    monkeypatch.setattr(server, "extract_pool", ExtractPool(kind="inline"))
+    monkeypatch.setattr(resilience, "HEDGE_DEFAULT_DELAY", 0.05)
+    async with SlowJinaStub() as stub:
+        point_at(stub)
+        url = f"{stub.base_url}/nl-nl/producten/3208126"
+        async with in_process_client(server.create_app()) as client:
+            text = await call_tool(client, "fetch", {"id": url})
+        stored = await server.page_store.get(url)
+
+    assert text.startswith("Title: ") and f"URL Source: {url}" in text
+    assert "| GTIN | 4046356329781 |" in text and "<html" not in text
+    assert stored is not None and stored.source == "direct"
@@ -0,0 +1,49 @@
+"""The adaptive limiter queues and backs off against a throttling upstream.
+
+The stub serves at most CAPACITY concurrent requests and answers the rest with
+429 + Retry-After. Every `search` call must still succeed (queued and retried
+instead of failed), and the limit must settle near the upstream's capacity.
+"""
+import asyncio
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+from src.resilience import limiters
+
+CALLS = 40
+CAPACITY = 4
+
+
+class ThrottlingStub(StubUpstream):
+    def __init__(self, capacity, retry_after, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+
+    async def respond(self, method, path, headers, body):
+        if self.active >= self.capacity:
+            self.rejected += 1
+            return 429, {"retry-after": str(self.retry_after), "content-type": "text/plain"}, b"Too Many Requests"
+        self.active += 1
+        try:
+            await asyncio.sleep(0.05)
+            return await super().respond(method, path, headers, body)
+        finally:
+            self.active -= 1
+
+
+async def test_throttled_calls_are_queued_and_retried(server, point_at):
+    async with ThrottlingStub(CAPACITY, retry_after=0.5) as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            results = await asyncio.gather(*(
+                call_tool(client, "search", {"query": f"artikel {i}", "mode": "organic_only"}) for i in range(CALLS)
+            ))
+            stats = (await client.get("/stats")).json()["limiters"]
+
+    assert [r for r in results if r.startswith("Error")] == []
+    limiter = next(iter(limiters._limiters.values()))
+    assert stub.rejected > 0 and stats["retries"] >= stub.rejected
+    assert limiter.limit <= CAPACITY * 2
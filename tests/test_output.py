@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from bench.stub_upstream import serper_payload
+from src.output import COMPACT_ORGANIC_FIELDS, render, resolve_mode, shape
+
+
+def test_full_keeps_the_payload():
+    data = serper_payload("relais", num=3)
+    assert shape(data, "full") == data
+    assert json.loads(render(data, "full")) == data
+    assert "\n  " in render(data, "full")
+
+
+def test_compact_drops_unused_blocks():
+    data = serper_payload("relais", num=3)
+    shaped = shape(data, "compact")
+    assert set(shaped) == {"organic"}
+    assert all(set(item) <= set(COMPACT_ORGANIC_FIELDS) for item in shaped["organic"])
+    assert "\n" not in render(data, "compact")
+
+
+def test_organic_only_and_fields():
+    data = serper_payload("relais", num=3)
+    assert shape(data, "organic_only") == data["organic"]
+    assert shape(data, "organic_only", ["link"]) == [{"link": item["link"]} for item in data["organic"]]
+    projected = shape(data, "full", ["title", "missing"])
+    assert projected["knowledgeGraph"] == data["knowledgeGraph"]
+    assert projected["organic"] == [{"title": item["title"]} for item in data["organic"]]
+
+
+def test_non_dict_payload_is_left_alone():
+    assert shape(["raw"], "compact") == ["raw"]
+
+
+def test_resolve_mode():
+    assert resolve_mode(" Compact ") == "compact"
+    assert resolve_mode("") == "full"
+    with pytest.raises(ValueError):
+        resolve_mode("tiny")
@@ -0,0 +1,137 @@
+"""The fetch page store reuses, revalidates, refreshes and evicts pages.
+
+The stub serves datasheets straight from "the origin", as HTML with an ETag,
+and answers `If-None-Match` with 304. fetch runs with FETCH_ENGINE=local.
+"""
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+from src import upstream
+from src.extract import ExtractPool
+from src.page_store import PageStore
+from src.pages import PageBody, PageBuffer
+
+DATASHEET = (Path(__file__).resolve().parent.parent / "bench" / "fixtures" / "html" / "datasheet_manufacturer.html").read_text(
+    encoding="utf-8"
+)
+PAGES = 10
+ROUNDS = 3
+REVALIDATE_AFTER = 0.5
+
+
+class OriginStub(StubUpstream):
+    """Direct GETs get HTML with an ETag (304 on a match); r.jina.ai paths get markdown."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.versions = {}
+        self.full = 0
+        self.not_modified = 0
+        self.conditional = 0
+        self.jina = 0
+
+    async def respond(self, method, path, headers, body):
+        if path.startswith("/http"):
+            self.jina += 1
+            return await super().respond(method, path, headers, body)
+        if path.endswith(".pdf"):
+            return 200, {"content-type": "application/pdf"}, b"%PDF-1.7 ..."
+        page = path.split("?")[0]
+        etag = f'"{page.strip("/").replace("/", "-")}-v{self.versions.get(page, 1)}"'
+        if "if-none-match" in headers:
+            self.conditional += 1
+            if headers["if-none-match"] == etag:
+                self.not_modified += 1
+                return 304, {"etag": etag}, b""
+        self.full += 1
+        html = DATASHEET.replace("<h1>", f"<h1>{page} versie {self.versions.get(page, 1)}: ", 1)
+        return 200, {"content-type": "text/html; charset=utf-8", "etag": etag}, html.encode()
+
+
+@pytest.fixture
+def local_fetch(server, monkeypatch, tmp_path):
+    store = PageStore(path=str(tmp_path / "store"), ttl=REVALIDATE_AFTER * 2, revalidate_after=REVALIDATE_AFTER)
+    # The stub origin listens on 127.0.0.1
+    monkeypatch.setattr(upstream, "FETCH_ALLOW_PRIVATE", True)
+    monkeypatch.setattr(server, "FETCH_ENGINE", "local")
+    monkeypatch.setattr(server, "extract_pool", ExtractPool(kind="inline"))
+    monkeypatch.setattr(server, "page_store", store)
+    monkeypatch.setattr(server, "page_buffer", PageBuffer(ttl=0))
+    return store
+
+
+async def test_store_reuses_revalidates_and_refreshes(server, point_at, local_fetch):
+    store = local_fetch
+    async with OriginStub() as stub:
+        point_at(stub)
+        urls = [f"{stub.base_url}/ds/{i}" for i in range(PAGES)]
+        async with in_process_client(server.create_app()) as client:
+            # Tracking parameters and fragments that differ per round are the same page
+            first = {}
+            for round in range(ROUNDS):
+                texts = await asyncio.gather(*(
+                    call_tool(client, "fetch", {"id": f"{url}?utm_source=r{round}#sectie-{round}"}) for url in urls
+                ))
+                if round == 0:
+                    first = dict(zip(urls, texts))
+            assert stub.full == PAGES
+            assert store.stats()["hits"] == PAGES * (ROUNDS - 1)
+
+            # Past the revalidation age: conditional GETs, 304s served from the store
+            await asyncio.sleep(REVALIDATE_AFTER * 1.2)
+            changed = urls[0].removeprefix(stub.base_url)
+            stub.versions[changed] = 2
+            before = stub.full
+            texts = await asyncio.gather(*(call_tool(client, "fetch", {"id": url}) for url in urls))
+            assert stub.not_modified == PAGES - 1 and store.stats()["revalidated"] == PAGES - 1
+            assert all(text == first[url] for url, text in zip(urls[1:], texts[1:]))
+            # A changed ETag downloads the new version
+            assert stub.full == before + 1
+            assert "versie 2" in texts[0] and "versie 2" not in first[urls[0]]
+
+            # r.jina.ai pages have no validators: reused within the TTL, refetched after it
+            pdf = f"{stub.base_url}/docs/handleiding.pdf"
+            await call_tool(client, "fetch", {"id": pdf})
+            await call_tool(client, "fetch", {"id": pdf})
+            assert stub.jina == 1
+            await asyncio.sleep(REVALIDATE_AFTER * 2.2)
+            conditional_before = stub.conditional
+            await call_tool(client, "fetch", {"id": pdf})
+            assert stub.jina == 2 and stub.conditional == conditional_before
+
+            before = stub.full
+            await call_tool(client, "fetch", {"id": urls[1]})
+            await call_tool(client, "fetch", {"id": urls[1], "bypass_cache": True})
+            assert stub.full == before + 1
+
+    # A restart finds the pages on disk
+    restarted = PageStore(path=store.path)
+    found = await restarted.get(urls[3] + "#andere-sectie")
+    assert found is not None and found.body.text == first[urls[3]]
+    assert len(restarted) >= PAGES
+
+
+async def test_byte_budget_evicts_files(tmp_path):
+    evict_dir = str(tmp_path / "evict")
+    small = PageStore(path=evict_dir, max_bytes=100_000, max_entries=1000, ttl=60, revalidate_after=60)
+    for i in range(60):
+        text = f"pagina {i} " + os.urandom(3000).hex()  # slecht comprimeerbaar
+        await small.put(f"https://example.com/evict/{i}", PageBody(text, len(text), False, 200), "jina")
+    files = sum(len(names) for _, _, names in os.walk(evict_dir))
+    assert small.size <= small.max_bytes and small.evictions > 0
+    assert files == len(small)
+
+
+async def test_memory_store_serves_what_it_stored():
+    store = PageStore(path="memory", ttl=60, revalidate_after=60)
+    url = "https://example.com/datasheet"
+    await store.put(url, PageBody("versie 1", 8, False, 200), "jina")
+    await store.put(url, PageBody("versie 2", 8, False, 200), "jina")
+    found = await store.get(url + "?utm_source=x")
+    assert found is not None and found.body.text == "versie 2"
+    assert len(store) == 1 and store.errors == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from src import resilience
+from src.resilience import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker, parse_retry_after
+
+
+@pytest.fixture
+def small_breaker(monkeypatch):
+    monkeypatch.setattr(resilience, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(resilience, "BREAKER_FAILURE_RATIO", 0.5)
+    monkeypatch.setattr(resilience, "BREAKER_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(resilience, "BREAKER_HALF_OPEN_PROBES", 2)
+    return CircuitBreaker()
+
+
+def expire(breaker):
+    breaker.opened_at -= resilience.BREAKER_OPEN_SECONDS + 1
+
+
+def test_opens_on_failure_ratio_only_after_min_calls(small_breaker):
+    breaker = small_breaker
+    for ok in (False, False, True):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.trips == 1
+    assert not breaker.allow() and breaker.rejected == 1
+    assert breaker.retry_in() > 0
+
+
+def test_neutral_outcomes_do_not_count(small_breaker):
+    for _ in range(10):
+        small_breaker.record(None)
+    assert small_breaker.state == CLOSED
+    assert small_breaker.stats()["window_calls"] == 0
+
+
+def test_half_open_closes_after_successful_probes(small_breaker):
+    breaker = small_breaker
+    for _ in range(4):
+        breaker.record(False)
+    expire(breaker)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only BREAKER_HALF_OPEN_PROBES at a time
+    breaker.record(True)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens(small_breaker):
+    breaker = small_breaker
+    for _ in range(4):
+        breaker.record(False)
+    expire(breaker)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.trips == 2
+
+
+def test_registry_keeps_one_breaker_per_host_bounded():
+    registry = BreakerRegistry(max_hosts=2)
+    a = registry.get("direct", "a.example")
+    assert registry.get("direct", "a.example") is a
+    registry.get("direct", "b.example")
+    registry.get("direct", "c.example")
+    assert set(registry.hosts("direct")) == {"b.example", "c.example"}
+    # Fixed upstreams are never evicted for a host
+    serper = registry.get("serper")
+    registry.get("direct", "d.example")
+    assert registry.get("serper") is serper and "a.example" not in registry.hosts("direct")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+async def test_limiter_queues_beyond_its_limit():
+    limiter = resilience.AdaptiveLimiter(initial=2, minimum=1, maximum=4)
+    await limiter.acquire()
+    await limiter.acquire()
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0.01)
+    assert not waiting.done() and limiter.queued == 1
+    limiter.release(latency=0.01)
+    await asyncio.wait_for(waiting, 1)
+    assert limiter.in_flight == 2
@@ -0,0 +1,46 @@
+"""search_and_fetch keeps pages that finished by the time its budget runs out."""
+import asyncio
+import json
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+from src.pages import PageBody
+
+BUDGET = 0.3
+PAGE_SECONDS = [0.0, 0.1, 10.0]
+
+
+async def test_pages_done_at_the_budget_are_kept(server, point_at, monkeypatch):
+    monkeypatch.setattr(server, "SEARCH_FETCH_BUDGET", BUDGET)
+    monkeypatch.setattr(server, "SEARCH_FETCH_TOP_K", len(PAGE_SECONDS))
+    order = []
+
+    async def fetch_page(url, bypass_cache=False):
+        order.append(url)
+        await asyncio.sleep(PAGE_SECONDS[len(order) - 1])
+        return PageBody(f"inhoud van {url}", 100, False, 200)
+
+    real_context = server.get_context
+
+    def slow_context():
+        # The first progress notification outlasts the budget, while the second page finishes
+        ctx = real_context()
+
+        class Slow:
+            async def report_progress(self, progress, total, message):
+                await asyncio.sleep(BUDGET * 1.5 if progress == 1 else 0)
+                await ctx.report_progress(progress, total, message)
+
+        return Slow()
+
+    monkeypatch.setattr(server, "fetch_page", fetch_page)
+    monkeypatch.setattr(server, "get_context", slow_context)
+    async with StubUpstream() as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            reply = json.loads(await call_tool(client, "search_and_fetch", {"query": "relais"}))
+
+    pages = reply["pages"]
+    assert [page["url"] for page in pages] == order
+    assert "inhoud" in pages[0]["content"] and "inhoud" in pages[1]["content"]
+    assert "content" not in pages[2] and "exhausted" in pages[2]["error"]
@@ -0,0 +1,43 @@
+"""search_many falls back to one request per query only when Serper.dev rejects the array form."""
+import json
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+
+QUERIES = [f"relais RL-{i:03d}" for i in range(6)]
+
+
+class ArrayStub(StubUpstream):
+    """Answers every array POST with `status`; single queries go through."""
+
+    def __init__(self, status, **kwargs):
+        super().__init__(**kwargs)
+        self.status = status
+        self.arrays = 0
+        self.singles = 0
+
+    async def respond(self, method, path, headers, body):
+        if isinstance(json.loads(body or b"{}"), list):
+            self.arrays += 1
+            return self.status, {"content-type": "application/json"}, b'{"message": "nee"}'
+        self.singles += 1
+        return await super().respond(method, path, headers, body)
+
+
+async def test_rejected_array_form_falls_back_per_query(server, point_at):
+    async with ArrayStub(400) as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            entries = json.loads(await call_tool(client, "search_many", {"queries": QUERIES}))
+    assert stub.arrays == 1 and stub.singles == len(QUERIES)
+    assert all("results" in entry for entry in entries)
+
+
+async def test_other_batch_errors_reach_every_query_without_fallback(server, point_at):
+    async with ArrayStub(403) as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            entries = json.loads(await call_tool(client, "search_many", {"queries": QUERIES}))
+    assert stub.arrays == 1 and stub.singles == 0
+    assert [entry["query"] for entry in entries] == QUERIES
+    assert all(entry["error"].startswith("Error connecting to Serper.dev") and "403" in entry["error"] for entry in entries)
@@ -0,0 +1,74 @@
+"""N concurrent identical tool calls produce exactly one upstream request."""
+import asyncio
+
+import pytest
+
+from bench.harness import call_tool, in_process_client
+from bench.stub_upstream import StubUpstream
+from src.resilience import RETRY_ATTEMPTS
+from src.upstream import SingleFlight
+
+CONCURRENCY = 20
+
+
+class FailingStub(StubUpstream):
+    async def respond(self, method, path, headers, body):
+        return 500, {"content-type": "text/plain"}, b"upstream stuk"
+
+
+async def test_identical_tool_calls_share_one_upstream_request(server, point_at):
+    async with StubUpstream(latency=0.3) as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            results = await asyncio.gather(*(
+                call_tool(client, "search", {"query": "6ES7214-1AG40-0XB0", "bypass_cache": True})
+                for _ in range(CONCURRENCY)
+            ))
+            search_requests = stub.requests
+            pages = await asyncio.gather(*(
+                call_tool(client, "fetch", {"id": "https://example.com/datasheet"}) for _ in range(CONCURRENCY)
+            ))
+    assert search_requests == 1 and len(set(results)) == 1
+    assert stub.requests - search_requests == 1 and len(set(pages)) == 1
+
+
+async def test_upstream_error_reaches_every_caller_of_one_flight(server, point_at):
+    async with FailingStub(latency=0.2) as stub:
+        point_at(stub)
+        async with in_process_client(server.create_app()) as client:
+            results = await asyncio.gather(*(
+                call_tool(client, "search", {"query": "kapot", "bypass_cache": True}) for _ in range(CONCURRENCY)
+            ))
+    # One shared flight; its retries are the only extra upstream requests
+    assert stub.requests == RETRY_ATTEMPTS
+    assert all(r.startswith("Error connecting to Serper.dev") for r in results)
+
+
+async def test_error_fans_out_to_all_waiters():
+    flight = SingleFlight()
+    calls = 0
+
+    async def boom():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        raise RuntimeError("upstream stuk")
+
+    outcomes = await asyncio.gather(*(flight.do("k", boom) for _ in range(10)), return_exceptions=True)
+    assert calls == 1 and all(isinstance(o, RuntimeError) for o in outcomes)
+    assert len(flight) == 0
+
+
+async def test_cancelling_one_waiter_keeps_the_shared_call():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.2)
+        return "resultaat"
+
+    waiters = [asyncio.create_task(flight.do("c", slow)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    waiters[0].cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiters[0]
+    assert await asyncio.gather(*waiters[1:]) == ["resultaat"] * 4
@@ -0,0 +1,57 @@
+import asyncio
+
+from bench.harness import asgi_request, asgi_scope
+from src.timing import TimingMiddleware
+
+
+def event_stream_app(release):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        await release.wait()
+        await send({"type": "http.response.body", "body": b"event: message\ndata: {}\n\n", "more_body": False})
+
+    return app
+
+
+async def run_until_idle(method, release):
+    """Messages the middleware sent before the app's first event."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    task = asyncio.create_task(TimingMiddleware(event_stream_app(release))(asgi_scope(method, "/mcp"), receive, send))
+    await asyncio.sleep(0.05)
+    before = list(sent)
+    release.set()
+    await task
+    return before, sent
+
+
+async def test_tool_call_over_sse_gets_server_timing():
+    before, sent = await run_until_idle("POST", asyncio.Event())
+    assert before == []
+    headers = dict(sent[0]["headers"])
+    assert b"server-timing" in headers and b"total;dur=" in headers[b"server-timing"]
+    assert b"x-request-id" in headers
+
+
+async def test_session_stream_sends_headers_right_away():
+    before, sent = await run_until_idle("GET", asyncio.Event())
+    assert [m["type"] for m in before] == ["http.response.start"]
+    assert b"server-timing" not in dict(before[0]["headers"])
+
+
+async def test_json_response_carries_the_whole_request():
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.02)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await asyncio.sleep(0.02)
+        await send({"type": "http.response.body", "body": b"{}", "more_body": False})
+
+    status, headers, _, _, _ = await asgi_request(TimingMiddleware(app), asgi_scope("POST", "/mcp"))
+    total = float(headers["server-timing"].split("total;dur=")[1])
+    assert status == 200 and total >= 40
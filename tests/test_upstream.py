@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+from bench.stub_upstream import StubUpstream
+from src import upstream
+from src.upstream import BlockedDestination, build_client, is_public_address
+
+
+class RedirectStub(StubUpstream):
+    """Stands in for a public site that redirects to the cloud metadata service."""
+
+    async def respond(self, method, path, headers, body):
+        return 302, {"location": "http://169.254.169.254/latest/meta-data/"}, b""
+
+
+def test_is_public_address():
+    assert is_public_address("93.184.216.34")
+    assert is_public_address("2606:2800:220:1:248:1893:25c8:1946")
+    for address in ("127.0.0.1", "10.1.2.3", "172.16.0.1", "192.168.1.1", "169.254.169.254", "100.64.0.1",
+                    "0.0.0.0", "224.0.0.1", "::1", "fe80::1%eth0", "fd00::1", "::ffff:169.254.169.254"):
+        assert not is_public_address(address), address
+
+
+async def test_direct_client_refuses_metadata_address():
+    client = build_client("direct")
+    async with client:
+        with pytest.raises(BlockedDestination):
+            await client.get("http://169.254.169.254/latest/meta-data/")
+        with pytest.raises(BlockedDestination):
+            await client.get("http://localhost:1/")
+
+
+async def test_direct_client_checks_every_redirect_hop(monkeypatch):
+    # Let the stub on 127.0.0.1 pass as a public site; the redirect target must still be refused
+    monkeypatch.setattr(upstream, "is_public_address", lambda address: address == "127.0.0.1")
+    async with RedirectStub() as stub:
+        client = build_client("direct")
+        async with client:
+            with pytest.raises(BlockedDestination, match="169.254.169.254"):
+                await client.get(f"{stub.base_url}/product")
+    assert stub.requests == 1
+
+
+async def test_other_upstreams_and_opt_out_are_unguarded(monkeypatch):
+    async with StubUpstream() as stub:
+        async with build_client("jina") as client:
+            assert (await client.get(f"{stub.base_url}/page")).status_code == 200
+        monkeypatch.setattr(upstream, "FETCH_ALLOW_PRIVATE", True)
+        async with build_client("direct") as client:
+            assert (await client.get(f"{stub.base_url}/page")).status_code == 200
+
+
+async def test_fetch_does_not_download_private_urls_itself(server, point_at, monkeypatch):
+    from bench.harness import call_tool, in_process_client
+    from src.extract import ExtractPool
+
+    monkeypatch.setattr(server, "FETCH_ENGINE", "local")
+    monkeypatch.setattr(server, "extract_pool", ExtractPool(kind="inline"))
+    async with StubUpstream() as stub:
+        point_at(stub)
+        admin = f"{stub.base_url}/admin"
+        async with in_process_client(server.create_app()) as client:
+            text = await call_tool(client, "fetch", {"id": admin})
+    # Only the r.jina.ai fallback went out; the server never requested /admin itself
+    assert stub.paths == [f"/{admin}"]
+    assert text.startswith("Title:")